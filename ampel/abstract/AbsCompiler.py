@@ -79,6 +79,9 @@ class AbsCompiler(AmpelUnit, AmpelABC, abstract=True):
 
 			for el in [activity] if isinstance(activity, dict) else activity:
 
+				if 'tag' in el and isinstance(el['tag'], list):
+					el['tag'] = frozenset(el['tag']) # type: ignore[typeddict-item]
+
 				# Channel-bound activity
 				if 'channel' in el:
 
@@ -87,7 +90,7 @@ class AbsCompiler(AmpelUnit, AmpelABC, abstract=True):
 
 					# Strip out 'channel' from activity
 					# (to be able to merge similar activities accross channels)
-					x = frozenset([y for y in el.items() if y[0] != 'channel'])
+					x = self._metactivity_key(el, {'channel'})
 
 					# activity is already associated with another channel
 					if x in ar:
@@ -109,7 +112,7 @@ class AbsCompiler(AmpelUnit, AmpelABC, abstract=True):
 				else:
 
 					# Build register key
-					x = frozenset(el.items())
+					x = self._metactivity_key(el)
 
 					# activity was already registered
 					if x in ar:
@@ -18,6 +18,7 @@ from ampel.model.operator.AllOf import AllOf
 from ampel.model.operator.AnyOf import AnyOf
 from ampel.model.operator.OneOf import OneOf
 from ampel.model.t3.LoaderDirective import LoaderDirective
+from ampel.model.t3.T3QueryPlan import T3QueryPlan
 from ampel.struct.AmpelBuffer import AmpelBuffer
 from ampel.types import ChannelId, StockId, StrictIterable, Traceless
 
@@ -70,3 +71,13 @@ class AbsT3Loader(AmpelABC, ContextUnit, abstract=True):
 	) -> Iterable[AmpelBuffer]:
 		""" Load documents (collection Ampel_data) for the selected stocks """
 		raise NotImplementedError
+
+
+	def accepts_query_plan(self) -> bool:
+		""" Whether :meth:`apply_query_plan` is supported """
+		return False
+
+
+	def apply_query_plan(self, plan: T3QueryPlan) -> None:
+		""" Restrict subsequent loads according to the provided plan (see :class:`T3QueryPlan`) """
+		raise NotImplementedError
@@ -13,6 +13,7 @@ from ampel.base.AmpelABC import AmpelABC
 from ampel.base.decorator import abstractmethod
 from ampel.content.T3Document import T3Document
 from ampel.core.ContextUnit import ContextUnit
+from ampel.model.t3.T3QueryPlan import T3QueryPlan
 from ampel.struct.AmpelBuffer import AmpelBuffer
 from ampel.struct.T3Store import T3Store
 
@@ -34,3 +35,19 @@ class AbsT3Stager(ContextUnit, AmpelABC, abstract=True):
 		t3s: T3Store
 	) -> None | Generator[T3Document, None, None]:
 		""" Process a chunk of AmpelBuffer instances """
+
+
+	def get_query_plan(self) -> None | T3QueryPlan:
+		"""
+		:returns: selection criteria applied by this stager which the loader could apply instead
+		(only called if the supplier is able to apply query plans).
+		"""
+		return None
+
+
+	def set_query_plan(self, plan: T3QueryPlan) -> None:
+		"""
+		Notifies the stager that the loader applies the provided plan (returned by :meth:`get_query_plan`),
+		the stager may thus skip the evaluation of the corresponding criteria.
+		"""
+		return
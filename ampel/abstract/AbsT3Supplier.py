@@ -14,6 +14,7 @@ from ampel.base.decorator import abstractmethod
 from ampel.core.ContextUnit import ContextUnit
 from ampel.core.EventHandler import EventHandler
 from ampel.log.AmpelLogger import AmpelLogger
+from ampel.model.t3.T3QueryPlan import T3QueryPlan
 from ampel.struct.T3Store import T3Store
 from ampel.types import T, Traceless
 
@@ -29,3 +30,11 @@ class AbsT3Supplier(Generic[T], AmpelABC, ContextUnit, abstract=True):
 	@abstractmethod
 	def supply(self, t3s: T3Store) -> T:
 		raise NotImplementedError
+
+	def accepts_query_plan(self) -> bool:
+		""" Whether :meth:`apply_query_plan` is supported """
+		return False
+
+	def apply_query_plan(self, plan: T3QueryPlan) -> None:
+		""" Restrict the data supplied according to the provided plan (see :class:`T3QueryPlan`) """
+		raise NotImplementedError
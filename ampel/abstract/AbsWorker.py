@@ -10,13 +10,16 @@
 import gc
 import random
 import signal
-from collections.abc import Generator, Sequence
+from collections import defaultdict, deque
+from collections.abc import Callable, Generator, Iterable, Sequence
 from contextlib import contextmanager
 from math import ceil
 from threading import Event
 from time import time
 from typing import Any, ClassVar, Generic, Literal, TypeVar
 
+from bson import ObjectId
+from pymongo import UpdateOne
 from pymongo.read_concern import ReadConcern
 from pymongo.write_concern import WriteConcern
 
@@ -41,6 +44,7 @@ from ampel.metrics.AmpelMetricsRegistry import (
 	TimingCounter,
 )
 from ampel.model.UnitModel import UnitModel
+from ampel.mongo.update.DBUpdatesBuffer import DBUpdatesBuffer
 from ampel.mongo.update.MongoIngester import MongoIngester
 from ampel.mongo.utils import maybe_match_array, maybe_use_each
 from ampel.types import JDict, OneOrMany, Tag, UBson
@@ -48,6 +52,7 @@ from ampel.util.hash import build_unsafe_dict_id
 from ampel.util.tag import merge_tags
 
 T = TypeVar("T", T1Document, T2Document)
+R = TypeVar("R")
 
 class BackoffConfig(AmpelBaseModel):
 	base: float = 2
@@ -57,6 +62,12 @@ class BackoffConfig(AmpelBaseModel):
 	max_tries: None | int = None
 	max_time: None | float = 60.
 
+class CommitBufferConfig(AmpelBaseModel):
+	#: Updates are pushed as soon as the number of buffered updates exceeds this value
+	max_size: int = 500
+	#: Updates are pushed every x seconds
+	push_interval: float = 3
+
 stat_time = AmpelMetricsRegistry.summary(
     "time",
     "Processing time",
@@ -138,6 +149,23 @@ class AbsWorker(Generic[T], AbsEventUnit, abstract=True):
 	#: minimum number of stock document updates to commit at once
 	updates_buffer_size: int = 500
 
+	#: Number of documents to claim (i.e. mark as RUNNING) per database round-trip.
+	#: With the default value (1), documents are claimed one by one using find_one_and_update.
+	#: Larger values reduce the number of round-trips for cheap units. Documents claimed
+	#: but not yet processed when the worker stops are reset to their original code.
+	#: Note that dependencies claimed within the same batch as a tied document are seen
+	#: as RUNNING by the latter, which will then be retried later (T2_PENDING_DEPENDENCY).
+	claim_batch_size: int = 1
+
+	#: Buffer the updates of processed documents and write them using bulk_write
+	#: rather than committing each document with a separate update_one.
+	#: Buffered updates are pushed when the buffer exceeds max_size, every push_interval
+	#: seconds and when processing stops. Documents whose update was not yet written
+	#: when the worker crashes remain RUNNING, just like with unbuffered commits.
+	#: Note that dependencies processed in a previous iteration are seen as RUNNING
+	#: by tied documents until the buffer is pushed (the latter are then retried later).
+	commit_buffer: None | CommitBufferConfig = None
+
 	def __init__(self, **kwargs) -> None:
 
 		super().__init__(**kwargs)
@@ -182,6 +210,7 @@ class AbsWorker(Generic[T], AbsEventUnit, abstract=True):
 		self._instances: JDict = {}
 
 		self._current_run_id: None | int = None
+		self._commit_buffer: None | DBUpdatesBuffer = None
 
 
 	@abstractmethod
@@ -191,6 +220,25 @@ class AbsWorker(Generic[T], AbsEventUnit, abstract=True):
 		...
 
 
+	def dispatch_doc(self,
+		doc: T, ingester: AbsIngester, logger: AmpelLogger
+	) -> None:
+		"""
+		Called by :func:`proceed` for each document to process.
+		Subclasses supporting concurrent execution can override this method to complete
+		the processing of documents at a later time (see :func:`join_dispatched`).
+		"""
+		self.process_doc(doc, ingester, logger)
+
+
+	def join_dispatched(self) -> None:
+		"""
+		Called by :func:`proceed` once no more documents are to be processed.
+		Must complete the processing of the documents dispatched but not yet committed.
+		"""
+		return
+
+
 	def prepare(self, event_hdlr: EventHandler) -> None | EventCode:
 		""" :returns: number of t2 docs processed """
 		event_hdlr.set_tier(2)
@@ -203,15 +251,91 @@ class AbsWorker(Generic[T], AbsEventUnit, abstract=True):
 		"""
 		Get next eligible document, with timeout
 		"""
+		return self._poll(
+			lambda: self.col.find_one_and_update(query | self._retry_after_match(), update),
+			stop_token
+		)
+
+
+	def claim_docs(self, query: dict, limit: int, stop_token: Event) -> list[T]:
+		"""
+		Get up to `limit` eligible documents, with timeout.
+		Matching documents are marked as RUNNING using a single update_many.
+		A claim token is saved alongside the code so that documents concurrently
+		claimed by other workers can be told apart from ours.
+		Returned documents reflect their state before the update (like find_one_and_update).
+		"""
+		return self._poll(lambda: self._claim(query, limit), stop_token) or []
+
+
+	def _claim(self, query: dict, limit: int) -> None | list[T]:
+
+		match = query | self._retry_after_match()
+		docs = {doc['_id']: doc for doc in self.col.find(match, limit=limit)}
+		if not docs:
+			return None
+
+		token = ObjectId()
+		self.col.update_many(
+			match | {'_id': {'$in': list(docs)}},
+			{'$set': {'code': DocumentCode.RUNNING, 'claim': token}}
+		)
+
+		ret = []
+		for el in self.col.find({'_id': {'$in': list(docs)}, 'claim': token}, {'_id': 1}):
+			# code is left unchanged as it is restored by release_docs
+			(doc := docs[el['_id']])['claim'] = token
+			ret.append(doc)
+
+		return ret or None
+
+
+	def release_docs(self, docs: Iterable[T], logger: AmpelLogger) -> None:
+		"""
+		Reset claimed but unprocessed documents to the code they had before being claimed.
+		Documents claimed in the meantime by other workers (stale claims) are left untouched.
+		"""
+		ids_by_code: dict[tuple[int, Any], list[Any]] = defaultdict(list)
+		for doc in docs:
+			ids_by_code[(doc['code'], doc.get('claim'))].append(doc['_id']) # type: ignore[typeddict-item]
+
+		for (code, token), ids in ids_by_code.items():
+			self.col.update_many(
+				{'_id': {'$in': ids}, 'code': DocumentCode.RUNNING, 'claim': token},
+				{'$set': {'code': code}, '$unset': {'claim': 1}}
+			)
+
+		if ids_by_code:
+			logger.info(f"Released {sum(len(v) for v in ids_by_code.values())} claimed documents")
+
+
+	def prefetch(self, docs: Sequence[T]) -> None:
+		"""
+		Called with every batch of claimed documents (see claim_batch_size) before these are processed.
+		Subclasses can override this method to load the inputs of the whole batch at once.
+		"""
+		return
+
+
+	def _retry_after_match(self) -> dict:
+		"""
+		Excludes documents with retry times in the future.
+		Note: 'retry_after' is a root-level copy of the last retry time set in 'meta',
+		so that the query can make use of the compound index (code, unit, retry_after)
+		"""
+		return {'retry_after': {'$not': {'$gte': ceil(time())}}}
+
+
+	def _poll(self, get: Callable[[], None | R], stop_token: Event) -> None | R:
+		"""
+		Call `get` until it returns a result, using backoff_on_query (if set) between attempts
+		"""
 		t0 = time()
 		attempts = 0
 		while not stop_token.is_set():
-			doc = self.col.find_one_and_update(
-				query | {'$expr': {'$not': {'$lte': [ceil(time()), {'$last': '$meta.retry_after'}]}}},
-				update
-			)
-			if doc is not None or self.backoff_on_query is None:
-				return doc
+			ret = get()
+			if ret is not None or self.backoff_on_query is None:
+				return ret
 			backoff = self.backoff_on_query
 			if backoff.max_time is not None and time()-t0 > backoff.max_time:
 				break
@@ -222,7 +346,7 @@ class AbsWorker(Generic[T], AbsEventUnit, abstract=True):
 				delay = random.uniform(0, delay)
 			stop_token.wait(delay)
 			attempts += 1
-		
+
 		return None
 
 
@@ -243,6 +367,8 @@ class AbsWorker(Generic[T], AbsEventUnit, abstract=True):
 		update = {'$set': {'code': DocumentCode.RUNNING}}
 		garbage_collect = self.garbage_collect
 		doc_limit = self.doc_limit
+		claim_batch_size = self.claim_batch_size
+		claimed: deque[T] = deque()
 
 		with (
 			AmpelLogger.from_profile(
@@ -255,37 +381,63 @@ class AbsWorker(Generic[T], AbsEventUnit, abstract=True):
 				process_name = self.process_name, logger = logger,
 				raise_exc = self.raise_exc, jtag = self.jtag
 			) as ingester,
+			self._buffer_commits(run_id, logger, stop_token)
 		):
-			# Process docs until next() returns None (breaks condition below)
-			while not stop_token.is_set():
-
-				# get t1/t2 document (code is usually NEW or NEW_PRIO), excluding
-				# docs with retry times in the future
-				with stat_time.time() as timer:
-					doc = self.find_one_and_update(self.query, update, stop_token)
-					timer.labels(self.tier, "find_one_and_update", doc["unit"] if doc else None)
-
-				# No match
-				if doc is None:
-					if not stop_token.is_set():
-						logger.log(LogFlag.SHOUT, "No more docs to process")
-					break
-				if logger.verbose > 1:
-					logger.debug(f'T{self.tier} doc to process', extra={'doc': doc})
-
-				with (
-					stat_time.labels(self.tier, "process_doc", doc["unit"]).time(),
-					ingester.group()
-				):
-					self.process_doc(doc, ingester, logger)
-				doc_counter += 1
-
-				# Check possibly defined doc_limit
-				if doc_limit and doc_counter >= doc_limit:
-					break
-
-				if garbage_collect:
-					gc.collect()
+			try:
+				# Process docs until next() returns None (breaks condition below)
+				while not stop_token.is_set():
+
+					# get t1/t2 document (code is usually NEW or NEW_PRIO), excluding
+					# docs with retry times in the future
+					if claim_batch_size > 1:
+						if not claimed:
+							with stat_time.labels(self.tier, "claim_docs", None).time():
+								claimed.extend(
+									self.claim_docs(
+										self.query,
+										min(claim_batch_size, doc_limit - doc_counter) if doc_limit
+										else claim_batch_size,
+										stop_token
+									)
+								)
+							if claimed:
+								with stat_time.labels(self.tier, "prefetch", None).time():
+									self.prefetch(claimed)
+						doc = claimed.popleft() if claimed else None
+					else:
+						with stat_time.time() as timer:
+							doc = self.find_one_and_update(self.query, update, stop_token)
+							timer.labels(self.tier, "find_one_and_update", doc["unit"] if doc else None)
+
+					# No match
+					if doc is None:
+						if not stop_token.is_set():
+							logger.log(LogFlag.SHOUT, "No more docs to process")
+						break
+					if logger.verbose > 1:
+						logger.debug(f'T{self.tier} doc to process', extra={'doc': doc})
+
+					with (
+						stat_time.labels(self.tier, "process_doc", doc["unit"]).time(),
+						ingester.group()
+					):
+						self.dispatch_doc(doc, ingester, logger)
+					doc_counter += 1
+
+					# Check possibly defined doc_limit
+					if doc_limit and doc_counter >= doc_limit:
+						break
+
+					if garbage_collect:
+						gc.collect()
+
+				with ingester.group():
+					self.join_dispatched()
+
+			finally:
+				# Stop requested (signal, error) with claimed documents left
+				if claimed:
+					self.release_docs(claimed, logger)
 
 		event_hdlr.add_extra(docs=doc_counter)
 
@@ -308,6 +460,31 @@ class AbsWorker(Generic[T], AbsEventUnit, abstract=True):
 			self.context.loader.clear_adapter_cache()
 
 
+	@contextmanager
+	def _buffer_commits(self, run_id: int, logger: AmpelLogger, stop_token: Event) -> Generator[None, None, None]:
+		"""
+		Routes the updates of :func:`commit_update` through a DBUpdatesBuffer if commit_buffer is set
+		"""
+		if self.commit_buffer is None:
+			yield
+			return
+
+		self._commit_buffer = DBUpdatesBuffer(
+			self._ampel_db, run_id, logger,
+			error_callback = stop_token.set,
+			push_interval = self.commit_buffer.push_interval,
+			max_size = self.commit_buffer.max_size,
+			raise_exc = self.raise_exc,
+			write_concern = self.col.write_concern
+		)
+
+		try:
+			with self._commit_buffer:
+				yield
+		finally:
+			self._commit_buffer = None
+
+
 	def _processing_error(self,
 		logger: AmpelLogger, doc: T, body: UBson,
 		meta: MetaRecord, msg: None | str = None,
@@ -379,6 +556,9 @@ class AbsWorker(Generic[T], AbsEventUnit, abstract=True):
 			'$push': {'meta': meta}
 		}
 
+		if 'retry_after' in meta:
+			upd['$set']['retry_after'] = meta['retry_after']
+
 		if self.mtag:
 
 			tag = merge_tags(self.mtag, tag) if tag else self.mtag
@@ -401,8 +581,15 @@ class AbsWorker(Generic[T], AbsEventUnit, abstract=True):
 		if body is not None:
 			upd[payload_op]['body'] = body
 
+		if self.claim_batch_size > 1:
+			upd['$unset'] = {'claim': 1}
+
 		# Update document
-		self.col.update_one(match, upd)
+		if self._commit_buffer:
+			with self._commit_buffer.group_updates():
+				self._commit_buffer.add_col_update(f't{self.tier}', UpdateOne(match, upd)) # type: ignore[arg-type]
+		else:
+			self.col.update_one(match, upd)
 
 
 	def gen_meta(self,
@@ -4,10 +4,11 @@
 # License:             BSD-3-Clause
 # Author:              valery brinnel <firstname.lastname@gmail.com>
 # Date:                14.01.2020
-# Last Modified Date:  18.06.2020
-# Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
+# Last Modified Date:  17.10.2026
+# Last Modified By:    jvs
 
-from collections.abc import Sequence
+import operator
+from collections.abc import Callable, Sequence
 from typing import Any, Generic
 
 from ampel.abstract.AbsApplicable import AbsApplicable
@@ -17,19 +18,88 @@ from ampel.model.operator.AllOf import AllOf
 from ampel.model.operator.FlatAnyOf import FlatAnyOf
 from ampel.types import T
 
+# Infix notation of operators supported by FilterCriterion
+infix_ops: dict[Callable, str] = {
+	operator.gt: '>',
+	operator.lt: '<',
+	operator.ge: '>=',
+	operator.le: '<=',
+	operator.eq: '==',
+	operator.ne: '!=',
+	operator.is_: 'is',
+	operator.is_not: 'is not'
+}
+
 
 # mypy: disable-error-code = empty-body
 class AbsLogicOperatorFilter(AbsApplicable, Generic[T], abstract=True):
+	"""
+	Filters are compiled on init into a single predicate function, evaluating all criteria
+	at once for each element (with short-circuiting) rather than one list pass per criterion,
+	if the subclass implements :meth:`_criterion_expr`.
+	Note that results of compiled 'any_of' filters follow input order.
+	"""
 
 	filters: FilterCriterion | FlatAnyOf[FilterCriterion] | AllOf[FilterCriterion]
 
+	def __init__(self, **kwargs) -> None:
+		super().__init__(**kwargs)
+		self._predicate = self.compile()
+
 	@staticmethod
 	@abstractmethod
 	def _apply_filter(args: Sequence[T], f: FilterCriterion) -> list[T]:
 		...
 
+	@staticmethod
+	def _criterion_expr(f: FilterCriterion, ns: dict[str, Any]) -> None | str:
+		"""
+		:returns: python expression evaluating the provided criterion for an element named 'el',
+		or None if unsupported. Objects referenced by the expression are registered in ns (see :func:`ref`).
+		"""
+		return None
+
+	@staticmethod
+	def ref(ns: dict[str, Any], obj: Any) -> str:
+		""" :returns: name of obj in the namespace of the compiled predicate """
+		name = f"_{len(ns)}"
+		ns[name] = obj
+		return name
+
+	@classmethod
+	def compare_expr(cls, lhs: str, f: FilterCriterion, ns: dict[str, Any]) -> str:
+		""" :returns: expression comparing lhs with the value of the criterion """
+		v = cls.ref(ns, f.value)
+		if f.operator is operator.contains:
+			return f"({v} in {lhs})"
+		if op := infix_ops.get(f.operator):
+			return f"({lhs} {op} {v})"
+		return f"{cls.ref(ns, f.operator)}({lhs}, {v})"
+
+	def compile(self) -> None | Callable[[T], bool]:
+		""" :returns: predicate equivalent to the filters, None if a criterion is not compilable """
+
+		crits = (
+			[self.filters] if isinstance(self.filters, FilterCriterion)
+			else self.filters.all_of if isinstance(self.filters, AllOf)
+			else self.filters.any_of
+		)
+
+		ns: dict[str, Any] = {}
+		exprs = [self._criterion_expr(f, ns) for f in crits]
+		if not exprs or None in exprs:
+			return None
+
+		return eval(
+			"lambda el: " + (" and " if isinstance(self.filters, AllOf) else " or ").join(exprs), # type: ignore[arg-type]
+			ns
+		)
+
 	def apply(self, args: Sequence[T]) -> list[T]:
 
+		if (pred := self._predicate):
+			return [el for el in args if pred(el)]
+
 		if isinstance(self.filters, FilterCriterion):
 			return self._apply_filter(args, self.filters)
 
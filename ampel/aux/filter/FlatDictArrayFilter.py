@@ -4,10 +4,11 @@
 # License:             BSD-3-Clause
 # Author:              valery brinnel <firstname.lastname@gmail.com>
 # Date:                14.01.2020
-# Last Modified Date:  18.06.2020
-# Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
+# Last Modified Date:  17.10.2026
+# Last Modified By:    jvs
 
 from collections.abc import Mapping, MutableMapping, Sequence
+from typing import Any
 
 from ampel.aux.filter.AbsLogicOperatorFilter import AbsLogicOperatorFilter
 from ampel.aux.filter.SimpleDictArrayFilter import SimpleDictArrayFilter
@@ -28,3 +29,13 @@ class FlatDictArrayFilter(AbsLogicOperatorFilter[MutableMapping]):
 			unflatten_dict(ell)
 			for ell in SimpleDictArrayFilter._apply_filter([flatten_dict(el) for el in dicts], f)  # noqa: SLF001
 		]
+
+	@staticmethod
+	def _criterion_expr(f: FilterCriterion, ns: dict[str, Any]) -> str:
+		return SimpleDictArrayFilter._criterion_expr(f, ns)  # noqa: SLF001
+
+	def apply(self, args: Sequence[Mapping]) -> list[MutableMapping]:
+		# Elements are flattened once rather than once per criterion
+		if (pred := self._predicate):
+			return [unflatten_dict(el) for el in map(flatten_dict, args) if pred(el)]
+		return super().apply(args) # type: ignore[arg-type]
@@ -4,11 +4,11 @@
 # License:             BSD-3-Clause
 # Author:              valery brinnel <firstname.lastname@gmail.com>
 # Date:                14.01.2020
-# Last Modified Date:  18.06.2020
-# Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
+# Last Modified Date:  17.10.2026
+# Last Modified By:    jvs
 
 from collections.abc import Sequence
-from typing import TypeVar
+from typing import Any, TypeVar
 
 from ampel.aux.filter.AbsLogicOperatorFilter import AbsLogicOperatorFilter
 from ampel.model.aux.FilterCriterion import FilterCriterion
@@ -34,3 +34,7 @@ class PrimitiveTypeArrayFilter(AbsLogicOperatorFilter[T]):
 	@staticmethod
 	def _apply_filter(args: Sequence[T], f: FilterCriterion) -> list[T]:
 		return [s for s in args if f.operator(s, f.value)]
+
+	@classmethod
+	def _criterion_expr(cls, f: FilterCriterion, ns: dict[str, Any]) -> str:
+		return cls.compare_expr("el", f, ns)
@@ -4,17 +4,21 @@
 # License:             BSD-3-Clause
 # Author:              valery brinnel <firstname.lastname@gmail.com>
 # Date:                14.01.2020
-# Last Modified Date:  18.06.2020
-# Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
+# Last Modified Date:  17.10.2026
+# Last Modified By:    jvs
 
+import operator
 from collections.abc import Mapping, Sequence
-from typing import TypeVar
+from typing import Any, TypeVar
 
 from ampel.aux.filter.AbsLogicOperatorFilter import AbsLogicOperatorFilter
 from ampel.model.aux.FilterCriterion import FilterCriterion
+from ampel.model.operator.AllOf import AllOf
 
 T = TypeVar("T", bound=Mapping)
 
+numeric_ops = (operator.gt, operator.lt, operator.ge, operator.le, operator.eq, operator.ne)
+
 
 class SimpleDictArrayFilter(AbsLogicOperatorFilter[T]):
 	"""
@@ -51,3 +55,43 @@ class SimpleDictArrayFilter(AbsLogicOperatorFilter[T]):
 				f.operator(d[attr_name], f.value)
 			]
 		return [d for d in dicts if attr_name in d and f.operator(d[attr_name], f.value)]
+
+	@classmethod
+	def _criterion_expr(cls, f: FilterCriterion, ns: dict[str, Any]) -> str:
+		k = cls.ref(ns, f.attribute)
+		if f.type:
+			return f"({k} in el and isinstance(el[{k}], {cls.ref(ns, f.type)}) and {cls.compare_expr(f'el[{k}]', f, ns)})"
+		return f"({k} in el and {cls.compare_expr(f'el[{k}]', f, ns)})"
+
+	def mask(self, columns: Mapping[str, Any]) -> Any:
+		"""
+		Columnar evaluation (requires numpy) of filters made of comparisons of numeric attributes.
+		Elements missing an attribute are not matched by criteria targeting it
+		(note that NaN values are matched by '!=' criteria).
+
+		In []: f.mask({'a': np.array([1, 2, 3])})
+		Out[]: array([False,  True, False])
+
+		:param columns: attribute name -> array of values (one value per element)
+		:returns: boolean numpy array (one value per element)
+		:raises ValueError: if a criterion is not a comparison or defines a type constraint
+		"""
+
+		import numpy as np  # noqa: PLC0415
+
+		size = len(next(iter(columns.values()), ()))
+
+		def crit_mask(f: FilterCriterion) -> Any:
+			if f.type or f.operator not in numeric_ops:
+				raise ValueError(f"Criterion not supported by columnar evaluation: {f}")
+			if f.attribute is None or f.attribute not in columns:
+				return np.zeros(size, dtype=bool)
+			return f.operator(np.asarray(columns[f.attribute]), f.value)
+
+		if isinstance(self.filters, FilterCriterion):
+			return crit_mask(self.filters)
+
+		if isinstance(self.filters, AllOf):
+			return np.logical_and.reduce([crit_mask(f) for f in self.filters.all_of])
+
+		return np.logical_or.reduce([crit_mask(f) for f in self.filters.any_of])
@@ -141,6 +141,7 @@ class AmpelDB(AmpelUnit):
 
 		self.mongo_collections: dict[str, dict[str, Collection]] = {}
 		self.mongo_clients: dict[str, MongoClient] = {} # map role with client
+		self.resource_clients: dict[str, MongoClient] = {} # map resource name with client
 
 		if (
 			self.require_exists
@@ -160,8 +161,11 @@ class AmpelDB(AmpelUnit):
 	def close(self) -> None:
 		for mc in self.mongo_clients.values():
 			mc.close()
+		for mc in self.resource_clients.values():
+			mc.close()
 		self.mongo_collections.clear()
 		self.mongo_clients.clear()
+		self.resource_clients.clear()
 		# deleting the attribute resets cached_property
 		for attr in ("col_trace_ids", "col_conf_ids", "trace_ids", "conf_ids"):
 			with suppress(AttributeError):
@@ -285,6 +289,18 @@ class AmpelDB(AmpelUnit):
 		)
 
 
+	def get_resource_client(self, resource_name: str, **kwargs) -> MongoClient:
+		"""
+		:returns: client (and its connection pool) shared by all units accessing
+		the mongo instance described by the provided resource, for example a 'foreign' database.
+		Clients are closed along with this instance.
+		:param kwargs: MongoClient parameters (typically the resource config), used by the first request
+		"""
+		if resource_name not in self.resource_clients:
+			self.resource_clients[resource_name] = MongoClient(**kwargs)
+		return self.resource_clients[resource_name]
+
+
 	def _get_db_config(self, col_name: str) -> AmpelDBModel:
 		return next(
 			filter(
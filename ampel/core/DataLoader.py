@@ -7,21 +7,25 @@
 # Last Modified Date:  11.11.2025
 # Last Modified By:    JannisNe
 
-from collections.abc import Iterable, Iterator
-from typing import Literal
+from collections.abc import Iterable, Iterator, Sequence
+from typing import Any, Literal
 
+from bson import decode
 from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
 
 from ampel.core.AmpelContext import AmpelContext
 from ampel.log.AmpelLogger import AmpelLogger
-from ampel.log.utils import safe_query_dict
+from ampel.log.utils import convert_dollars, safe_query_dict
 from ampel.metrics.AmpelMetricsRegistry import AmpelMetricsRegistry
 from ampel.model.operator.AllOf import AllOf
 from ampel.model.operator.AnyOf import AnyOf
 from ampel.model.operator.OneOf import OneOf
 from ampel.model.t3.LoaderDirective import LoaderDirective
+from ampel.mongo.query.filter import channel_filter_expr
 from ampel.mongo.query.general import build_general_query
 from ampel.mongo.view.FrozenValuesDict import FrozenValuesDict
+from ampel.mongo.view.LazyFrozenDict import LazyFrozenDict
 from ampel.struct.AmpelBuffer import AmpelBuffer
 from ampel.types import ChannelId, StockId, StrictIterable, Tag
 from ampel.util.collections import ampel_iter
@@ -44,7 +48,10 @@ class DataLoader:
 		tag: None | dict[Literal['with', 'without'], Tag | dict | AllOf[Tag] | AnyOf[Tag] | OneOf[Tag]] = None,
 		auto_project: bool = True,
 		codec_options: None | CodecOptions = CodecOptions(document_class=FrozenValuesDict), # noqa: B008
-		logger: None | AmpelLogger = None
+		logger: None | AmpelLogger = None,
+		lookup: bool = False,
+		stock_match: None | dict[str, Any] = None,
+		doc_channel: None | Sequence[ChannelId] = None
 	) -> Iterable[AmpelBuffer]:
 		"""
 		:param directives: see LoaderDirective docstrings for more information.  Notes:
@@ -62,6 +69,22 @@ class DataLoader:
 		a default "content" typed dict. By default, we request a projection that projects only the fields defined
 		in those TypedDict. Custom/admin fields would thus not be retrieved.
 		Set this setting to False if it is not the whished behavior.
+
+		:param codec_options: use `LAZY_CODEC_OPTIONS` (module ampel.mongo.view.LazyFrozenDict)
+		to defer the decoding of document fields until they are accessed.
+
+		:param lookup: retrieve the documents of all directives in a single round-trip, using an aggregation
+		on the stock collection with one $lookup stage per directive (requires MongoDB >= 5.0),
+		rather than with one find() per directive. Notes: 1) stocks without stock document are not loaded
+		(the associated buffers remain empty) 2) the documents associated with a stock are returned
+		as a single aggregation result, which is subject to the 16MB document size limit.
+
+		:param stock_match: match expression on stock documents. Stocks whose stock document does not match
+		(or which have no stock document) are discarded before any other document is loaded.
+
+		:param doc_channel: only load t1/t2 documents associated with any of these channels.
+		Journal entries of stock documents are restricted likewise if auto_project is True
+		(projection expression, requires MongoDB >= 4.4).
 		"""
 
 		col_set = {directive.col for directive in directives}
@@ -78,104 +101,135 @@ class DataLoader:
 			) for stock_id in ampel_iter(stock_ids)
 		}
 
-		for directive in directives:
-
-			query = build_general_query(
-				stock=register.keys(), channel=channel, tag=tag
+		if lookup:
+			self._lookup(
+				register, directives, channel, tag, auto_project, codec_options, logger,
+				stock_match, doc_channel
 			)
 
-			#if directive.col == "stock":
-			#	query['_id'] = query.pop("stock")
-			#elif directive.col == "t0" and channel:
-			#	query.pop('channel')
+		else:
 
-			# query 'stock' parameter primes over query complements
-			if directive.query_complement:
-				query = directive.query_complement | query
+			if stock_match:
+				# Stock documents are loaded first so that unmatched stocks are discarded right away
+				if "stock" in col_set:
+					directives = sorted(directives, key=lambda d: d.col != "stock")
+				else:
+					self._match_stocks(register, stock_match)
 
-			if logger and logger.verbose > 1: # log query parameters
-				logger.debug(
-					None, extra={
-						'col': directive.col,
-						'query': safe_query_dict(query, dict_key=None)
-					}
+			for directive in directives:
+
+				# build_general_query would otherwise not restrict stock ids
+				if not register:
+					break
+
+				query = build_general_query(
+					stock=register.keys(), channel=channel, tag=tag
 				)
 
-			# Retrieve pymongo cursor
-			col = self.ctx.db.get_collection(directive.col)
+				#if directive.col == "stock":
+				#	query['_id'] = query.pop("stock")
+				#elif directive.col == "t0" and channel:
+				#	query.pop('channel')
+
+				# query 'stock' parameter primes over query complements
+				if directive.query_complement:
+					query = directive.query_complement | query
 
-			if codec_options:
-				col = col.database.get_collection(col.name, codec_options=codec_options)
+				if stock_match and directive.col == "stock":
+					query = {'$and': [query, stock_match]}
 
-			# Note: codec_options freezes structures in dicts with depth level > 1
-			cursor = col.find(
-				filter = query,
-				projection = {
+				if doc_channel and directive.col in ("t1", "t2"):
+					query = {'$and': [query, {'channel': {'$in': list(doc_channel)}}]}
+
+				projection: None | dict[str, Any] = {
 					k: 1 for k in directive.model.__annotations__
 				} if auto_project else None
-			)
 
-			inc = stat_db_loads.labels(directive.col).inc
+				if doc_channel and projection and directive.col == "stock":
+					projection['journal'] = channel_filter_expr('$journal', doc_channel)
 
-			if directive.col == "t1":
-				count = 0
-				for count, res in enumerate(cursor, 1): # noqa: B007
-					register[res['stock']][directive.col].append(res) # type: ignore[union-attr]
-				inc(count)
+				if logger and logger.verbose > 1: # log query parameters
+					logger.debug(
+						None, extra={
+							'col': directive.col,
+							'query': safe_query_dict(query, dict_key=None)
+						}
+					)
 
-			elif directive.col == "stock":
-				count = 0
-				for count, res in enumerate(cursor, 1): # noqa: B007
-					register[res['stock']]['stock'] = res
-				inc(count)
+				# Retrieve pymongo cursor
+				col = self.ctx.db.get_collection(directive.col)
 
-			# Datapoints are potentially channel-less and can be associated with multiple stocks
-			elif directive.col == "t0":
+				if codec_options:
+					col = col.database.get_collection(col.name, codec_options=codec_options)
 
-				count = 0
-				for count, res in enumerate(cursor, 1): # noqa: B007
+				# Note: codec_options freezes structures in dicts with depth level > 1
+				cursor = col.find(filter = query, projection = projection)
 
-					# Upper limits can be attached to multiple transients
-					for sid in res['stock']:
+				inc = stat_db_loads.labels(directive.col).inc
 
-						# Some of which might not match with our query
-						if sid not in register:
-							continue
+				if directive.col == "t1":
+					count = 0
+					for count, res in enumerate(cursor, 1): # noqa: B007
+						register[res['stock']][directive.col].append(res) # type: ignore[union-attr]
+					inc(count)
 
-						# Add datapoints to snapdata (no need to recursive_freeze
-						# since dict elements with level > 1 are frozen due to codec_options
-						register[sid]['t0'].append(res) # type: ignore[union-attr]
-				inc(count)
+				elif directive.col == "stock":
+					count = 0
+					for count, res in enumerate(cursor, 1): # noqa: B007
+						register[res['stock']]['stock'] = res
+					inc(count)
 
-			elif directive.col == "t2":
+					if stock_match:
+						for sid in [k for k, v in register.items() if v['stock'] is None]:
+							del register[sid]
 
-				# the entire data will need to fit in memory anyway
-				res = list(cursor)
+				# Datapoints are potentially channel-less and can be associated with multiple stocks
+				elif directive.col == "t0":
 
-				# whether to replace init config integer hash with 'resolved' config dict
-				if directive.resolve_config:
-					for el in res:
-						self.resolve_unit_config(el)
+					count = 0
+					for count, res in enumerate(cursor, 1): # noqa: B007
 
-				inc(len(res))
+						# Upper limits can be attached to multiple transients
+						for sid in res['stock']:
 
-				if directive.excluding_query:
+							# Some of which might not match with our query
+							if sid not in register:
+								continue
 
-					sids = set(register.keys())
-					for el in res:
-						if el['stock'] in sids:
-							sids.remove(el['stock'])
-					if sids:
-						for k in sids:
-							del register[k]
+							# Add datapoints to snapdata (no need to recursive_freeze
+							# since dict elements with level > 1 are frozen due to codec_options
+							register[sid]['t0'].append(res) # type: ignore[union-attr]
+					inc(count)
 
-				for el in res:
-					register[el['stock']]['t2'].append(el) # type: ignore[union-attr]
+				elif directive.col == "t2":
 
-			else:
-				raise ValueError(
-					f"Unrecognized LoaderDirective: {directive.dict()}"
-				)
+					# the entire data will need to fit in memory anyway
+					res = list(cursor)
+
+					# whether to replace init config integer hash with 'resolved' config dict
+					if directive.resolve_config:
+						for el in res:
+							self.resolve_unit_config(el)
+
+					inc(len(res))
+
+					if directive.excluding_query:
+
+						sids = set(register.keys())
+						for el in res:
+							if el['stock'] in sids:
+								sids.remove(el['stock'])
+						if sids:
+							for k in sids:
+								del register[k]
+
+					for el in res:
+						register[el['stock']]['t2'].append(el) # type: ignore[union-attr]
+
+				else:
+					raise ValueError(
+						f"Unrecognized LoaderDirective: {directive.dict()}"
+					)
 
 		if logger and logger.verbose:
 			s = f"Unique ids: {len(register)}"
@@ -187,6 +241,122 @@ class DataLoader:
 		return register.values()
 
 
+	def _lookup(self,
+		register: dict[StockId, AmpelBuffer],
+		directives: Iterable[LoaderDirective],
+		channel: None | ChannelId | AllOf[ChannelId] | AnyOf[ChannelId] | OneOf[ChannelId],
+		tag: None | dict[Literal['with', 'without'], Tag | dict | AllOf[Tag] | AnyOf[Tag] | OneOf[Tag]],
+		auto_project: bool,
+		codec_options: None | CodecOptions,
+		logger: None | AmpelLogger,
+		stock_match: None | dict[str, Any] = None,
+		doc_channel: None | Sequence[ChannelId] = None
+	) -> None:
+		""" Loads the documents requested by all directives with a single aggregation (see :func:`load`) """
+
+		directives = list(directives)
+		match = build_general_query(stock=register.keys())
+		pipeline: list[dict[str, Any]] = [
+			{'$match': {'$and': [match, stock_match]} if stock_match else match}
+		]
+
+		for i, directive in enumerate(directives):
+
+			query = build_general_query(channel=channel, tag=tag)
+
+			# join on stock primes over query complements
+			if directive.query_complement:
+				query = {k: v for k, v in directive.query_complement.items() if k != 'stock'} | query
+
+			if doc_channel and directive.col in ('t1', 't2'):
+				query = {'$and': [query, {'channel': {'$in': list(doc_channel)}}]}
+
+			sub_pipeline: list[dict[str, Any]] = [{'$match': query}]
+			if auto_project:
+				projection: dict[str, Any] = {k: 1 for k in directive.model.__annotations__}
+				if doc_channel and directive.col == 'stock':
+					projection['journal'] = channel_filter_expr('$journal', doc_channel)
+				sub_pipeline.append({'$project': projection})
+
+			pipeline.append(
+				{
+					'$lookup': {
+						'from': directive.col,
+						# 'stock' is an array in t0 documents, which $lookup handles implicitely
+						'localField': '_id' if directive.col == 'stock' else 'stock',
+						'foreignField': '_id' if directive.col == 'stock' else 'stock',
+						'pipeline': sub_pipeline,
+						'as': f'd{i}'
+					}
+				}
+			)
+
+		pipeline.append(
+			{'$project': {'_id': 0, 'stock': 1} | {f'd{i}': 1 for i in range(len(directives))}}
+		)
+
+		if logger and logger.verbose > 1: # log query parameters
+			logger.debug(None, extra={'col': 'stock', 'pipeline': convert_dollars(pipeline)})
+
+		# Sub-documents are decoded individually, using the requested codec options
+		col = self.ctx.db.get_collection('stock')
+		col = col.database.get_collection(
+			col.name, codec_options=CodecOptions(document_class=RawBSONDocument)
+		)
+		dec_opts = codec_options or col.database.codec_options
+		counts = [0] * len(directives)
+		loaded: list[set[StockId]] = [set() for _ in directives]
+		matched: set[StockId] = set()
+
+		for res in col.aggregate(pipeline):
+
+			sid = res['stock']
+			if sid not in register:
+				continue
+
+			matched.add(sid)
+
+			for i, directive in enumerate(directives):
+
+				if not (docs := [decode(el.raw, dec_opts) for el in res[f'd{i}']]):
+					continue
+
+				counts[i] += len(docs)
+				loaded[i].add(sid)
+
+				if directive.col == 'stock':
+					register[sid]['stock'] = docs[0]
+					continue
+
+				if directive.col == 't2' and directive.resolve_config:
+					for el in docs:
+						self.resolve_unit_config(el)
+
+				register[sid][directive.col].extend(docs) # type: ignore[union-attr]
+
+		if stock_match:
+			for sid in register.keys() - matched:
+				del register[sid]
+
+		for i, directive in enumerate(directives):
+			stat_db_loads.labels(directive.col).inc(counts[i])
+			if directive.col == 't2' and directive.excluding_query:
+				for sid in register.keys() - loaded[i]:
+					del register[sid]
+
+
+	def _match_stocks(self, register: dict[StockId, AmpelBuffer], stock_match: dict[str, Any]) -> None:
+		""" Discards stocks whose stock document does not match the provided expression """
+		matched = {
+			el['stock'] for el in self.ctx.db.get_collection('stock').find(
+				{'$and': [build_general_query(stock=register.keys()), stock_match]},
+				{'stock': 1}
+			)
+		}
+		for sid in register.keys() - matched:
+			del register[sid]
+
+
 	def resolve_unit_config(self, conf: dict) -> None:
 		"""
 		Resolve configuration references within a unit config dictionary.
@@ -209,7 +379,10 @@ class DataLoader:
 
 		# Resolve config if it's an integer
 		if 'config' in conf and isinstance(conf['config'], int):
-			dict.__setitem__(conf, 'config', self.ctx.config.get_conf_by_id(conf['config']))
+			if isinstance(conf, LazyFrozenDict):
+				conf.resolve('config', self.ctx.config.get_conf_by_id(conf['config']))
+			else:
+				dict.__setitem__(conf, 'config', self.ctx.config.get_conf_by_id(conf['config']))
 
 		# check for nested t2_dependencies
 		config_dict = conf.get('config')
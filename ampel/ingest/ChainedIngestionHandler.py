@@ -7,10 +7,11 @@
 # Last Modified Date:  24.11.2021
 # Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
 
-from collections.abc import Callable, Sequence
+from collections import OrderedDict
+from collections.abc import Callable, Hashable, Iterable, Sequence
 from datetime import timedelta
 from time import time
-from typing import Any, Literal
+from typing import Any, Literal, NamedTuple
 
 from ampel.abstract.AbsApplicable import AbsApplicable
 from ampel.abstract.AbsIngester import AbsIngester
@@ -35,6 +36,7 @@ from ampel.log.handlers.DefaultRecordBufferingHandler import (
 	DefaultRecordBufferingHandler,
 )
 from ampel.log.LogFlag import LogFlag
+from ampel.metrics.AmpelMetricsRegistry import AmpelMetricsRegistry
 from ampel.model.ChannelModel import ChannelModel
 from ampel.model.DPSelection import DPSelection
 from ampel.model.ingest.CompilerOptions import CompilerOptions
@@ -53,9 +55,10 @@ from ampel.util.hash import build_unsafe_dict_id
 
 
 class T2Block:
-	__slots__ = "unit", "config", "slc", "sort", "filter", "group"
+	__slots__ = "unit", "config", "selection", "slc", "sort", "filter", "group"
 	unit: UnitId
 	config: None | int
+	selection: None | int # hash of datapoint selection options
 	filter: None | AbsApplicable
 	sort: None | Callable
 	slc: None | slice
@@ -111,6 +114,30 @@ T1ComputeCache = dict[
 	tuple[UBson | UnitResult, StockId]
 ]
 
+class IngestItem(NamedTuple):
+	""" Arguments of :func:`ChainedIngestionHandler.compile` """
+	alert_dps: Sequence[dict[str, Any]]
+	filter_results: list[tuple[int, bool | int]]
+	stock_id: StockId = 0
+	tag: None | Tag | list[Tag] = None
+	jm_extra: None | dict[str, Any] = None
+	stock_body: None | dict[str, Any] = None
+
+
+# Monitoring counters
+stat_t1_cache = AmpelMetricsRegistry.counter(
+	"t1_cache_lookups",
+	"Number of lookups in the cross-alert T1 combine/compute cache",
+	subsystem="ingest",
+	labelnames=("op", "result")
+)
+
+
+DPSelectionCache = dict[
+	tuple[None | int, tuple[DataPointId, ...]],
+	list[DataPointId]
+]
+
 
 class ChainedIngestionHandler:
 
@@ -131,7 +158,8 @@ class ChainedIngestionHandler:
 		logger: AmpelLogger,
 		origin: None | int = None,
 		int_time: bool = True,
-		include_extra_meta: int = 2
+		include_extra_meta: int = 2,
+		t1_cache_size: int = 0
 	):
 		"""
 		:param trace_id: base trace if of root caller (such as AlertConsumer or T1Generator)
@@ -141,6 +169,8 @@ class ChainedIngestionHandler:
 		- 1: include provided extra meta data in all generated meta entries of all docs except point t2 docs
 		- 2: include provided extra meta data in all generated meta entries of all docs
 		Note: granularity might increase in the future
+		:param t1_cache_size: max number of T1 combine and T1 compute results (each) retained across alerts,
+		keyed by unit (trace id) and datapoint ids. Least recently used results are evicted first. 0: disabled
 		"""
 
 		self.ingester = ingester
@@ -156,6 +186,9 @@ class ChainedIngestionHandler:
 		self._mux_cache: dict[int, AbsT0Muxer] = {}
 		self._t1_combine_units_cache: dict[int, AbsT1CombineUnit | AbsT1RetroCombineUnit] = {}
 		self._t1_compute_units_cache: dict[int, AbsT1ComputeUnit] = {}
+		self.t1_cache_size = t1_cache_size
+		self._t1_comb_lru: OrderedDict[tuple[Hashable, tuple[DataPointId, ...]], Any] = OrderedDict()
+		self._t1_comp_lru: OrderedDict[tuple[Hashable, tuple[DataPointId, ...]], Any] = OrderedDict()
 
 		if not directives:
 			raise ValueError("Need at least 1 directive")
@@ -436,9 +469,10 @@ class ChainedIngestionHandler:
 
 		# Only for point t2 units (which can customize the ingestion)
 		if ingest_opts:
+			ib.selection = build_unsafe_dict_id(ingest_opts)
 			ib.filter, ib.sort, ib.slc = DPSelection(**ingest_opts).tools()
 		else:
-			ib.filter = ib.sort = ib.slc = None
+			ib.selection = ib.filter = ib.sort = ib.slc = None
 
 		if im.group:
 			ib.group = [im.group] if isinstance(im.group, int) else im.group
@@ -465,11 +499,52 @@ class ChainedIngestionHandler:
 
 		ingest_start = time()
 
+		if self.compile(alert_dps, filter_results, stock_id, tag, jm_extra, stock_body):
+			self.commit()
+			self.ingest_stats.append(time() - ingest_start)
+
+
+	def ingest_many(self, items: Iterable[IngestItem]) -> None:
+		"""
+		Create database documents for a batch of alerts.
+		Updates are accumulated by the compilers across the batch and committed once,
+		meaning that datapoints and t2 documents shared by several alerts of the batch
+		result in a single upsert. Stock documents receive one journal entry per alert,
+		as with :func:`ingest`.
+		"""
+
+		ingest_start = time()
+		compiled = False
+
+		for item in items:
+			if self.compile(*item):
+				compiled = True
+
+		if compiled:
+			self.commit()
+			self.ingest_stats.append(time() - ingest_start)
+
+
+	def compile(self,
+		alert_dps: Sequence[dict[str, Any]],
+		filter_results: list[tuple[int, bool | int]],
+		stock_id: StockId = 0,
+		tag: None | Tag | list[Tag] = None,
+		jm_extra: None | dict[str, Any] = None,
+		stock_body: None | dict[str, Any] = None
+	) -> bool:
+		"""
+		Register the updates resulting from an alert with the compilers.
+		Updates are saved into the database by :func:`commit`
+		:param stock_body: body of the stock document
+		:returns: False if the alert yields no datapoint
+		"""
+
 		# process *modifies* dict instances loaded by fastavro
 		dps: list[DataPoint] = self.shaper.process(alert_dps, stock_id)
 
 		if not dps: # Not sure if this can happen
-			return
+			return False
 
 		add_other_tag: None | MetaActivity = {'action': MetaActionCode.ADD_OTHER_TAG, 'tag': tag} if tag else None
 
@@ -477,10 +552,14 @@ class ChainedIngestionHandler:
 		mux_cache: dict[AbsT0Muxer, tuple[None | list[DataPoint], None | list[DataPoint], set[ChannelId]]] = {}
 		t1_comb_cache: T1CombineCache = {}
 		t1_comp_cache: T1ComputeCache = {}
+		dps_sel_cache: DPSelectionCache = {}
 
 		# ingestion blocks
 		ibs = self.iblocks
 
+		# Journal entries of distinct alerts are not merged
+		self.stock_compiler.new_scope()
+
 		for i, fres in filter_results:
 
 			# Add alert and shaper version info to stock journal entry
@@ -535,7 +614,7 @@ class ChainedIngestionHandler:
 					jentry['action'] |= JournalActionCode.T2_ADD_CHANNEL
 					self.ingest_point_t2s(
 						dps_combine, fres, stock_id, ib.channel, ib.ttl, mux.point_t2, add_other_tag,
-						jm_extra if self.include_extra_meta > 1 else None
+						jm_extra if self.include_extra_meta > 1 else None, dps_sel_cache
 					)
 
 				# Muxed T1 and associated T2 ingestions
@@ -543,7 +622,7 @@ class ChainedIngestionHandler:
 					self.ingest_t12(
 						dps_combine, fres, stock_id, jentry, mux.combine,
 						t1_comb_cache, t1_comp_cache, add_other_tag,
-						jm_extra if self.include_extra_meta else None
+						jm_extra if self.include_extra_meta else None, dps_sel_cache
 					)
 
 			else:
@@ -553,14 +632,15 @@ class ChainedIngestionHandler:
 			if ib.combine:
 				self.ingest_t12(
 					dps, fres, stock_id, jentry, ib.combine, t1_comb_cache, t1_comp_cache,
-					add_other_tag, meta_extra = jm_extra if self.include_extra_meta else None
+					add_other_tag, meta_extra = jm_extra if self.include_extra_meta else None,
+					dps_sel_cache = dps_sel_cache
 				)
 				
 			# Non-muxed point T2s
 			if ib.point_t2:
 				self.ingest_point_t2s(
 					dps, fres, stock_id, ib.channel, ib.ttl, ib.point_t2, add_other_tag,
-					jm_extra if self.include_extra_meta > 1 else None
+					jm_extra if self.include_extra_meta > 1 else None, dps_sel_cache
 				)
 
 			# Stock T2s
@@ -588,14 +668,24 @@ class ChainedIngestionHandler:
 						logger, stock=stock_id, channel=list(chans), extra = jm_extra
 					)
 
-			if not self.stock_compiler.register:
+			if not self.stock_compiler.in_scope(stock_id):
 				self.stock_compiler.add(
 					stock_id, ib.channel, journal = jentry, # type: ignore[arg-type]
 					tag = add_other_tag['tag'] if add_other_tag else None # type: ignore[arg-type]
 				)
 
-		# Commit
-		########
+		if stock_body and stock_id in self.stock_compiler.register:
+			self.stock_compiler.set_body(stock_id, stock_body)
+
+		return True
+
+
+	def commit(self, stock_body: None | dict[str, Any] = None) -> None:
+		"""
+		Save compiled updates into the database
+		:param stock_body: body of all stock documents updated since the last commit
+		"""
+
 		now = int(time()) if self.int_time else time()
 
 		self.t0_compiler.commit(self.ingester.t0, now)
@@ -613,7 +703,6 @@ class ChainedIngestionHandler:
 			self.state_t2_compiler.commit(self.ingester.t2, now)
 
 		self.stock_compiler.commit(self.ingester.stock, now, body=stock_body)
-		self.ingest_stats.append(time() - ingest_start)
 
 
 	def ingest_point_t2s(self,
@@ -624,11 +713,17 @@ class ChainedIngestionHandler:
 		ttl: None | timedelta,
 		point_t2: list[T2Block],
 		add_other_tag: None | MetaActivity = None,
-		meta_extra: None | dict[str, Any] = None
+		meta_extra: None | dict[str, Any] = None,
+		dps_sel_cache: None | DPSelectionCache = None
 	) -> None:
-		# Present datapoints in the same order as they are stored in the T1 document
-		if self.t1_compiler.sort:
-			dps = sorted(dps, key=lambda x: x["id"])
+		"""
+		:param dps_sel_cache: ids of datapoints previously selected by t2 blocks
+		  with identical selection options (typically, other channels) for the same datapoints.
+		  Valid for a single alert only (see :func:`ingest`).
+		"""
+
+		sdps: None | list[DataPoint] = None
+		tdps = tuple(el['id'] for el in dps) if dps_sel_cache is not None else ()
 
 		for t2b in point_t2:
 
@@ -636,36 +731,72 @@ class ChainedIngestionHandler:
 			if t2b.group and isinstance(fres, int) and fres not in t2b.group:
 				continue
 
-			# filter (ex: use only photopoints or upperlimis)
-			f = t2b.filter.apply(dps) if t2b.filter else dps
-
-			# Sort (ex: by body.jd)
-			if t2b.sort:
-				f = t2b.sort(f)
-
-			# Slice (ex: first datapoint)
-			if t2b.slc:
-				f = f[t2b.slc]
-
-			if isinstance(f, list):
-				for el in f:
-					self.point_t2_compiler.add(
-						t2b.unit, t2b.config, stock_id, el['id'], channel,
-						ttl, self.base_trace_id, add_other_tag, meta_extra
-					)
+			k = t2b.selection, tdps
+			if dps_sel_cache is not None and k in dps_sel_cache:
+				dpids = dps_sel_cache[k]
 			else:
+				# Present datapoints in the same order as they are stored in the T1 document
+				# (sorted at most once per call)
+				if sdps is None:
+					sdps = sorted(dps, key=lambda x: x["id"]) if self.t1_compiler.sort else dps
+				dpids = self.select_dps(t2b, sdps)
+				if dps_sel_cache is not None:
+					dps_sel_cache[k] = dpids
+
+			for dpid in dpids:
 				self.point_t2_compiler.add(
-					t2b.unit, t2b.config, stock_id, f['id'], channel,
+					t2b.unit, t2b.config, stock_id, dpid, channel,
 					ttl, self.base_trace_id, add_other_tag, meta_extra
 				)
 
 
+	@staticmethod
+	def select_dps(t2b: T2Block, dps: list[DataPoint]) -> list[DataPointId]:
+		""" Applies the datapoint selection (filter, sort, slice) of a t2 block """
+
+		# filter (ex: use only photopoints or upperlimis)
+		f = t2b.filter.apply(dps) if t2b.filter else dps
+
+		# Sort (ex: by body.jd)
+		if t2b.sort:
+			f = t2b.sort(f)
+
+		# Slice (ex: first datapoint)
+		if t2b.slc:
+			f = f[t2b.slc]
+
+		if isinstance(f, list):
+			return [el['id'] for el in f]
+
+		return [f['id']]
+
+
+	def _lru_get(self, cache: OrderedDict, k: Hashable, op: str) -> Any:
+		""" :returns: None if the cross-alert cache is disabled or does not contain k """
+		if not self.t1_cache_size:
+			return None
+		if (v := cache.get(k)) is None:
+			stat_t1_cache.labels(op, "miss").inc()
+			return None
+		cache.move_to_end(k)
+		stat_t1_cache.labels(op, "hit").inc()
+		return v
+
+
+	def _lru_put(self, cache: OrderedDict, k: Hashable, v: Any) -> None:
+		if self.t1_cache_size:
+			cache[k] = v
+			if len(cache) > self.t1_cache_size:
+				cache.popitem(last=False)
+
+
 	def ingest_t12(self,
 		dps: list[DataPoint], fres: bool | int, stock_id: StockId,
 		jentry: dict[str, Any], t1bs: list[T1CombineBlock],
 		t1_comb_cache: T1CombineCache, t1_comp_cache: T1ComputeCache,
 		add_other_tag: None | MetaActivity = None,
 		meta_extra: None | dict[str, Any] = None,
+		dps_sel_cache: None | DPSelectionCache = None
 	) -> None:
 
 		tdps = tuple(el['id'] for el in dps)
@@ -682,16 +813,19 @@ class ChainedIngestionHandler:
 				lres, s = t1_comb_cache[(t1b.unit, tdps)]
 				s.add(t1b.channel)
 			else:
-				comb_res = t1b.unit.combine(iter(dps))
-				if isinstance(comb_res, T1CombineResult): # case T1CombineResult
-					lres = [comb_res]
-				elif len(comb_res) == 0:
-					lres = []
-				elif isinstance(comb_res[0], DataPointId): # case list[DataPointId]
-					lres = [comb_res] # type: ignore[list-item]
-				else:
-					# case list[list[DataPointId]], list[T1CombineResult]
-					lres = comb_res # type: ignore[assignment]
+				lk = (t1b.trace_id or t1b.unit, tdps)
+				if (lres := self._lru_get(self._t1_comb_lru, lk, 'combine')) is None:
+					comb_res = t1b.unit.combine(iter(dps))
+					if isinstance(comb_res, T1CombineResult): # case T1CombineResult
+						lres = [comb_res]
+					elif len(comb_res) == 0:
+						lres = []
+					elif isinstance(comb_res[0], DataPointId): # case list[DataPointId]
+						lres = [comb_res] # type: ignore[list-item]
+					else:
+						# case list[list[DataPointId]], list[T1CombineResult]
+						lres = comb_res # type: ignore[assignment]
+					self._lru_put(self._t1_comb_lru, lk, lres)
 				t1_comb_cache[(t1b.unit, tdps)] = lres, {t1b.channel}
 
 			# T1 combine(...) can return multiple subsets of the initial datapoints
@@ -761,9 +895,13 @@ class ChainedIngestionHandler:
 					if k in t1_comp_cache:
 						t1_res = t1_comp_cache[k]
 					else:
-						t1_res = t1_comp_cache[k] = t1b.compute.unit.compute(
-							[dp for dp in dps if dp['id'] in t1_dps]
-						)
+						ck = (t1b.compute.trace_id or t1b.compute.unit, k[1])
+						if (t1_res := self._lru_get(self._t1_comp_lru, ck, 'compute')) is None:
+							t1_res = t1b.compute.unit.compute(
+								[dp for dp in dps if dp['id'] in t1_dps]
+							)
+							self._lru_put(self._t1_comp_lru, ck, t1_res)
+						t1_comp_cache[k] = t1_res
 
 					# AbsT1ComputeUnit can be used to determine stock
 					stock_id = t1_res[1]
@@ -838,5 +976,5 @@ class ChainedIngestionHandler:
 					self.ingest_point_t2s(
 						[el for el in dps if el['id'] in t1_dps],
 						fres, stock_id, t1b.channel, t1b.ttl, t1b.point_t2, add_other_tag,
-						meta_extra if self.include_extra_meta > 1 else None
+						meta_extra if self.include_extra_meta > 1 else None, dps_sel_cache
 					)
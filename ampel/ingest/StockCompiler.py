@@ -4,8 +4,8 @@
 # License:             BSD-3-Clause
 # Author:              valery brinnel <firstname.lastname@gmail.com>
 # Date:                05.05.2021
-# Last Modified Date:  21.11.2021
-# Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
+# Last Modified Date:  17.10.2026
+# Last Modified By:    jvs
 
 from typing import Any
 
@@ -33,6 +33,8 @@ class StockCompiler(AbsCompiler):
 	def __init__(self, **kwargs) -> None:
 		super().__init__(**kwargs)
 		self.register: dict[StockId, dict[str, Any]] = {}
+		self._scope = 0
+		self._scope_stocks: set[StockId] = set()
 		self._id_mapper = AuxUnitRegister.get_aux_class(
 			self.id_mapper, sub_type=AbsIdMapper
 		) if self.id_mapper else None
@@ -46,6 +48,7 @@ class StockCompiler(AbsCompiler):
 		tag: None | Tag | list[Tag] = None
 	) -> None:
 
+		self._scope_stocks.add(stock)
 		if stock in self.register:
 			d = self.register[stock]
 			d['channel'].add(channel)
@@ -57,7 +60,7 @@ class StockCompiler(AbsCompiler):
 		if journal:
 			# try to merge identical journal entries with each other
 			# cannot use frozenset(items) because of potential nested dicts
-			k = encode(journal)
+			k = self._scope, encode(journal)
 			if 'journal' in d:
 				if k in d['journal']:
 					d['journal'][k][1].add(channel)
@@ -75,6 +78,25 @@ class StockCompiler(AbsCompiler):
 				d['tag'].update(tag)
 
 
+	def new_scope(self) -> None:
+		"""
+		Journal entries added hereafter are not merged with previous ones.
+		Used when several alerts are compiled before a commit (one journal entry per alert).
+		"""
+		self._scope += 1
+		self._scope_stocks.clear()
+
+
+	def in_scope(self, stock: StockId) -> bool:
+		""" :returns: whether the stock was added since the last call to :meth:`new_scope` """
+		return stock in self._scope_stocks
+
+
+	def set_body(self, stock: StockId, body: dict[str, Any]) -> None:
+		""" Sets the body of a registered stock (takes precedence over the body provided to commit) """
+		self.register[stock]['body'] = body
+
+
 	# Override
 	def commit(self,
 		ingester: DocIngesterProtocol[StockDocument],
@@ -103,7 +125,9 @@ class StockCompiler(AbsCompiler):
 			if 'name' in v:
 				d['name'] = v['name']
 
-			if kwargs.get('body'):
+			if 'body' in v:
+				d['body'] = v['body']
+			elif kwargs.get('body'):
 				d['body'] = kwargs['body']
 
 			if self.origin:
@@ -121,3 +145,4 @@ class StockCompiler(AbsCompiler):
 			ingester.ingest(d)
 
 		self.register.clear()
+		self._scope_stocks.clear()
@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# File:                Ampel-core/ampel/model/t3/T3QueryPlan.py
+# License:             BSD-3-Clause
+# Author:              jvs
+# Date:                17.10.2026
+# Last Modified Date:  17.10.2026
+# Last Modified By:    jvs
+
+from typing import Any
+
+from ampel.base.AmpelBaseModel import AmpelBaseModel
+from ampel.types import ChannelId
+
+
+class T3QueryPlan(AmpelBaseModel):
+	"""
+	Selection criteria of a stager which can be delegated to the loader
+	(see :meth:`AbsT3Stager.get_query_plan <ampel.abstract.AbsT3Stager.AbsT3Stager.get_query_plan>`),
+	so that documents the stager would discard are not transferred from the database.
+	"""
+
+	#: Match expression on stock documents. Stocks whose stock document
+	#: does not match (or which have no stock document) are not loaded
+	stock: None | dict[str, Any] = None
+
+	#: Only t1/t2 documents and journal entries associated with
+	#: at least one of these channels are loaded
+	channel: None | list[ChannelId] = None
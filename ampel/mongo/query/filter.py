@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# File:                Ampel-core/ampel/mongo/query/filter.py
+# License:             BSD-3-Clause
+# Author:              jvs
+# Date:                17.10.2026
+# Last Modified Date:  17.10.2026
+# Last Modified By:    jvs
+
+import operator
+import re
+from collections.abc import Sequence
+from typing import Any
+
+from ampel.model.aux.FilterCriterion import FilterCriterion
+from ampel.model.operator.AllOf import AllOf
+from ampel.model.operator.FlatAnyOf import FlatAnyOf
+from ampel.types import ChannelId
+
+comparison_ops = {
+	operator.gt: '$gt',
+	operator.lt: '$lt',
+	operator.ge: '$gte',
+	operator.le: '$lte',
+	operator.eq: '$eq',
+	operator.ne: '$ne'
+}
+
+
+def criterion_query(f: FilterCriterion) -> None | dict[str, Any]:
+	"""
+	Translates a filter criterion, as evaluated by
+	:class:`~ampel.aux.filter.SimpleDictArrayFilter.SimpleDictArrayFilter`, into a match expression.
+	Note that python compares whole values whereas mongodb compares arrays element-wise:
+	array-valued fields are thus excluded from (or, for '!=', always included in) comparisons.
+	:returns: None if no equivalent match expression exists
+	"""
+
+	# Dots are part of the attribute name for SimpleDictArrayFilter, not a path
+	if not f.attribute or '.' in f.attribute or f.attribute.startswith('$'):
+		return None
+
+	# Python and BSON equalities differ for containers and booleans (True == 1)
+	if isinstance(f.value, bool | dict | list | tuple | set | frozenset):
+		return None
+
+	attr = f.attribute
+	if f.type is None:
+
+		# 'is' is only meaningful for None in a db context
+		if f.value is None and f.operator in (operator.is_, operator.is_not):
+			op: None | str = '$eq' if f.operator is operator.is_ else '$ne'
+		else:
+			op = comparison_ops.get(f.operator)
+
+		if op is None:
+			return None
+
+		# Arrays never equal scalars in python, '$ne' also matches missing fields in mongodb
+		if op == '$ne':
+			return {
+				'$and': [
+					{attr: {'$exists': True}},
+					{'$or': [{attr: {'$type': 'array'}}, {attr: {'$ne': f.value}}]}
+				]
+			}
+
+		return {attr: {'$exists': True, '$not': {'$type': 'array'}, op: f.value}}
+
+	if f.type is Sequence and f.operator is operator.contains:
+		# Values stored as BSON arrays
+		q: dict[str, Any] = {'$and': [{attr: {'$type': 'array'}}, {attr: f.value}]}
+		# Strings are sequences too (substring match)
+		if isinstance(f.value, str):
+			return {'$or': [q, {attr: {'$not': {'$type': 'array'}, '$regex': re.escape(f.value)}}]}
+		return q
+
+	return None
+
+
+def filters_query(
+	filters: FilterCriterion | FlatAnyOf[FilterCriterion] | AllOf[FilterCriterion]
+) -> None | dict[str, Any]:
+	"""
+	Translates the filters of a SimpleDictArrayFilter into a match expression for a single array element
+	:returns: None if any of the criteria cannot be translated
+	"""
+
+	if isinstance(filters, FilterCriterion):
+		return criterion_query(filters)
+
+	crits = filters.all_of if isinstance(filters, AllOf) else filters.any_of
+	queries = [criterion_query(f) for f in crits]
+	if None in queries:
+		return None
+
+	return {'$and' if isinstance(filters, AllOf) else '$or': queries}
+
+
+def channel_filter_expr(input_expr: str, channels: Sequence[ChannelId]) -> dict[str, Any]:
+	"""
+	:returns: aggregation expression keeping the elements of the array `input_expr`
+	whose (scalar or array) field 'channel' contains any of the provided channels
+	"""
+	return {
+		'$filter': {
+			'input': input_expr,
+			'cond': {
+				'$gt': [
+					{
+						'$size': {
+							'$setIntersection': [
+								{'$cond': [{'$isArray': '$$this.channel'}, '$$this.channel', ['$$this.channel']]},
+								list(channels)
+							]
+						}
+					},
+					0
+				]
+			}
+		}
+	}
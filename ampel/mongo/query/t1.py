@@ -226,3 +226,89 @@ def latest_general_query(
 		ret.append(project)
 
 	return ret
+
+
+def latest_general_multi_query(
+	stock: StockId | StrictIterable[StockId],
+	channel: None | ChannelId | dict | AllOf[ChannelId] | AnyOf[ChannelId] | OneOf[ChannelId] = None
+) -> list[dict[str, Any]]:
+	"""
+	| Multi-stock version of :func:`latest_general_query`, works with any ampel transients.
+	| The latest state of each stock is selected using the same criteria: \
+	compounds of the tier with the most recent 'added' value are considered, \
+	among which the one with the largest 'len' (tier 0) or 'added' (other tiers) value is returned.
+
+	:param stock: transient id(s), query can/should be performed on multiple ids at once.
+
+	:param channel: single channel or a dict schema. \
+	None (no criterium) means all channel are considered.
+
+	:returns: a list of stages to be used with the mongoDB **aggregation** framework,
+	yielding one document per stock (same output format as :func:`latest_fast_query`).
+	"""
+
+	# Robustness
+	if isinstance(stock, Sequence):
+		if not check_seq_inner_type(stock, type_stock_id):
+			raise ValueError("Elements in stock must be of type str or int or Int64 (bson)")
+	elif not isinstance(stock, type_stock_id):
+		raise ValueError("stock must be of type str or int or Int64 (or sequence of these types)")
+
+	query = {
+		'stock': stock if isinstance(stock, type_stock_id) \
+			else {'$in': stock if isinstance(stock, list) else list(stock)}
+	}
+
+	if channel is not None:
+		apply_schema(query, 'channel', channel)
+
+	return [
+		{
+			'$match': query
+		},
+		{
+			'$group': {
+				'_id': {'stock': '$stock', 'tier': '$tier'},
+				'latestAdded': {'$max': '$added'},
+				'comp': {
+					'$push': {
+						'_id': '$_id',
+						'sortValueUsed': {
+							'$cond': {
+								'if': {'$eq': ['$tier', 0]},
+								'then': '$len',
+								'else': '$added'
+							}
+						}
+					}
+				}
+			}
+		},
+		{
+			'$sort': {'latestAdded': -1}
+		},
+		{
+			'$group': {
+				'_id': '$_id.stock',
+				'comp': {'$first': '$comp'}
+			}
+		},
+		{
+			'$unwind': '$comp'
+		},
+		{
+			'$sort': {'comp.sortValueUsed': -1}
+		},
+		{
+			'$group': {
+				'_id': '$_id',
+				'state': {'$first': '$comp._id'}
+			}
+		},
+		{
+			'$project': {
+				'_id': '$state',
+				'stock': '$_id'
+			}
+		}
+	]
@@ -4,8 +4,8 @@
 # License:             BSD-3-Clause
 # Author:              valery brinnel <firstname.lastname@gmail.com>
 # Date:                29.11.2018
-# Last Modified Date:  16.03.2021
-# Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
+# Last Modified Date:  17.10.2026
+# Last Modified By:    jvs
 
 from collections.abc import Sequence
 from typing import Any, Literal
@@ -23,6 +23,8 @@ class LogsLoader(AmpelFlexModel):
 	Abbreviations:
 	s: stock, a: alert, f: flag, r: run, m: msg, c: channel
 
+	:param unwind: split log documents containing multiple messages into one entry per message.
+		If False, compact log documents are returned as stored (decompactify is then ignored)
 	:param decompactify:
 	:param resolve_flag: load flag int as LogFlag
 		(repr becomes <LogFlag.SCHEDULED_RUN|CORE|T2|INFO: 8836> instead of 8836)
@@ -38,6 +40,7 @@ class LogsLoader(AmpelFlexModel):
 	:param remove_keys: remove key (possible values: 'c', '_id', 's') during projection stage
 	"""
 
+	unwind: bool = True
 	decompactify: bool = True
 	simplify: bool = False
 	hexify: bool = True
@@ -99,16 +102,17 @@ class LogsLoader(AmpelFlexModel):
 		#  'r': 714,
 		#  'c': 3,
 		#  'm': 'msg2'},
-		stages.append(
-			{
-				'$unwind': {
-					'path': '$m',
-					'preserveNullAndEmptyArrays': True
+		if self.unwind:
+			stages.append(
+				{
+					'$unwind': {
+						'path': '$m',
+						'preserveNullAndEmptyArrays': True
+					}
 				}
-			}
-		)
+			)
 
-		if self.decompactify:
+		if self.unwind and self.decompactify:
 
 			# Converts
 			#  {'_id': ObjectId('5c80d71154048002ca372208'),
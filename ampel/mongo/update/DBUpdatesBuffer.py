@@ -8,19 +8,22 @@
 # Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
 
 from collections.abc import Callable, Generator, Iterable, Iterator, Mapping
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import Future, ThreadPoolExecutor
 from contextlib import contextmanager
-from threading import Event, Lock
+from threading import Event, Lock, Semaphore
+from time import perf_counter
 from typing import Any, Literal
 
 from pymongo import InsertOne, UpdateMany, UpdateOne
 from pymongo.collection import Collection
 from pymongo.errors import BulkWriteError
+from pymongo.write_concern import WriteConcern
 
 from ampel.core.AmpelDB import AmpelDB, intcol
 from ampel.log.AmpelLogger import AmpelLogger
 from ampel.log.utils import convert_dollars, report_error, report_exception
 from ampel.metrics.AmpelMetricsRegistry import AmpelMetricsRegistry
+from ampel.mongo.utils import coalesce_updates
 
 DBOp = UpdateOne | UpdateMany | InsertOne
 AmpelMainCol = Literal['stock', 't0', 't1', 't2', 't3']
@@ -45,6 +48,25 @@ stat_db_time = AmpelMetricsRegistry.histogram(
 	subsystem="db",
 	labelnames=("col",)
 )
+stat_db_coalesce_ratio = AmpelMetricsRegistry.histogram(
+	"coalesce_ratio",
+	"Ratio of buffered to submitted operations when coalescing is enabled",
+	subsystem="db",
+	labelnames=("col",),
+	buckets=(1, 1.25, 1.5, 2, 3, 5, 10, 20, 50, float("inf"))
+)
+stat_db_inflight = AmpelMetricsRegistry.gauge(
+	"inflight_ops",
+	"Number of submitted operations not yet written",
+	subsystem="db",
+	labelnames=("col",)
+)
+stat_db_blocked = AmpelMetricsRegistry.histogram(
+	"blocked",
+	"Time spent by producers waiting for a free slot in the pipeline of in-flight buffers",
+	unit="seconds",
+	subsystem="db"
+)
 
 class DBUpdatesBuffer:
 	"""
@@ -91,7 +113,11 @@ class DBUpdatesBuffer:
 		log_doc_ids: None | Iterable[int] = None,
 		push_interval: None | float = 3,
 		max_size: None | int = None,
-		raise_exc: bool = False
+		raise_exc: bool = False,
+		write_concern: None | WriteConcern = None,
+		coalesce: bool = False,
+		pipeline_depth: int = 1,
+		dup_key_retries: int = 3
 	):
 		"""
 		:param error_callback: callback method to be called on errors
@@ -112,6 +138,18 @@ class DBUpdatesBuffer:
 		The provided integer number defines the size of the thread pool. Note that no real performance gain
 		was yet noticed using a meaningful value such as 4 (OSX, python 3.8.1). Since bulk_write drops the GIL,
 		a multithreading-like effect already occurs without the specific use a threads.
+		:param write_concern: if provided, bulk writes are performed using this write concern
+		rather than the one of the collections returned by AmpelDB.
+		:param coalesce: merge buffered UpdateOne operations targeting the same document
+		(see :func:`~ampel.mongo.utils.coalesce_updates`) before bulk writes,
+		reducing the number of write operations and oplog entries.
+		:param pipeline_depth: max number of buffers being written concurrently.
+		Each collection has a dedicated writer thread (buffers are written in order),
+		writes to different collections happen in parallel. Updates can be buffered while
+		previous buffers are being written, the producer (see :func:`check_push`)
+		is blocked only once ``pipeline_depth`` buffers are in flight.
+		:param dup_key_retries: max number of bulk writes used to replay operations
+		that failed because of concurrent upserts (duplicate key errors)
 		"""
 
 		self._new_buffer()
@@ -123,6 +161,12 @@ class DBUpdatesBuffer:
 			for col_name in self.db_ops
 		}
 
+		if write_concern:
+			self._cols = {
+				k: col.with_options(write_concern=write_concern)
+				for k, col in self._cols.items()
+			}
+
 		self.stats: dict[AmpelMainCol, int] = {
 			'stock': 0, 't0': 0, 't1': 0, 't2': 0,
 		}
@@ -138,13 +182,22 @@ class DBUpdatesBuffer:
 		self._push = Event()
 		# prevent autopush while we are in the group_updates context
 		self._block_autopush = Lock()
-		self._pushing = Lock()
+		# free slots for in-flight buffers
+		self._slots = Semaphore(pipeline_depth)
+		# exception raised while writing an in-flight buffer
+		self._write_exc: None | BaseException = None
 		# signal update pusher thread to stop
 		self._stop = Event()
 		self._exec = ThreadPoolExecutor()
+		# single threaded executors preserve the order of writes (per collection)
+		# and of acknowledgements
+		self._writers = {col_name: ThreadPoolExecutor(1) for col_name in self.db_ops}
+		self._completer = ThreadPoolExecutor(1)
 
 		self.push_interval = push_interval
 		self.raise_exc = raise_exc
+		self.coalesce = coalesce
+		self.dup_key_retries = dup_key_retries
 
 
 	def _new_buffer(self) -> None:
@@ -165,7 +218,7 @@ class DBUpdatesBuffer:
 			while not self._stop.is_set():
 				self._push.wait(self.push_interval)
 				self._push.clear()
-				self.push_updates(force=True)
+				self.push_updates(force=True, wait=False)
 		self._task = self._exec.submit(task)
 	
 	def __exit__(self, exc_type: type[BaseException], exc_value: BaseException, traceback: Any) -> None:
@@ -241,13 +294,22 @@ class DBUpdatesBuffer:
 			len(v) > self.max_size
 			for v in self.db_ops.values()
 		):
-			# block until the previous buffer is pushed, then signal the thread
-			# to swap and push the new one
-			with self._pushing:
-				self._push.set()
+			# block until a slot is available in the pipeline of in-flight buffers,
+			# then signal the thread to swap and push the current one
+			if not self._slots.acquire(blocking=False):
+				start = perf_counter()
+				self._slots.acquire()
+				stat_db_blocked.observe(perf_counter() - start)
+			self._slots.release()
+			self._push.set()
 
 
-	def push_updates(self, force: bool = False) -> None:
+	def push_updates(self, force: bool = False, wait: bool = True) -> None:
+		"""
+		:param wait: wait until the buffer is written (and acknowledged)
+		:raises: exceptions (if raise_exc is True) that occured while writing
+		this buffer (if wait is True) or previous buffers
+		"""
 
 		# swap buffers
 		with self._block_autopush:
@@ -255,12 +317,51 @@ class DBUpdatesBuffer:
 			self._new_buffer()
 
 		# prevent the new buffer from overfilling before bulk writes complete
-		with self._pushing:
-			for _ in self._exec.map(
-				self.call_bulk_write,
-				*zip(*((col_name, ops) for col_name, ops in db_ops.items() if ops), strict=True)
-			):
-				pass
+		self._slots.acquire()
+
+		try:
+			if self.coalesce:
+				for col_name, ops in db_ops.items():
+					if ops:
+						db_ops[col_name] = coalesce_updates(ops)
+						stat_db_coalesce_ratio.labels(col_name).observe(len(ops) / len(db_ops[col_name]))
+
+			futures = []
+			for col_name, ops in db_ops.items():
+				if ops:
+					stat_db_inflight.labels(col_name).inc(len(ops))
+					futures.append(self._writers[col_name].submit(self._write, col_name, ops))
+
+			done = self._completer.submit(self._complete, futures, messages)
+
+		except BaseException:
+			self._slots.release()
+			raise
+
+		if wait:
+			try:
+				done.result()
+			except BaseException:
+				self._write_exc = None
+				raise
+
+		if (exc := self._write_exc) is not None:
+			self._write_exc = None
+			raise exc
+
+
+	def _write(self, col_name: AmpelMainCol, db_ops: list) -> None:
+		try:
+			self.call_bulk_write(col_name, db_ops)
+		finally:
+			stat_db_inflight.labels(col_name).dec(len(db_ops))
+
+
+	def _complete(self, futures: list[Future], messages: list[Any]) -> None:
+		""" Waits for the writes of a buffer to complete and acknowledges the associated messages """
+		try:
+			for f in futures:
+				f.result()
 
 			if self.acknowledge_callback and messages:
 				try:
@@ -270,6 +371,13 @@ class DBUpdatesBuffer:
 						raise
 					report_exception(self._ampel_db, self.logger, exc=exc)
 
+		except BaseException as e:
+			self._write_exc = e
+			raise
+
+		finally:
+			self._slots.release()
+
 
 	def call_bulk_write(self, col_name: AmpelMainCol, db_ops: list, *, extra: None | dict = None) -> None:
 		"""
@@ -327,40 +435,25 @@ class DBUpdatesBuffer:
 				try:
 
 					dup_key_only = True
+					dup_key_ops: list[UpdateOne] = []
 
 					for err_dict in bwe.details.get('writeErrors', []):
 
 						stat_db_errors.labels(col_name).inc()
 						# 'code': 11000, 'errmsg': 'E11000 duplicate key error collection: ...
 						if err_dict.get("code") == 11000:
-
-							self.logger.info(
-								f"Race condition during ingestion in '{col_name}': {err_dict}"
-							)
-							self.logger.flush()
-
-							# Should no longer raise pymongo.errors.DuplicateKeyError
-							self._cols[col_name].update_one(
-								err_dict['op']['q'],
-								err_dict['op']['u'],
-								upsert=err_dict['op']['upsert']
+							dup_key_ops.append(
+								UpdateOne(
+									err_dict['op']['q'],
+									err_dict['op']['u'],
+									upsert=err_dict['op']['upsert']
+								)
 							)
-							stat_db_ops.labels(col_name).inc()
 
 						else:
 
 							dup_key_only = False
-							self._err_db_ops[col_name].append(err_dict)
-
-							# Try to insert doc into trouble collection (raises no exception)
-							# Possible exception will be logged out to console in any case
-							report_error(
-								self._ampel_db, msg="BulkWriteError entry details",
-								logger=self.logger, info={
-									'run': self.run_id,
-									'err': convert_dollars(err_dict)
-								}
-							)
+							self._report_write_error(col_name, err_dict)
 
 							################################
 							# TODO: better than this.
@@ -371,6 +464,10 @@ class DBUpdatesBuffer:
 							if self.raise_exc:
 								raise
 
+					# Should no longer raise pymongo.errors.DuplicateKeyError
+					if dup_key_ops and not self._replay_dup_key_ops(col_name, dup_key_ops):
+						dup_key_only = False
+
 					if dup_key_only:
 						self.logger.debug(
 							f"Race condition(s) recovered: {len(bwe.details.get('writeErrors', []))}",
@@ -399,6 +496,66 @@ class DBUpdatesBuffer:
 				self.error_callback()
 
 
+	def _replay_dup_key_ops(self, col_name: AmpelMainCol, ops: list[UpdateOne]) -> bool:
+		"""
+		Replays operations that failed because of concurrent upserts (E11000)
+		using unordered bulk writes (at most ``dup_key_retries`` times).
+		:returns: True if all operations were eventually applied
+		"""
+
+		n = len(ops)
+		col = self._cols[col_name]
+
+		for _ in range(self.dup_key_retries):
+
+			try:
+				col.bulk_write(ops, ordered=False)
+				stat_db_ops.labels(col_name).inc(len(ops))
+				ops = []
+				break
+
+			except BulkWriteError as bwe:
+
+				errs = bwe.details.get('writeErrors', [])
+				stat_db_ops.labels(col_name).inc(len(ops) - len(errs))
+				stat_db_errors.labels(col_name).inc(len(errs))
+
+				dup_key_only = True
+				for err_dict in errs:
+					if err_dict.get("code") != 11000:
+						dup_key_only = False
+						self._report_write_error(col_name, err_dict)
+						if self.raise_exc:
+							raise
+
+				ops = [ops[err_dict['index']] for err_dict in errs]
+				if not dup_key_only:
+					break
+
+		self.logger.info(
+			f"Race condition(s) during ingestion in '{col_name}': "
+			f"{n} duplicate key error(s), {n - len(ops)} recovered"
+		)
+		self.logger.flush()
+
+		return not ops
+
+
+	def _report_write_error(self, col_name: AmpelMainCol, err_dict: dict[str, Any]) -> None:
+
+		self._err_db_ops[col_name].append(err_dict)
+
+		# Try to insert doc into trouble collection (raises no exception)
+		# Possible exception will be logged out to console in any case
+		report_error(
+			self._ampel_db, msg="BulkWriteError entry details",
+			logger=self.logger, info={
+				'run': self.run_id,
+				'err': convert_dollars(err_dict)
+			}
+		)
+
+
 	def _build_log_extra(self,
 		col_name: str,
 		ops: list[DBOp],
@@ -31,6 +31,10 @@ class _StockIngester:
 class _UpdatesBufferModel(AmpelBaseModel):
     max_size: int = 500
     push_interval: float = 3
+    #: merge buffered updates of identical documents before bulk writes
+    coalesce: bool = False
+    #: max number of buffers being written concurrently
+    pipeline_depth: int = 1
 
 class MongoIngester(AbsIngester):
 
@@ -52,6 +56,8 @@ class MongoIngester(AbsIngester):
             max_size=self.updates_buffer.max_size,
             push_interval=self.updates_buffer.push_interval,
             raise_exc=self.raise_exc,
+            coalesce=self.updates_buffer.coalesce,
+            pipeline_depth=self.updates_buffer.pipeline_depth,
         )
 
         stock_updater = MongoStockUpdater(
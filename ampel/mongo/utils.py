@@ -8,8 +8,12 @@
 # Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
 
 from collections.abc import Sequence
+from datetime import datetime
 from typing import Any
 
+from bson import encode
+from pymongo import UpdateOne
+
 from ampel.types import StrictIterable, strict_iterable
 
 
@@ -87,3 +91,153 @@ def get_ids(col: Any, *, filter_stage: None | dict = None) -> set[Any]:
 	if res := next(col.aggregate(agg), None):
 		return set(res['ids'])
 	return set()
+
+
+# Update operators supported by coalesce_updates()
+_mergeable_ops = {'$addToSet', '$push', '$max', '$min', '$set', '$setOnInsert', '$unset'}
+
+
+def coalesce_updates(ops: list[Any]) -> list[Any]:
+	"""
+	Merges UpdateOne operations with identical filters (and upsert flag) into a single operation.
+	Supported operators: $addToSet, $push (values are concatenated using $each), $max, $min,
+	$set, $unset (last value wins) and $setOnInsert (first value wins, as subsequent upserts
+	cannot insert the document anymore).
+	Operations making use of other operators, modifiers ($slice, $position, ...), options
+	(collation, array filters, hint, sort) or aggregation pipelines are left untouched,
+	as are operations whose merge would result in conflicting update paths.
+	Merged operations take the position of the first operation of their group, which ends
+	with any operation sharing its filter that cannot be merged into it (order is preserved).
+	Provided operations are not modified.
+
+	coalesce_updates([
+		UpdateOne({'id': 1}, {'$addToSet': {'channel': 'A'}, '$push': {'meta': {'run': 1}}}, upsert=True),
+		UpdateOne({'id': 1}, {'$addToSet': {'channel': 'B'}, '$push': {'meta': {'run': 2}}}, upsert=True)
+	]) -> [
+		UpdateOne(
+			{'id': 1},
+			{
+				'$addToSet': {'channel': {'$each': ['A', 'B']}},
+				'$push': {'meta': {'$each': [{'run': 1}, {'run': 2}]}}
+			},
+			upsert=True
+		)
+	]
+	"""
+
+	ret: list[Any] = []
+
+	# key: encoded filter, value: (position in ret, update, merged)
+	groups: dict[bytes, tuple[int, dict[str, Any], bool]] = {}
+
+	def close(k: bytes) -> None:
+		if (g := groups.pop(k, None)) and g[2]:
+			i = g[0]
+			ret[i] = UpdateOne(ret[i]._filter, g[1], upsert=ret[i]._upsert)  # noqa: SLF001
+
+	for op in ops:
+
+		if not _is_mergeable(op):
+			# Subsequent operations with the same filter cannot be moved ahead of op
+			if (f := getattr(op, '_filter', None)) is not None:
+				close(encode(f))
+			ret.append(op)
+			continue
+
+		k = encode(op._filter)  # noqa: SLF001
+		if k in groups:
+			i, upd, merged = groups[k]
+			if ret[i]._upsert == op._upsert:  # noqa: SLF001
+				if not merged: # copy on first merge
+					upd = {key: dict(v) for key, v in upd.items()}
+				if _merge_update(upd, op._doc):  # noqa: SLF001
+					groups[k] = i, upd, True
+					continue
+			# Conflicting update, subsequent operations will be merged into the present one
+			close(k)
+
+		groups[k] = len(ret), op._doc, False  # noqa: SLF001
+		ret.append(op)
+
+	for k in list(groups):
+		close(k)
+
+	return ret
+
+
+def _is_mergeable(op: Any) -> bool:
+
+	if not (
+		isinstance(op, UpdateOne) and isinstance(op._doc, dict) and  # noqa: SLF001
+		op._collation is None and op._array_filters is None and  # noqa: SLF001
+		op._hint is None and getattr(op, '_sort', None) is None  # noqa: SLF001
+	):
+		return False
+
+	for k, v in op._doc.items():  # noqa: SLF001
+		if k not in _mergeable_ops or not isinstance(v, dict):
+			return False
+		if k in ('$addToSet', '$push'):
+			for el in v.values():
+				# $each is the only supported modifier
+				if isinstance(el, dict) and any(x[0] == '$' for x in el) and el.keys() != {'$each'}:
+					return False
+
+	return True
+
+
+def _each(v: Any) -> list[Any]:
+	if isinstance(v, dict) and '$each' in v:
+		return list(v['$each'])
+	return [v]
+
+
+def _merge_update(dst: dict[str, Any], src: dict[str, Any]) -> bool:
+	"""
+	Merges update document src into dst (in place)
+	:returns: False (and leaves dst untouched) if updates cannot be merged
+	"""
+
+	# Check for conflicting paths (the same path cannot be updated by different operators)
+	paths = {path: k for k, v in dst.items() for path in v}
+	for k, v in src.items():
+		if k == '$setOnInsert':
+			continue
+		for path in v:
+			if path in paths:
+				if paths[path] != k:
+					return False
+				if k in ('$max', '$min') and (
+					type(dst[k][path]) is not type(v[path]) or
+					not isinstance(v[path], int | float | str | datetime)
+				):
+					return False
+			elif any(path.startswith(p + '.') or p.startswith(path + '.') for p in paths):
+				return False
+
+	for k, v in src.items():
+
+		if k == '$setOnInsert':
+			continue
+
+		d = dst.setdefault(k, {})
+		for path, val in v.items():
+			if path not in d or k in ('$set', '$unset'):
+				d[path] = val
+			elif k == '$max':
+				d[path] = max(d[path], val)
+			elif k == '$min':
+				d[path] = min(d[path], val)
+			elif k == '$push':
+				d[path] = {'$each': _each(d[path]) + _each(val)}
+			else: # $addToSet
+				vals = _each(d[path])
+				# python equality differs from BSON equality (True == 1, key order of dicts)
+				seen = {encode({'v': x}) for x in vals}
+				for x in _each(val):
+					if (b := encode({'v': x})) not in seen:
+						seen.add(b)
+						vals.append(x)
+				d[path] = vals[0] if len(vals) == 1 else {'$each': vals}
+
+	return True
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# File:                Ampel-core/ampel/mongo/view/LazyFrozenDict.py
+# License:             BSD-3-Clause
+# Author:              jvs
+# Date:                17.10.2026
+# Last Modified Date:  17.10.2026
+# Last Modified By:    jvs
+
+from collections.abc import ItemsView, Mapping
+from typing import Any
+
+from bson import decode
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+
+from ampel.mongo.view.FrozenValuesDict import FrozenValuesDict
+from ampel.view.ReadOnlyDict import ReadOnlyDict
+
+
+def freeze(arg: Any, codec_options: CodecOptions) -> Any:
+	if arg.__class__ is list:
+		return (*[_freeze_element(el, codec_options) for el in arg],)
+	return arg
+
+
+def _freeze_element(arg: Any, codec_options: CodecOptions) -> Any:
+	if arg.__class__ is LazyFrozenDict:
+		# Decoded like FrozenValuesDict would (T2DocView for ex. expects dict payloads)
+		return ReadOnlyDict(decode(arg.raw, codec_options.with_options(document_class=FrozenValuesDict)))
+	return freeze(arg, codec_options)
+
+
+def materialize(arg: Any) -> Any:
+	"""
+	:returns: arg, or a copy of it in which LazyFrozenDict instances holding
+	resolved values are replaced by dicts (see :meth:`LazyFrozenDict.materialize`)
+	"""
+	if isinstance(arg, LazyFrozenDict):
+		return arg.materialize()
+	if isinstance(arg, dict):
+		d = {k: materialize(v) for k, v in arg.items()}
+		return arg if all(d[k] is v for k, v in arg.items()) else d
+	if isinstance(arg, list | tuple):
+		l = [materialize(el) for el in arg]
+		return arg if all(a is b for a, b in zip(arg, l, strict=True)) else l
+	return arg
+
+
+class LazyFrozenDict(RawBSONDocument):
+	"""
+	Read-only mapping backed by raw BSON bytes, usable as codec `document_class`
+	in place of :class:`~ampel.mongo.view.FrozenValuesDict.FrozenValuesDict`.
+
+	Fields are decoded on first access, one nesting level at a time:
+	embedded documents are themselves instances of LazyFrozenDict,
+	arrays are returned as tuples. Loading wide documents thereby only costs
+	the decoding of the fields actually read. Instances are Mappings but not dicts,
+	`isinstance(x, dict)` checks fail. Documents embedded in arrays (such as T2 body elements)
+	are thus fully decoded into ReadOnlyDict instances, as with FrozenValuesDict.
+	"""
+
+	__slots__ = ("_resolved",)
+
+	def __init__(self, bson_bytes: bytes | memoryview, codec_options: None | CodecOptions = None) -> None:
+		super().__init__(bson_bytes, codec_options or LAZY_CODEC_OPTIONS)
+		self._resolved: None | dict[str, Any] = None
+
+	@staticmethod
+	def _inflate_bson(bson_bytes: bytes | memoryview, codec_options: CodecOptions) -> Mapping[str, Any]:
+		return {
+			k: freeze(v, codec_options)
+			for k, v in RawBSONDocument._inflate_bson(bson_bytes, codec_options).items() # noqa: SLF001
+		}
+
+	def __getitem__(self, item: str) -> Any:
+		if self._resolved and item in self._resolved:
+			return self._resolved[item]
+		return super().__getitem__(item)
+
+	def items(self) -> ItemsView[str, Any]:
+		return ItemsView(self)
+
+	def resolve(self, key: str, value: Any) -> None:
+		"""
+		Replaces the value of an existing field (ex: config id -> config dict).
+		Raw bytes are left untouched.
+		"""
+		if key not in self:
+			raise KeyError(key)
+		if self._resolved is None:
+			self._resolved = {}
+		self._resolved[key] = value
+
+	def materialize(self) -> Mapping[str, Any]:
+		"""
+		:returns: self if no field was resolved (at any depth), a dict holding the resolved values otherwise.
+		Encoders (bson.encode, pickle) only consider the raw bytes of RawBSONDocument instances.
+		"""
+		inflated = self._RawBSONDocument__inflated_doc # type: ignore[attr-defined]
+		if inflated is None:
+			return self
+		d = {k: materialize(v) for k, v in self.items()}
+		if self._resolved is None and all(d[k] is v for k, v in inflated.items()):
+			return self
+		return d
+
+
+LAZY_CODEC_OPTIONS: CodecOptions = CodecOptions(document_class=LazyFrozenDict)
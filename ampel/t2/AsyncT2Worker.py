@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# File:                Ampel-core/ampel/t2/AsyncT2Worker.py
+# License:             BSD-3-Clause
+# Author:              jvs
+# Date:                17.10.2026
+# Last Modified Date:  17.10.2026
+# Last Modified By:    jvs
+
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextvars import ContextVar
+from inspect import iscoroutinefunction
+from threading import Thread
+from typing import Any
+
+from ampel.content.T2Document import T2Document
+from ampel.core.EventHandler import EventHandler
+from ampel.struct.UnitResult import UnitResult
+from ampel.t2.T2Worker import AbsT2, T2Worker
+from ampel.types import UBson
+
+# Log records emitted by the unit execution associated with the current context
+_records: ContextVar[None | list] = ContextVar('_records', default=None)
+
+
+class AsyncT2Worker(T2Worker):
+	"""
+	T2 worker running units concurrently, suited for I/O-bound units (catalog matching, remote lookups).
+
+	Documents are claimed, their inputs loaded and results committed by the main thread,
+	with the same retry, backoff and journal semantics as :func:`T2Worker.process_doc`.
+	Units implementing `process` as a coroutine function run in an asyncio event loop
+	(background thread). At most `max_in_flight` documents are being processed at any time.
+	Other units run in the main thread, unless `offload_sync_units` is set.
+
+	Log records are buffered per execution and associated with the stock
+	of the processed document, even if the unit instance is shared by concurrent executions.
+
+	Round-trips related to claiming, loading and committing can be reduced
+	using `claim_batch_size`, `prefetch_inputs` and `commit_buffer`.
+	"""
+
+	#: Maximum number of documents processed concurrently
+	max_in_flight: int = 16
+
+	#: Run units implementing a synchronous `process` method in a thread pool.
+	#: Unit instances are shared by concurrent executions, only enable with thread-safe units.
+	offload_sync_units: bool = False
+
+	process_pool_size: None = None
+
+	def __init__(self, **kwargs) -> None:
+		super().__init__(**kwargs)
+		self._pool_backlog = self.max_in_flight
+		self._loop: None | asyncio.AbstractEventLoop = None
+
+
+	def proceed(self, event_hdlr: EventHandler) -> int:
+
+		loop = asyncio.new_event_loop()
+		thread = Thread(target=loop.run_forever, daemon=True)
+		thread.start()
+
+		# Threads are only started if units are offloaded
+		with ThreadPoolExecutor(self.max_in_flight) as pool:
+			self._pool, self._loop = pool, loop
+			try:
+				return super().proceed(event_hdlr)
+			finally:
+				self._pool, self._loop = None, None
+				self._dispatched.clear()
+				loop.call_soon_threadsafe(loop.stop)
+				thread.join()
+				loop.close()
+
+
+	def submit(self, doc: T2Document, t2_unit: AbsT2, args: Any) -> Future:
+
+		_route_records(t2_unit)
+
+		if iscoroutinefunction(t2_unit.process):
+			return asyncio.run_coroutine_threadsafe(
+				self._process_async(t2_unit, args),
+				self._loop # type: ignore[arg-type]
+			)
+
+		if self.offload_sync_units:
+			return self._pool.submit(self._process, t2_unit, args) # type: ignore[union-attr]
+
+		future: Future = Future()
+		try:
+			future.set_result(self._process(t2_unit, args))
+		except Exception as e:
+			future.set_exception(e)
+		return future
+
+
+	@staticmethod
+	async def _process_async(t2_unit: AbsT2, args: Any) -> tuple[UBson | UnitResult, list]:
+		# Each task runs in a copy of the current context
+		records: list = []
+		_records.set(records)
+		return await t2_unit.process(*args), records # type: ignore[misc]
+
+
+	@staticmethod
+	def _process(t2_unit: AbsT2, args: Any) -> tuple[UBson | UnitResult, list]:
+		records: list = []
+		token = _records.set(records)
+		try:
+			return t2_unit.process(*args), records
+		finally:
+			_records.reset(token)
+
+
+class _ExecutionRecordRouter:
+	"""
+	Replaces the record buffering handler of a unit logger.
+	Records emitted during an execution started by :class:`AsyncT2Worker`
+	are buffered per execution, others are passed on to the original handler.
+	"""
+
+	__slots__ = 'hdlr', 'level'
+
+	def __init__(self, hdlr: Any) -> None:
+		self.hdlr = hdlr
+		self.level = hdlr.level
+
+
+	def handle(self, record: Any) -> None:
+		if (records := _records.get()) is None:
+			self.hdlr.handle(record)
+		elif record.levelno >= self.level:
+			records.append(record)
+
+
+	def flush(self) -> None:
+		pass
+
+
+def _route_records(t2_unit: AbsT2) -> None:
+	handlers = t2_unit.logger.handlers
+	for i, h in enumerate(handlers):
+		if h is t2_unit._buf_hdlr: # type: ignore[union-attr]  # noqa: SLF001
+			handlers[i] = _ExecutionRecordRouter(h)
+			return
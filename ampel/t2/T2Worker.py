@@ -7,9 +7,14 @@
 # Last Modified Date:  28.08.2022
 # Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
 
+import pickle
 import random
+from collections import deque
 from collections.abc import Generator, Sequence
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from copy import deepcopy
 from math import ceil
+from multiprocessing import get_context
 from time import time
 from typing import Any, ClassVar, Literal, Union, overload
 
@@ -33,6 +38,7 @@ from ampel.content.MetaRecord import MetaRecord
 from ampel.content.StockDocument import StockDocument
 from ampel.content.T1Document import T1Document
 from ampel.content.T2Document import T2Document
+from ampel.core.EventHandler import EventHandler
 from ampel.enum.DocumentCode import DocumentCode
 from ampel.enum.JournalActionCode import JournalActionCode
 from ampel.enum.MetaActionCode import MetaActionCode
@@ -116,7 +122,21 @@ class T2Worker(AbsWorker[T2Document]):
 		DocumentCode.TOO_MANY_TRIALS,
 	]
 
-	def __init__(self, **kwargs):
+	#: When claiming documents in batches, load the T1 documents and datapoints
+	#: required by the state T2s of a whole batch using one query per collection.
+	#: Inputs are kept in a cache living until the next batch is claimed (units receive copies).
+	#: Has no effect unless claim_batch_size > 1.
+	prefetch_inputs: bool = False
+
+	#: Number of processes used to run t2 units (opt-in mode suited for CPU-bound units).
+	#: Documents are still claimed, their inputs loaded and results committed by the main process,
+	#: but the execution of unit.process() is submitted to a pool of persistent processes
+	#: holding unit instances. Pending results are committed before the inputs of tied units
+	#: are loaded, and dependencies of tied units (run_dependent_t2s) are processed in the
+	#: main process. Units, their inputs and results must be picklable.
+	process_pool_size: None | int = None
+
+	def __init__(self, **kwargs) -> None:
 		super().__init__(**kwargs)
 		self._backoff_on_retry = {
 			code: backoff
@@ -124,6 +144,14 @@ class T2Worker(AbsWorker[T2Document]):
 			for code in backoff.code_match
 		}
 		self._pending_codes = set(self.pending_codes)
+		self._t1_cache: dict[tuple[StockId, T2Link], T1Document] = {}
+		self._t0_cache: dict[DataPointId, DataPoint] = {}
+
+		# Process pool execution mode (see also AsyncT2Worker)
+		self._pool: None | Executor = None
+		self._pool_backlog = 2 * (self.process_pool_size or 1)
+		self._pickled_units: dict[str, bytes] = {}
+		self._dispatched: deque[tuple[Future, T2Document, AbsT2, int, float, AbsIngester, AmpelLogger]] = deque()
 
 
 	def _get_trials(self, doc: T2Document):
@@ -157,12 +185,138 @@ class T2Worker(AbsWorker[T2Document]):
 
 		before_run = time()
 
+		if (t2_unit := self._get_t2_unit(doc, ingester, logger)) is None:
+			return None, DocumentCode.EXCEPTION
+
+		if (trials := self._get_trials(doc)) <= self.max_try:
+			with stat_time.labels(doc["unit"], "run").time():
+				ret = self.run_t2_unit(t2_unit, doc, logger, ingester)
+		else:
+			ret = UnitResult(code=DocumentCode.TOO_MANY_TRIALS)
+
+		return self.handle_result(doc, t2_unit, ret, trials, before_run, ingester, logger)
+
+
+	def dispatch_doc(self,
+		doc: T2Document,
+		ingester: AbsIngester,
+		logger: AmpelLogger
+	) -> None:
+		"""
+		Loads the inputs of the provided document and submits the execution
+		of the t2 unit to the process pool (if process_pool_size is set).
+		Results are committed in submission order.
+		"""
+
+		if self._pool is None:
+			self.process_doc(doc, ingester, logger)
+			return
+
+		before_run = time()
+
+		if (t2_unit := self._get_t2_unit(doc, ingester, logger)) is None:
+			return
+
+		if (trials := self._get_trials(doc)) > self.max_try:
+			self.handle_result(
+				doc, t2_unit, UnitResult(code=DocumentCode.TOO_MANY_TRIALS),
+				trials, before_run, ingester, logger
+			)
+			return
+
+		# Dependencies of tied units might be among the documents not committed yet
+		if isinstance(t2_unit, AbsTiedT2Unit):
+			self.join_dispatched()
+
+		with stat_time.labels(doc["unit"], "load").time():
+			args = self.get_unit_args(t2_unit, doc, logger, ingester)
+
+		if isinstance(args, UnitResult):
+			self.handle_result(doc, t2_unit, args, trials, before_run, ingester, logger)
+			return
+
+		self._dispatched.append(
+			(self.submit(doc, t2_unit, args), doc, t2_unit, trials, before_run, ingester, logger)
+		)
+
+		# Commit available results (blocks if too many results are pending)
+		while self._dispatched and (
+			len(self._dispatched) > self._pool_backlog or self._dispatched[0][0].done()
+		):
+			self._complete_dispatched(*self._dispatched.popleft())
+
+
+	def submit(self, doc: T2Document, t2_unit: AbsT2, args: Any) -> Future:
+		"""
+		Submits the execution of t2_unit.process(*args) to the pool.
+		Returned futures must resolve to a tuple (unit result, log records to forward).
+		"""
+
+		k = f'{doc["unit"]}_{doc["config"]}'
+		if k not in self._pickled_units:
+			self._pickled_units[k] = pickle.dumps(t2_unit)
+
+		return self._pool.submit(_process_in_pool, k, self._pickled_units[k], args) # type: ignore[union-attr]
+
+
+	def join_dispatched(self) -> None:
+		while self._dispatched:
+			self._complete_dispatched(*self._dispatched.popleft())
+
+
+	def _complete_dispatched(self,
+		future: Future,
+		doc: T2Document,
+		t2_unit: AbsT2,
+		trials: int,
+		before_run: float,
+		ingester: AbsIngester,
+		logger: AmpelLogger
+	) -> None:
+
+		try:
+			ret, records = future.result()
+			if records:
+				t2_unit._buf_hdlr.buffer.extend(records) # type: ignore[union-attr]  # noqa: SLF001
+			if t2_unit._buf_hdlr.buffer: # type: ignore[union-attr]  # noqa: SLF001
+				t2_unit._buf_hdlr.forward(logger, stock=doc['stock']) # type: ignore[union-attr]  # noqa: SLF001
+		except Exception as e:
+			ret = self._unit_exception(e, doc, logger)
+
+		self.handle_result(doc, t2_unit, ret, trials, before_run, ingester, logger)
+
+
+	def proceed(self, event_hdlr: EventHandler) -> int:
+
+		if not self.process_pool_size:
+			return super().proceed(event_hdlr)
+
+		# Note: spawn rather than fork since pymongo clients are not fork-safe
+		with ProcessPoolExecutor(self.process_pool_size, mp_context=get_context('spawn')) as pool:
+			self._pool = pool
+			try:
+				return super().proceed(event_hdlr)
+			finally:
+				self._pool = None
+				self._pickled_units.clear()
+				self._dispatched.clear()
+
+
+	def _get_t2_unit(self,
+		doc: T2Document,
+		ingester: AbsIngester,
+		logger: AmpelLogger
+	) -> None | AbsT2:
+		""" :returns: None if the unit could not be instantiated (error is reported) """
+
 		try:
 			t2_unit = self.get_unit_instance(doc, logger)
 
 			if not isinstance(t2_unit, abs_t2):
 				raise ValueError(f"Unsupported unit: {doc['unit']}")
 
+			return t2_unit
+
 		except Exception as e:
 
 			if self.raise_exc:
@@ -173,13 +327,21 @@ class T2Worker(AbsWorker[T2Document]):
 				meta = self.gen_meta(ingester.run_id, None, 0)
 			)
 
-			return None, DocumentCode.EXCEPTION
+			return None
 
-		if (trials := self._get_trials(doc)) <= self.max_try:
-			with stat_time.labels(doc["unit"], "run").time():
-				ret = self.run_t2_unit(t2_unit, doc, logger, ingester)
-		else:
-			ret = UnitResult(code=DocumentCode.TOO_MANY_TRIALS)
+
+	def handle_result(self,
+		doc: T2Document,
+		t2_unit: AbsT2,
+		ret: UBson | UnitResult,
+		trials: int,
+		before_run: float,
+		ingester: AbsIngester,
+		logger: AmpelLogger
+	) -> tuple[UBson, int]:
+		"""
+		Commits the result of t2 unit execution (document and journal updates)
+		"""
 
 		# Used as timestamp and to compute duration below (using before_run)
 		now = time()
@@ -295,6 +457,45 @@ class T2Worker(AbsWorker[T2Document]):
 
 		return body, code
 
+	def prefetch(self, docs: Sequence[T2Document]) -> None:
+		"""
+		Loads T1 docs and datapoints required by the state T2 documents of the provided batch
+		"""
+		self._t1_cache.clear()
+		self._t0_cache.clear()
+
+		if not self.prefetch_inputs:
+			return
+
+		# 'col' is unset for documents bound to t1 states
+		keys = {
+			(doc['stock'], doc['link'])
+			for doc in docs
+			if doc.get('col', 't1') == 't1' and isinstance(doc['stock'], StockId)
+		}
+
+		if not keys:
+			return
+
+		stocks = list({k[0] for k in keys})
+		for t1_doc in self.col_t1.find(
+			{'stock': maybe_match_array(stocks), 'link': maybe_match_array(list({k[1] for k in keys}))}
+		):
+			if isinstance(t1_doc['stock'], StockId) and (k := (t1_doc['stock'], t1_doc['link'])) in keys:
+				self._t1_cache[k] = t1_doc
+
+		if not self._t1_cache:
+			return
+
+		for dp in self.col_t0.find(
+			{
+				'stock': maybe_match_array(stocks),
+				'id': {'$in': list({dpid for t1_doc in self._t1_cache.values() for dpid in t1_doc['dps']})}
+			}
+		):
+			self._t0_cache[dp['id']] = dp
+
+
 	def load_stock(self, stock: StockId) -> None | StockDocument:
 		"""Load stock document from database"""
 		return next(self.col_stock.find({'stock': stock}), None)
@@ -307,6 +508,15 @@ class T2Worker(AbsWorker[T2Document]):
 
 	def load_t0(self, stock: StockId | Sequence[StockId], t1_dps_ids: DataPointId | Sequence[DataPointId]) -> None | DataPoint | list[DataPoint]:
 		"""Load datapoints from database"""
+		if (
+			self._t0_cache and not isinstance(t1_dps_ids, DataPointId) and
+			all(dpid in self._t0_cache for dpid in t1_dps_ids)
+		):
+			# Copies since callers might alter datapoints shared by several docs of the batch
+			return [
+				deepcopy(dp) for dpid in set(t1_dps_ids)
+				if _match_stock((dp := self._t0_cache[dpid])['stock'], stock)
+			]
 		if isinstance(t1_dps_ids, DataPointId):
 			return next(self.col_t0.find({'stock': stock if isinstance(stock, StockId) else {"$in": stock}, 'id': t1_dps_ids}), None)
 		return list(
@@ -320,6 +530,8 @@ class T2Worker(AbsWorker[T2Document]):
 
 	def load_t1(self, stock: StockId | Sequence[StockId], link: T2Link) -> None | T1Document:
 		"""Load T1 document from database"""
+		if isinstance(stock, StockId) and (t1_doc := self._t1_cache.get((stock, link))):
+			return deepcopy(t1_doc)
 		return next(self.col_t1.find({'stock': stock if isinstance(stock, StockId) else {"$in": stock}, 'link': link}), None)
 	
 	def load_t2(self, query: dict[str, Any], for_update: bool=False) -> Generator[T2Document]:
@@ -398,11 +610,14 @@ class T2Worker(AbsWorker[T2Document]):
 
 			t1_dps_ids = list(t1_doc['dps'])
 
+			# Position of each datapoint in 'dps' (first occurrence, like list.index)
+			dps_pos = {dpid: i for i, dpid in reversed(list(enumerate(t1_dps_ids)))}
+
 			# Sort DPS from DB in the same order than referenced by 'dps' from t1 doc
 			with stat_time.labels(t2_doc["unit"], "load_t0").time():
 				dps = sorted(
 					self.load_t0(stock=t2_doc['stock'], t1_dps_ids=t1_dps_ids),
-					key = lambda dp: t1_dps_ids.index(dp['id'])
+					key = lambda dp: dps_pos[dp['id']]
 				)
 
 			# Should never happen (only in case of ingestion bug)
@@ -414,10 +629,10 @@ class T2Worker(AbsWorker[T2Document]):
 					)
 				return UnitResult(code=DocumentCode.T2_MISSING_INFO)
 
-			if len(dps) != len(set(t1_dps_ids)):
+			if len(dps) != len(dps_pos):
 				missing = sorted(
-					set(t1_dps_ids) - {el['id'] for el in dps},
-					key = t1_dps_ids.index
+					dps_pos.keys() - {el['id'] for el in dps},
+					key = dps_pos.__getitem__
 				)
 				if not self._is_retriable(t2_doc, DocumentCode.T2_MISSING_INFO):
 					report_error(
@@ -702,11 +917,7 @@ class T2Worker(AbsWorker[T2Document]):
 		but let's not be too restrictive here
 		"""
 
-		args: Any = self.load_input_docs(t2_unit, t2_doc, logger, ingester)
-		if args is None:
-			logger.error("Unable to load information required to run t2 unit")
-			return UnitResult(code=DocumentCode.INTERNAL_ERROR)
-
+		args = self.get_unit_args(t2_unit, t2_doc, logger, ingester)
 		if isinstance(args, UnitResult):
 			return args
 
@@ -723,20 +934,66 @@ class T2Worker(AbsWorker[T2Document]):
 			return ret
 
 		except Exception as e:
+			return self._unit_exception(e, t2_doc, logger)
 
-			if self.raise_exc:
-				raise e
 
-			# Record any uncaught exceptions in troubles collection.
-			report_exception(
-				self._ampel_db, logger, exc=e, info={
-					'_id': t2_doc['_id'], # type: ignore[typeddict-item]
-					'unit': t2_doc['unit'],
-					'config': t2_doc['config'],
-					'stock': t2_doc['stock'],
-					'link': t2_doc['link'],
-					'channel': t2_doc['channel']
-				}
-			)
+	def get_unit_args(self,
+		t2_unit: AbsT2, t2_doc: T2Document, logger: AmpelLogger, ingester: AbsIngester,
+	) -> Any:
+		"""
+		:returns: arguments of the t2 unit process() method or UnitResult if inputs could not be loaded
+		"""
+
+		args: Any = self.load_input_docs(t2_unit, t2_doc, logger, ingester)
+		if args is None:
+			logger.error("Unable to load information required to run t2 unit")
+			return UnitResult(code=DocumentCode.INTERNAL_ERROR)
+
+		return args
+
+
+	def _unit_exception(self, e: Exception, t2_doc: T2Document, logger: AmpelLogger) -> UnitResult:
+
+		if self.raise_exc:
+			raise e
+
+		# Record any uncaught exceptions in troubles collection.
+		report_exception(
+			self._ampel_db, logger, exc=e, info={
+				'_id': t2_doc['_id'], # type: ignore[typeddict-item]
+				'unit': t2_doc['unit'],
+				'config': t2_doc['config'],
+				'stock': t2_doc['stock'],
+				'link': t2_doc['link'],
+				'channel': t2_doc['channel']
+			}
+		)
+
+		return UnitResult(code=DocumentCode.EXCEPTION)
+
+
+def _process_in_pool(key: str, unit: bytes, args: Any) -> tuple[UBson | UnitResult, list]:
+	"""
+	Runs in the processes of the T2Worker pool.
+	Unit instances are unpickled once per process and kept for subsequent calls.
+	:returns: unit result and log records emitted by the unit
+	"""
+	if key not in _pool_units:
+		_pool_units[key] = pickle.loads(unit)
+	t2_unit = _pool_units[key]
+	t2_unit._buf_hdlr.clear() # type: ignore[union-attr]  # noqa: SLF001
+	ret = t2_unit.process(*args)
+	return ret, t2_unit._buf_hdlr.buffer # type: ignore[union-attr]  # noqa: SLF001
+
+
+def _match_stock(dp_stock: StockId | Sequence[StockId], stock: StockId | Sequence[StockId]) -> bool:
+	""" :returns: whether the stock query used by :meth:`T2Worker.load_t0` matches a datapoint """
+	if isinstance(dp_stock, StockId):
+		return dp_stock == stock if isinstance(stock, StockId) else dp_stock in stock
+	if isinstance(stock, StockId):
+		return stock in dp_stock
+	return any(s in dp_stock for s in stock)
+
 
-			return UnitResult(code=DocumentCode.EXCEPTION)
+# Unit instances held by the processes of the T2Worker pool
+_pool_units: dict[str, AbsT2] = {}
@@ -33,6 +33,11 @@ class T3Processor(AbsEventUnit):
 	#: Unit must be a subclass of AbsT3Stager
 	stage: Annotated[UnitModel, AbsT3Stager]
 
+	#: Let the supplier apply the selection criteria of the stager, if supported by both
+	#: (see :meth:`AbsT3Stager.get_query_plan <ampel.abstract.AbsT3Stager.AbsT3Stager.get_query_plan>`),
+	#: so that documents discarded by the stager are not loaded in the first place
+	query_pushdown: bool = False
+
 
 	def post_init(self):
 		if self.supply.unit not in self.context.config._config['unit']:  # noqa: SLF001
@@ -101,6 +106,11 @@ class T3Processor(AbsEventUnit):
 				)
 			)
 
+			if self.query_pushdown and supplier.accepts_query_plan() and (plan := stager.get_query_plan()):
+				logger.info("Applying stager query plan")
+				supplier.apply_query_plan(plan)
+				stager.set_query_plan(plan)
+
 			logger.info("Running stager", unit=self.stage.unit)
 
 			if (doc_gen := stager.stage(supplier.supply(t3s), t3s)):
@@ -12,6 +12,7 @@ from collections.abc import Generator, Sequence
 from ampel.abstract.AbsT3Stager import AbsT3Stager
 from ampel.content.T3Document import T3Document
 from ampel.model.t3.T3ProjectionDirective import T3ProjectionDirective
+from ampel.model.t3.T3QueryPlan import T3QueryPlan
 from ampel.model.UnitModel import UnitModel
 from ampel.struct.AmpelBuffer import AmpelBuffer
 from ampel.struct.T3Store import T3Store
@@ -60,6 +61,14 @@ class T3ChannelStager(AbsT3Stager):
 		)
 
 
+	def get_query_plan(self) -> None | T3QueryPlan:
+		return self._stager.get_query_plan()
+
+
+	def set_query_plan(self, plan: T3QueryPlan) -> None:
+		self._stager.set_query_plan(plan)
+
+
 	def stage(self,
 		gen: Generator[AmpelBuffer, None, None],
 		t3s: T3Store
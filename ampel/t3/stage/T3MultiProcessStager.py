@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# File:                Ampel-core/ampel/t3/stage/T3MultiProcessStager.py
+# License:             BSD-3-Clause
+# Author:              jvs
+# Date:                17.10.2026
+# Last Modified Date:  17.10.2026
+# Last Modified By:    jvs
+
+from collections.abc import Generator, Iterable, Sequence
+from itertools import islice
+from multiprocessing import get_context
+from multiprocessing.process import BaseProcess
+from multiprocessing.queues import Queue
+from queue import Empty, Full
+from time import time
+from traceback import format_exc
+from typing import Any, Literal
+
+from ampel.abstract.AbsT3Unit import AbsT3Unit, T3Send
+from ampel.config.AmpelConfig import AmpelConfig
+from ampel.content.T3Document import T3Document
+from ampel.log.AmpelLogger import AmpelLogger
+from ampel.log.handlers.DefaultRecordBufferingHandler import DefaultRecordBufferingHandler
+from ampel.log.LogFlag import LogFlag
+from ampel.model.UnitModel import UnitModel
+from ampel.struct.AmpelBuffer import AmpelBuffer
+from ampel.struct.JournalAttributes import JournalAttributes
+from ampel.struct.StockAttributes import StockAttributes
+from ampel.struct.T3Store import T3Store
+from ampel.t3.stage.BaseViewGenerator import BaseViewGenerator
+from ampel.t3.stage.T3BaseStager import T3BaseStager
+from ampel.types import StockId
+from ampel.util.buffer import pack, unpack
+from ampel.view.SnapView import SnapView
+
+
+class ShardViewGenerator(BaseViewGenerator[SnapView]):
+	"""
+	Used in worker processes: crafts views from the serialized ampel buffers
+	received through the input queue. Journal updates requested by the t3 unit
+	(see :meth:`BaseViewGenerator.send`) are sent back through the output queue
+	once the views of a chunk are consumed.
+	"""
+
+	def __init__(self,
+		unit_name: str, shard: int, View: type[SnapView], conf: AmpelConfig,
+		in_queue: Queue, out_queue: Queue
+	) -> None:
+		super().__init__(unit_name = unit_name, stock_updr = None) # type: ignore[arg-type]
+		self.shard = shard
+		self.View = View
+		self.conf = conf
+		self.in_queue = in_queue
+		self.out_queue = out_queue
+		self.journal: list[tuple[StockId, JournalAttributes | StockAttributes]] = []
+
+
+	def __iter__(self) -> Generator[SnapView, T3Send, None]:
+		vo = self.View.of
+		for data in iter(self.in_queue.get, None):
+			for ab in unpack(data):
+				view = vo(ab, self.conf)
+				self.stocks.append(view.id)
+				yield view
+			self.flush()
+
+
+	def send(self, jt: T3Send):
+		self.journal.append(jt if isinstance(jt, tuple) else (self.stocks[-1], jt))
+
+
+	def flush(self) -> None:
+		if self.journal:
+			self.out_queue.put(('send', self.shard, self.journal))
+			self.journal = []
+
+
+def run_shard(
+	shard: int, Klass: type[AbsT3Unit], init: dict[str, Any], level: int, conf: AmpelConfig,
+	t3s: tuple[Any, Any, dict], in_queue: Queue, out_queue: Queue
+) -> None:
+	""" Worker process target """
+
+	try:
+		buf_hdlr = DefaultRecordBufferingHandler(level)
+		unit = Klass(**init, logger=AmpelLogger(base_flag=LogFlag.UNIT, handlers=[buf_hdlr]))
+		if hasattr(unit, "post_init"):
+			unit.post_init()
+
+		store = T3Store(views=t3s[0], session=t3s[1])
+		store.extra.update(t3s[2])
+
+		gen = ShardViewGenerator(Klass.__name__, shard, Klass._View, conf, in_queue, out_queue) # noqa: SLF001
+		res = unit.process(gen, store)
+		gen.flush()
+		out_queue.put(('done', shard, (res, gen.stocks, buf_hdlr.buffer)))
+
+	except Exception:
+		out_queue.put(('error', shard, format_exc()))
+
+
+class T3MultiProcessStager(T3BaseStager):
+	"""
+	Executes a given (shardable) unit in multiple worker processes (with the same config),
+	circumventing the GIL for CPU-bound t3 units (plotting, model comparisons).
+	Ampel buffers are sent in batches, BSON-serialized, through a shared queue
+	from which idle workers pick up their next batch.
+	Journal updates (see :meth:`BaseViewGenerator.send`) are sent back to the main process,
+	which updates the stock documents.
+
+	Each worker process returns its own unit result, which is handled as usual.
+	Units can alternatively implement a method `merge_shards(self, results: list[UBson | UnitResult])`
+	returning a single result, which is then handled as if the unit had processed all views.
+
+	Notes:
+	- units and their configuration must be picklable, views are crafted in the worker processes
+	- only the stock documents of the views sent to a worker are associated with its result
+	"""
+
+	#: t3 unit (AbsT3Unit) to execute
+	execute: UnitModel
+
+	#: Number of worker processes
+	nproc: int = 4
+
+	#: Number of ampel buffers per batch sent to worker processes
+	batch_size: int = 100
+
+	#: Process start method (None: platform default)
+	start_method: None | Literal['spawn', 'fork', 'forkserver'] = 'spawn'
+
+	#: whether to add the shard index into log 'extra' for verbose purposes
+	log_extra: bool = False
+
+
+	def __init__(self, **kwargs) -> None:
+		super().__init__(**kwargs)
+		self.t3_unit = self.get_unit(self.execute)
+
+
+	def stage(self,
+		gen: Generator[AmpelBuffer, None, None],
+		t3s: T3Store
+	) -> None | Generator[T3Document, None, None]:
+
+		ts = time()
+		unit = self.t3_unit
+		unit_name = unit.__class__.__name__
+		ctx = get_context(self.start_method)
+
+		# Bounded input queue to limit the number of buffers held in memory
+		in_q: Queue = ctx.Queue(2 * self.nproc)
+		out_q: Queue = ctx.Queue()
+
+		init = {k: getattr(unit, k) for k in unit.get_model_keys() if k != 'logger'}
+		store = (t3s.views, dict(t3s.session) if t3s.session else None, t3s.extra)
+		procs = [
+			ctx.Process(
+				target = run_shard,
+				name = f"{unit_name}-{i}",
+				args = (i, unit.__class__, init, self.logger.level, self.context.config, store, in_q, out_q),
+				daemon = True
+			)
+			for i in range(self.nproc)
+		]
+
+		# Applies journal updates requested by t3 units in worker processes
+		vgen: BaseViewGenerator = BaseViewGenerator(unit_name, self.stock_updr)
+		results: dict[int, tuple[Any, list, list]] = {}
+
+		try:
+
+			for p in procs:
+				p.start()
+
+			while (buffers := list(islice(gen, self.batch_size))):
+				self._put(in_q, pack(buffers), out_q, procs, vgen, results)
+
+			# Send sentinels
+			for _ in procs:
+				self._put(in_q, None, out_q, procs, vgen, results)
+
+			while len(results) < self.nproc:
+				if not self._drain(out_q, vgen, results, timeout=0.1):
+					self._check(procs, results, out_q, vgen)
+
+			if self.stock_updr.update_journal:
+				self.stock_updr.flush()
+
+			if (merge := getattr(unit, 'merge_shards', None)):
+				stocks = []
+				for i in range(self.nproc):
+					stocks.extend(results[i][1])
+					unit._buf_hdlr.buffer.extend(results[i][2]) # type: ignore[attr-defined] # noqa: SLF001
+				if (
+					((res := merge([results[i][0] for i in range(self.nproc)])) or self.save_stock_ids) and
+					(x := self.handle_t3_result(unit, res, t3s, stocks, ts))
+				):
+					yield x
+
+			else:
+				for i in range(self.nproc):
+					res, stocks, records = results[i]
+					unit._buf_hdlr.buffer.extend(records) # type: ignore[attr-defined] # noqa: SLF001
+					if (
+						(res or self.save_stock_ids) and
+						(x := self.handle_t3_result(
+							unit, res, t3s, stocks, ts,
+							log_extra={'shard': i} if self.log_extra else None
+						))
+					):
+						yield x
+
+			if self.stock_updr.update_journal:
+				self.stock_updr.flush()
+
+		except Exception as e:
+			if self.stock_updr.update_journal:
+				self.stock_updr.flush()
+			self.event_hdlr.handle_error(e, self.logger)
+
+		finally:
+			# Remaining input batches (if workers stopped early) must not block exit
+			in_q.cancel_join_thread()
+			for p in procs:
+				if p.is_alive():
+					p.terminate()
+				p.join()
+
+		return None
+
+
+	def _put(self,
+		in_q: Queue, item: Any, out_q: Queue, procs: Sequence[BaseProcess],
+		vgen: BaseViewGenerator, results: dict[int, tuple[Any, list, list]]
+	) -> None:
+		""" Puts item into the input queue, processing worker messages while waiting """
+		while True:
+			try:
+				in_q.put(item, timeout=0.1)
+				break
+			except Full:
+				self._drain(out_q, vgen, results)
+				self._check(procs, results, out_q, vgen)
+				# All workers are done (units do not necessarily consume all views)
+				if len(results) == len(procs):
+					return
+		self._drain(out_q, vgen, results)
+
+
+	def _drain(self,
+		out_q: Queue, vgen: BaseViewGenerator,
+		results: dict[int, tuple[Any, list, list]],
+		timeout: None | float = None
+	) -> bool:
+		"""
+		Processes available worker messages.
+		:returns: whether any message was processed
+		"""
+		ret = False
+		while True:
+			try:
+				msg, shard, payload = out_q.get(timeout=timeout) if timeout and not ret else out_q.get_nowait()
+			except Empty:
+				return ret
+			ret = True
+			if msg == 'send':
+				for jt in payload:
+					vgen.send(jt)
+			elif msg == 'done':
+				results[shard] = payload
+			else:
+				raise RuntimeError(f"T3 unit failed in worker process {shard}:\n{payload}")
+
+
+	def _check(self,
+		procs: Iterable[BaseProcess], results: dict[int, tuple[Any, list, list]],
+		out_q: Queue, vgen: BaseViewGenerator
+	) -> None:
+		""" Raises an error if a worker process exited without reporting a result """
+		for i, p in enumerate(procs):
+			if i not in results and not p.is_alive():
+				# Final message might have been sent right before process exit
+				self._drain(out_q, vgen, results, timeout=0.1)
+				if i not in results:
+					raise RuntimeError(f"Worker process {p.name} exited unexpectedly (code {p.exitcode})")
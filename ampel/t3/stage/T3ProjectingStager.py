@@ -21,10 +21,13 @@ from ampel.base.AuxUnitRegister import AuxUnitRegister
 from ampel.content.T3Document import T3Document
 from ampel.log import VERBOSE
 from ampel.model.t3.T3ProjectionDirective import T3ProjectionDirective
+from ampel.model.t3.T3QueryPlan import T3QueryPlan
 from ampel.struct.AmpelBuffer import AmpelBuffer
 from ampel.struct.T3Store import T3Store
 from ampel.struct.UnitResult import UnitResult
+from ampel.t3.stage.filter.T3AmpelBufferFilter import T3AmpelBufferFilter
 from ampel.t3.stage.NoViewGenerator import NoViewGenerator
+from ampel.t3.stage.project.T3ChannelProjector import T3ChannelProjector
 from ampel.t3.stage.SimpleViewGenerator import BaseViewGenerator, SimpleViewGenerator
 from ampel.t3.stage.T3ThreadedStager import T3ThreadedStager
 from ampel.types import StockId, UBson
@@ -97,11 +100,24 @@ class T3ProjectingStager(T3ThreadedStager):
 				if debug:
 					self.logger.debug(f"Setting up projector {directive.project.unit}")
 
+				# Buffers are not shared among run blocks if only one is defined,
+				# projectors can thus modify them in place rather than copying documents
+				kwargs = {}
+				if (
+					len(self.directives) == 1 and
+					not (isinstance(directive.project.config, dict) and 'unalterable' in directive.project.config) and
+					'unalterable' in AuxUnitRegister.get_aux_class(
+						directive.project.unit, sub_type=AbsT3Projector
+					).get_model_keys()
+				):
+					kwargs['unalterable'] = False
+
 				# TODO: provide buffering logger ?
 				rb.projector = AuxUnitRegister.new_unit(
 					model = directive.project,
 					sub_type = AbsT3Projector,
-					logger = self.logger
+					logger = self.logger,
+					**kwargs
 				)
 
 			for exec_def in directive.execute:
@@ -112,6 +128,31 @@ class T3ProjectingStager(T3ThreadedStager):
 			self.run_blocks.append(rb)
 
 
+	def get_query_plan(self) -> None | T3QueryPlan:
+		"""
+		The stock channel criterion and journal filters of T3AmpelBufferFilter,
+		as well as the channel selection of T3ChannelProjector, can be applied by the loader
+		if a single run block is defined (buffers are otherwise shared among run blocks)
+		"""
+
+		if len(self.run_blocks) != 1:
+			return None
+
+		rb = self.run_blocks[0]
+		plan = T3QueryPlan(
+			stock = rb.filter.get_query() if isinstance(rb.filter, T3AmpelBufferFilter) else None,
+			channel = rb.projector.get_channels() if isinstance(rb.projector, T3ChannelProjector) else None
+		)
+
+		return plan if plan.stock or plan.channel else None
+
+
+	def set_query_plan(self, plan: T3QueryPlan) -> None:
+		# Projections are still performed as they also alter documents
+		if plan.stock and isinstance(rb_filter := self.run_blocks[0].filter, T3AmpelBufferFilter):
+			rb_filter.set_pushed_down()
+
+
 	def stage(self,
 		gen: Generator[AmpelBuffer, None, None],
 		t3s: T3Store
@@ -7,9 +7,11 @@
 # Last Modified Date:  03.04.2023
 # Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
 
-from collections.abc import Generator, Iterable, Sequence
+import pickle
+from collections.abc import Generator, Iterable, Iterator, Sequence
+from tempfile import TemporaryFile
 from time import time
-from typing import Annotated
+from typing import IO, Annotated
 
 from ampel.abstract.AbsT3Unit import AbsT3Unit, T
 from ampel.content.T3Document import T3Document
@@ -19,6 +21,7 @@ from ampel.struct.AmpelBuffer import AmpelBuffer
 from ampel.struct.T3Store import T3Store
 from ampel.t3.stage.BaseViewGenerator import BaseViewGenerator, T3Send
 from ampel.t3.stage.T3BaseStager import T3BaseStager
+from ampel.util.buffer import pack, unpack
 from ampel.view.SnapView import SnapView
 from ampel.view.T3DocView import T3DocView
 
@@ -36,6 +39,45 @@ class SimpleGenerator(BaseViewGenerator[T]):
 			yield v
 
 
+class BufferSpill:
+	"""
+	Writes (in chunks) the ampel buffers passing through :meth:`tee` into a file,
+	from which they can be read back afterwards (:meth:`replay`)
+	"""
+
+	def __init__(self, f: IO[bytes], chunk_size: int) -> None:
+		self.f = f
+		self.chunk_size = chunk_size
+		self.chunk: list[AmpelBuffer] = []
+
+	def tee(self, gen: Iterable[AmpelBuffer]) -> Iterator[AmpelBuffer]:
+		for ab in gen:
+			self.chunk.append(ab)
+			if len(self.chunk) >= self.chunk_size:
+				self.write()
+			yield ab
+
+	def write(self) -> None:
+		if self.chunk:
+			pickle.dump(pack(self.chunk), self.f, pickle.HIGHEST_PROTOCOL)
+			self.chunk = []
+
+	def close(self, gen: Iterable[AmpelBuffer]) -> None:
+		""" Spills the buffers not consumed through tee """
+		for _ in self.tee(gen):
+			pass
+		self.write()
+
+	def replay(self) -> Iterator[AmpelBuffer]:
+		self.f.seek(0)
+		while True:
+			try:
+				data = pickle.load(self.f)
+			except EOFError:
+				return
+			yield from unpack(data)
+
+
 class T3SequentialStager(T3BaseStager):
 	"""
 	A stager that calls t3 units 'process' methods sequentially.
@@ -47,10 +89,20 @@ class T3SequentialStager(T3BaseStager):
 	2) Results from upstream t3 units are made available for downstream units
 	through the t3 store instance which is updated after each unit execution
 	unless propagate is set to False
+
+	In streaming mode, views are crafted on the fly instead (step 1).
+	The buffers consumed by the first unit are spilled to a temporary file
+	which downstream units read back, so that memory usage is bounded by chunk_size.
 	"""
 
 	propagate: bool = True
 
+	#: Craft views on the fly rather than holding all of them in memory
+	streaming: bool = False
+
+	#: Directory of the temporary file used in streaming mode (default: system temp directory)
+	spill_dir: None | str = None
+
 	#: t3 units to execute
 	execute: Annotated[Sequence[UnitModel], AbsT3Unit]
 
@@ -76,22 +128,60 @@ class T3SequentialStager(T3BaseStager):
 		t3s: T3Store
 	) -> None | Generator[T3Document, None, None]:
 
+		if self.streaming:
+			yield from self.stream(gen, t3s)
+			return None
+
 		for t3_unit, views in self.get_views(gen).items():
+			yield from self.run_unit(t3_unit, views, t3s)
+
+		return None
 
-			sg = SimpleGenerator(t3_unit, views, self.stock_updr)
-			ts = time()
 
-			if (
-				(ret := t3_unit.process(sg, t3s)) and
-				(x := self.handle_t3_result(t3_unit, ret, t3s, sg.stocks, ts))
-			):
-				if self.propagate:
-					t3s.add_view(
-						T3DocView.of(x, self.context.config)
-					)
-				yield x
+	def run_unit(self,
+		t3_unit: AbsT3Unit,
+		views: Iterable[SnapView],
+		t3s: T3Store
+	) -> Generator[T3Document, None, None]:
 
-		return None
+		sg = SimpleGenerator(t3_unit, views, self.stock_updr)
+		ts = time()
+
+		if (
+			(ret := t3_unit.process(sg, t3s)) and
+			(x := self.handle_t3_result(t3_unit, ret, t3s, sg.stocks, ts))
+		):
+			if self.propagate:
+				t3s.add_view(
+					T3DocView.of(x, self.context.config)
+				)
+			yield x
+
+
+	def stream(self,
+		gen: Generator[AmpelBuffer, None, None],
+		t3s: T3Store
+	) -> Generator[T3Document, None, None]:
+
+		conf = self.context.config
+
+		if len(self.units) == 1:
+			View = self.units[0]._View  # noqa: SLF001
+			yield from self.run_unit(self.units[0], (View.of(ab, conf) for ab in gen), t3s)
+			return
+
+		with TemporaryFile(dir=self.spill_dir) as f:
+
+			spill = BufferSpill(f, self.chunk_size or 1000)
+
+			for i, t3_unit in enumerate(self.units):
+				View = t3_unit._View  # noqa: SLF001
+				buffers = spill.tee(gen) if i == 0 else spill.replay()
+				yield from self.run_unit(t3_unit, (View.of(ab, conf) for ab in buffers), t3s)
+
+				# Downstream units must receive all buffers, even if the first unit stopped early
+				if i == 0:
+					spill.close(gen)
 
 
 	def get_views(self, gen: Generator[AmpelBuffer, None, None]) -> dict[AbsT3Unit, list[SnapView]]:
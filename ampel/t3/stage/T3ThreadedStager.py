@@ -19,6 +19,7 @@ from ampel.struct.AmpelBuffer import AmpelBuffer
 from ampel.struct.T3Store import T3Store
 from ampel.t3.stage.T3BaseStager import T3BaseStager
 from ampel.t3.stage.ThreadedViewGenerator import ThreadedViewGenerator
+from ampel.util.view import freeze_buffer, new_view
 from ampel.view.SnapView import SnapView
 
 
@@ -149,6 +150,8 @@ class T3ThreadedStager(T3BaseStager, abstract=True):
 
 	def put_views(self, buffers: Iterable[AmpelBuffer], qdict: dict[type[SnapView], list[JoinableQueue]]) -> None:
 		"""
+		Each buffer is frozen once (sub-structures already frozen by FrozenValuesDict are reused),
+		views are then crafted once per view type or, in paranoia mode, once per t3 unit.
 		Note: code in here is not optimized for compactness but for execution speed
 		"""
 
@@ -159,35 +162,37 @@ class T3ThreadedStager(T3BaseStager, abstract=True):
 
 			View = next(iter(qdict.keys()))
 			qs = next(iter(qdict.values()))
-			vo = View.of
 
 			# In paranoia mode, we create a new view from the same buffer for each t3 unit
 			if self.paranoia_level:
 				for ab in buffers:
+					fab = freeze_buffer(ab)
 					for q in qs:
-						q.put(vo(ab, conf))
+						q.put(new_view(View, fab, conf))
 			else:
 				for ab in buffers:
-					v = vo(ab, conf)
+					v = new_view(View, freeze_buffer(ab), conf)
 					for q in qs:
 						q.put(v)
 
 		# t3 units are associated with different type of view
 		else:
 
-			# Paranoia or say two units == two view types (non-optimizable)
 			itms = qdict.items()
-			if self.paranoia_level or all(len(x) == 1 for x in qdict.values()):
+
+			# Paranoia: one view per unit
+			if self.paranoia_level:
 				for ab in buffers:
+					fab = freeze_buffer(ab)
 					for View, qs in itms:
-						vo = View.of
 						for q in qs:
-							q.put(vo(ab, conf))
+							q.put(new_view(View, fab, conf))
 
-			# Optimize by potentially grouping units associated with the same view type
+			# Views are shared by units associated with the same view type
 			else:
 				for ab in buffers:
+					fab = freeze_buffer(ab)
 					for View, qs in itms:
-						view = View.of(ab, conf)
+						view = new_view(View, fab, conf)
 						for q in qs:
 							q.put(view)
@@ -9,10 +9,11 @@
 
 import collections
 from collections.abc import Iterable, Sequence
-from typing import Literal, get_args
+from typing import Any, Literal, get_args
 
 from ampel.abstract.AbsT3Filter import AbsT3Filter
 from ampel.aux.filter.AbsLogicOperatorFilter import AbsLogicOperatorFilter
+from ampel.aux.filter.SimpleDictArrayFilter import SimpleDictArrayFilter
 from ampel.base.AmpelBaseModel import AmpelBaseModel
 from ampel.base.AuxUnitRegister import AuxUnitRegister
 from ampel.log.AmpelLogger import AmpelLogger
@@ -20,6 +21,8 @@ from ampel.model.operator.AllOf import AllOf
 from ampel.model.operator.AnyOf import AnyOf
 from ampel.model.operator.OneOf import OneOf
 from ampel.model.UnitModel import UnitModel
+from ampel.mongo.query.filter import filters_query
+from ampel.mongo.schema import apply_schema
 from ampel.struct.AmpelBuffer import AmpelBuffer, BufferKey
 from ampel.types import ChannelId
 
@@ -32,10 +35,10 @@ class FilterBlock(AmpelBaseModel):
 	filter: AbsLogicOperatorFilter
 	include: bool = True
 
-	def __init__(self, **kwargs):
-		AmpelBaseModel.__init__(self, **kwargs)
+	@property
+	def descr(self) -> str:
 		typ = "include" if self.include else "exclude"
-		self.descr = f"{self.filter.__class__.__name__}[target={self.data}, on_match={typ}]"
+		return f"{self.filter.__class__.__name__}[target={self.data}, on_match={typ}]"
 
 
 class T3AmpelBufferFilter(AbsT3Filter):
@@ -63,12 +66,58 @@ class T3AmpelBufferFilter(AbsT3Filter):
 			self.filter_blocks.append(
 				FilterBlock(
 					data = f.data,
-					filter = AuxUnitRegister.new_unit(f.filter),
+					filter = AuxUnitRegister.new_unit(f.filter, sub_type=AbsLogicOperatorFilter),
 					include = f.on_match == "include"
 				)
 			)
 
 
+	def get_query(self) -> None | dict[str, Any]:
+		"""
+		:returns: match expression on stock documents equivalent to the channel criterion
+		and to the journal filter blocks (SimpleDictArrayFilter) of this instance,
+		or None if none of them can be translated. Other filter blocks are not translatable
+		since they apply to other collections.
+		"""
+
+		query: list[dict[str, Any]] = []
+
+		if self.channel:
+			if isinstance(self.channel, OneOf):
+				query.append({'channel': {'$size': 1, '$in': self.channel.one_of}})
+			else:
+				query.append(apply_schema({}, 'channel', self.channel))
+
+		for q, fb in self._translate():
+			if q is not None:
+				query.append({'journal': {'$elemMatch': q} if fb.include else {'$not': {'$elemMatch': q}}})
+
+		if not query:
+			return None
+
+		return query[0] if len(query) == 1 else {'$and': query}
+
+
+	def set_pushed_down(self) -> None:
+		"""
+		To be called when the query returned by :meth:`get_query` is applied by the loader:
+		the corresponding criteria are then not evaluated anymore by :meth:`filter`
+		"""
+		self.channel = None
+		self.filter_blocks = [fb for q, fb in self._translate() if q is None]
+
+
+	def _translate(self) -> list[tuple[None | dict[str, Any], FilterBlock]]:
+		return [
+			(
+				filters_query(fb.filter.filters)
+				if fb.data == 'journal' and type(fb.filter) is SimpleDictArrayFilter else None,
+				fb
+			)
+			for fb in self.filter_blocks
+		]
+
+
 	def filter(self, it: Iterable[AmpelBuffer]) -> Sequence[AmpelBuffer]:
 
 		debug = self.logger.verbose > 1
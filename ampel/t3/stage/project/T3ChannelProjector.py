@@ -4,10 +4,10 @@
 # License:             BSD-3-Clause
 # Author:              valery brinnel <firstname.lastname@gmail.com>
 # Date:                07.01.2020
-# Last Modified Date:  22.11.2020
-# Last Modified By:    Jakob van Santen <jakob.van.santen@desy.de>
+# Last Modified Date:  17.10.2026
+# Last Modified By:    jvs
 
-from collections.abc import Sequence
+from collections.abc import Iterable, Sequence
 from typing import Any
 
 from ampel.aux.ComboDictModifier import ComboDictModifier
@@ -15,12 +15,24 @@ from ampel.log import VERBOSE
 from ampel.model.operator.AllOf import AllOf
 from ampel.model.operator.AnyOf import AnyOf
 from ampel.model.operator.OneOf import OneOf
+from ampel.mongo.view.LazyFrozenDict import LazyFrozenDict
+from ampel.struct.AmpelBuffer import AmpelBuffer
 from ampel.t3.stage.project.T3BaseProjector import T3BaseProjector
 from ampel.types import ChannelId
 from ampel.util.logicschema import reduce_to_set
+from ampel.view.ReadOnlyDict import ReadOnlyDict
 
 
 class T3ChannelProjector(T3BaseProjector):
+	"""
+	Restricts ampel buffers to the information associated with the configured channel(s):
+	t1/t2 documents and journal entries of other channels are discarded,
+	the channel, journal and ts fields of stock documents are projected.
+
+	Buffers are processed in a single pass (unless other field projectors are configured
+	or verbose logging is enabled). Documents whose channels need not be projected are reused,
+	projected channel values are computed once per distinct channel combination.
+	"""
 
 	channel: ChannelId | AllOf[ChannelId] | AnyOf[ChannelId] | OneOf[ChannelId]
 
@@ -47,6 +59,10 @@ class T3ChannelProjector(T3BaseProjector):
 			self.logger.log(VERBOSE, f"Setting up channel project for '{self.channel}'")
 		self._channel_set: set[ChannelId] = reduce_to_set(self.channel)
 
+		# Projected channel values by input channel combination
+		# (None: discarded, boolean flag: all channels are kept)
+		self._channel_cache: dict[tuple[ChannelId, ...], tuple[bool, None | ChannelId | tuple[ChannelId, ...]]] = {}
+
 		journal_modifier = ComboDictModifier(
 			logger = self.logger,
 			unalterable = self.unalterable,
@@ -66,10 +82,59 @@ class T3ChannelProjector(T3BaseProjector):
 			self.add_func_projector(key, self.channel_projection, first=True)
 
 
+	def get_channels(self) -> list[ChannelId]:
+		"""
+		:returns: channels of the projection. t1/t2 documents and journal entries not associated
+		with any of them are discarded, and thus need not be loaded in the first place
+		"""
+		return list(self._channel_set)
+
+
 	def overwrite_root_channel(self, v: Sequence[ChannelId]) -> None | Sequence[ChannelId]:
 		return subset if (subset := list(self._channel_set.intersection(v))) else None
 
 
+	def project(self, ampel_buffer: Iterable[AmpelBuffer]) -> Sequence[AmpelBuffer]:
+
+		if self.verbose or self.field_projectors:
+			return super().project(ampel_buffer)
+
+		project_docs = self.channel_projection
+		channel_set = self._channel_set
+		freeze = self.freeze
+		ret: list[AmpelBuffer] = []
+
+		for abuf in ampel_buffer:
+
+			new_buf = AmpelBuffer(id=abuf["id"])
+			for k in self.pass_through_keys:
+				if k in abuf:
+					new_buf[k] = abuf[k]
+
+			for k in ("t1", "t2"):
+				if abuf.get(k):
+					new_buf[k] = project_docs(abuf[k]) # type: ignore[typeddict-item, arg-type]
+
+			if (stock := abuf.get("stock")):
+
+				d: dict[str, Any] = {**stock}
+				if "journal" in d:
+					d["journal"] = project_docs(d["journal"])
+				if "channel" in d:
+					d["channel"] = self.overwrite_root_channel(d["channel"])
+				if "ts" in d:
+					d["ts"] = {k: v for k, v in d["ts"].items() if k in channel_set}
+
+				new_buf["stock"] = ReadOnlyDict(d) if freeze else d # type: ignore[typeddict-item]
+
+				if self.remove_empty and not d.get("channel"):
+					continue
+
+			ret.append(new_buf)
+
+		return ret
+
+
 	def channel_projection(self, dicts: Sequence[dict[str, Any]]) -> Sequence[dict[str, Any]]:
 		"""
 		Filters out dict entries not associated with configured channel
@@ -77,26 +142,52 @@ class T3ChannelProjector(T3BaseProjector):
 		"""
 
 		channel_set = self._channel_set
-		setitem = dict.__setitem__
+		cache = self._channel_cache
 		ret: list[dict] = []
 
 		if not dicts:
-			return []
+			return ()
 
 		for el in dicts:
-			if elchan := el.get('channel'):
-				if isinstance(elchan, str | int):
-					if elchan in channel_set:
-						ret.append(el)
-				elif subset := channel_set.intersection(elchan):
-					channels = (
-						list(subset)
-						if len(subset) > 1 else next(iter(subset))
-					)
-					if self.unalterable:
-						ret.append({**el, 'channel': channels})
-					else:
-						setitem(el, 'channel', channels)
-						ret.append(el)
+
+			if not (elchan := el.get('channel')):
+				continue
+
+			if isinstance(elchan, str | int):
+				if elchan in channel_set:
+					ret.append(el)
+				continue
+
+			key = elchan if elchan.__class__ is tuple else tuple(elchan)
+			if key in cache:
+				keep, channels = cache[key]
+			else:
+				keep, channels = cache[key] = self._project_channels(key)
+
+			# All channels are kept: the document is reused as is
+			if keep:
+				ret.append(el)
+			elif channels is not None:
+				ret.append(self._set_channel(el, channels))
 
 		return tuple(ret)
+
+
+	def _project_channels(self,
+		key: tuple[ChannelId, ...]
+	) -> tuple[bool, None | ChannelId | tuple[ChannelId, ...]]:
+		if not (subset := self._channel_set.intersection(key)):
+			return False, None
+		if len(subset) == 1:
+			return False, next(iter(subset))
+		return len(subset) == len(key), tuple(subset)
+
+
+	def _set_channel(self, el: dict[str, Any], channels: ChannelId | tuple[ChannelId, ...]) -> dict[str, Any]:
+		if self.unalterable:
+			return {**el, 'channel': channels}
+		if isinstance(el, LazyFrozenDict):
+			el.resolve('channel', channels)
+		else:
+			dict.__setitem__(el, 'channel', channels)
+		return el
@@ -7,15 +7,20 @@
 # Last Modified Date:  13.12.2021
 # Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
 
-from collections.abc import Generator, Sequence
+from collections import deque
+from collections.abc import Generator, Iterable, Sequence
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any
 
 from ampel.abstract.AbsBufferComplement import AbsBufferComplement
 from ampel.abstract.AbsT3Loader import AbsT3Loader
 from ampel.abstract.AbsT3Selector import AbsT3Selector
 from ampel.abstract.AbsT3Supplier import AbsT3Supplier
+from ampel.model.t3.T3QueryPlan import T3QueryPlan
 from ampel.model.UnitModel import UnitModel
 from ampel.struct.AmpelBuffer import AmpelBuffer
 from ampel.struct.T3Store import T3Store
+from ampel.types import StockId
 from ampel.util.collections import get_chunks as chunks_func
 
 
@@ -39,6 +44,14 @@ class T3DefaultBufferSupplier(AbsT3Supplier[Generator[AmpelBuffer, None, None]])
 	#: number of stocks to load at once. Set to 0 to disable chunking
 	chunk_size: int = 1000
 
+	#: number of chunks loaded (and complemented) ahead by a background thread
+	#: while the current chunk is being consumed. Set to 0 to load chunks on demand
+	prefetch: int = 0
+
+	#: run the complementers of a chunk concurrently.
+	#: Complementers must then update distinct fields of the buffers
+	concurrent_complement: bool = False
+
 
 	def __init__(self, **kwargs) -> None:
 
@@ -88,6 +101,14 @@ class T3DefaultBufferSupplier(AbsT3Supplier[Generator[AmpelBuffer, None, None]])
 			self.complementers = None
 
 
+	def accepts_query_plan(self) -> bool:
+		return self.data_loader.accepts_query_plan()
+
+
+	def apply_query_plan(self, plan: T3QueryPlan) -> None:
+		self.data_loader.apply_query_plan(plan)
+
+
 	def supply(self, t3s: T3Store) -> Generator[AmpelBuffer, None, None]:
 
 		# NB: we consume the entire cursor at once using list() to be robust
@@ -104,21 +125,69 @@ class T3DefaultBufferSupplier(AbsT3Supplier[Generator[AmpelBuffer, None, None]])
 		###########
 		chunks = chunks_func(stock_ids, self.chunk_size) if self.chunk_size > 0 else [stock_ids]
 
+		if self.prefetch > 0:
+			yield from self._supply_prefetched(chunks, id_key, t3s)
+			return
+
 		# Loop over chunks from the cursor/iterator
 		for chunk_ids in chunks:
 
 			# allow working chunks to complete even if some raise exception
 			try:
+				yield from self.load_chunk([sid[id_key] for sid in chunk_ids], t3s)
+			except Exception as e:  # noqa: PERF203
+				self.event_hdlr.handle_error(e, self.logger)
 
-				# Load info from DB
-				tran_data = self.data_loader.load([sid[id_key] for sid in chunk_ids])
 
-				# Potentialy add complementary information (spectra, TNS names, ...)
-				if self.complementers:
-					for appender in self.complementers:
-						appender.complement(tran_data, t3s)
+	def _supply_prefetched(self,
+		chunks: Iterable[Sequence[dict[str, Any]]], id_key: str, t3s: T3Store
+	) -> Generator[AmpelBuffer, None, None]:
+		"""
+		Chunks are loaded by a background thread, ahead of consumption.
+		Errors are handled in the calling thread, chunk order is preserved.
+		"""
 
-				yield from tran_data
+		it = iter(chunks)
+		pending: deque[Future] = deque()
 
-			except Exception as e:  # noqa: PERF203
-				self.event_hdlr.handle_error(e, self.logger)
+		with ThreadPoolExecutor(1) as pool:
+			try:
+				while True:
+
+					# Keep up to 'prefetch' chunks loading in addition to the one consumed next
+					while len(pending) <= self.prefetch and (chunk_ids := next(it, None)) is not None:
+						pending.append(
+							pool.submit(self.load_chunk, [sid[id_key] for sid in chunk_ids], t3s)
+						)
+
+					if not pending:
+						break
+
+					# allow working chunks to complete even if some raise exception
+					try:
+						yield from pending.popleft().result()
+					except Exception as e:
+						self.event_hdlr.handle_error(e, self.logger)
+
+			finally:
+				# Generator closed or failed: do not load further chunks
+				for f in pending:
+					f.cancel()
+
+
+	def load_chunk(self, stock_ids: list[StockId], t3s: T3Store) -> Iterable[AmpelBuffer]:
+
+		# Load info from DB
+		tran_data = self.data_loader.load(stock_ids)
+
+		# Potentialy add complementary information (spectra, TNS names, ...)
+		if self.complementers:
+			if self.concurrent_complement and len(self.complementers) > 1:
+				with ThreadPoolExecutor(len(self.complementers)) as pool:
+					for f in [pool.submit(el.complement, tran_data, t3s) for el in self.complementers]:
+						f.result()
+			else:
+				for appender in self.complementers:
+					appender.complement(tran_data, t3s)
+
+		return tran_data
@@ -4,12 +4,11 @@
 # License:             BSD-3-Clause
 # Author:              valery brinnel <firstname.lastname@gmail.com>
 # Date:                17.06.2020
-# Last Modified Date:  28.02.2022
-# Last Modified By:    Marcus Fenner <mf@physik.hu-berlin.de>
+# Last Modified Date:  17.10.2026
+# Last Modified By:    jvs
 
-from collections.abc import Iterable
+from collections.abc import Iterable, Sequence
 
-from pymongo import MongoClient
 from pymongo.collection import Collection
 
 from ampel.abstract.AbsBufferComplement import AbsBufferComplement
@@ -18,15 +17,55 @@ from ampel.content.JournalRecord import JournalRecord
 from ampel.model.aux.FilterCriterion import FilterCriterion
 from ampel.model.operator.AllOf import AllOf
 from ampel.model.operator.FlatAnyOf import FlatAnyOf
+from ampel.mongo.view.LazyFrozenDict import LazyFrozenDict
 from ampel.struct.AmpelBuffer import AmpelBuffer
 from ampel.struct.T3Store import T3Store
 from ampel.types import StockId
 
 
+def merge_journals(a: Sequence[JournalRecord], b: Sequence[JournalRecord], reverse: bool) -> list[JournalRecord]:
+	"""
+	Equivalent to sorted(a + b, key=lambda x: x['ts'], reverse=reverse),
+	in linear time if both journals are already sorted (which is usually the case)
+	"""
+
+	if not a or not b:
+		return sorted([*a, *b], key=lambda x: x['ts'], reverse=reverse)
+
+	if not is_sorted(a, reverse):
+		a = sorted(a, key=lambda x: x['ts'], reverse=reverse)
+	if not is_sorted(b, reverse):
+		b = sorted(b, key=lambda x: x['ts'], reverse=reverse)
+
+	ret: list[JournalRecord] = []
+	i = j = 0
+	la, lb = len(a), len(b)
+	while i < la and j < lb:
+		# Entries of 'a' come first for equal timestamps (sort stability)
+		if (b[j]['ts'] > a[i]['ts']) if reverse else (b[j]['ts'] < a[i]['ts']):
+			ret.append(b[j])
+			j += 1
+		else:
+			ret.append(a[i])
+			i += 1
+
+	ret.extend(a[i:])
+	ret.extend(b[j:])
+	return ret
+
+
+def is_sorted(journal: Sequence[JournalRecord], reverse: bool) -> bool:
+	if reverse:
+		return all(journal[k]['ts'] >= journal[k + 1]['ts'] for k in range(len(journal) - 1))
+	return all(journal[k]['ts'] <= journal[k + 1]['ts'] for k in range(len(journal) - 1))
+
+
 class T3ExtJournalAppender(AbsBufferComplement):
 	"""
 	Import journal entries from a 'foreign' database, e.g. one created
 	by a previous version of Ampel.
+	Journals of a chunk are retrieved with a single query. The mongo client
+	is shared among the units using the same resource (see :meth:`AmpelDB.get_resource_client`).
 	"""
 
 	mongo_resource: str = "resource.ext_mongo"
@@ -40,43 +79,62 @@ class T3ExtJournalAppender(AbsBufferComplement):
 
 		super().__init__(**kwargs)
 
-		if self.filter_config:
-			self.journal_filter: SimpleDictArrayFilter[JournalRecord] = SimpleDictArrayFilter(filters=self.filter_config)
-
-		self.col: Collection = MongoClient(
-			**self.context.config.get(
-				f'resource.{self.mongo_resource}',
-				dict, raise_exc=True
-			)
-		) \
+		self.journal_filter: None | SimpleDictArrayFilter[JournalRecord] = (
+			SimpleDictArrayFilter(filters=self.filter_config) if self.filter_config else None
+		)
+
+		self.col: Collection = self.context.db \
+			.get_resource_client(
+				self.mongo_resource,
+				**self.context.config.get(
+					f'resource.{self.mongo_resource}',
+					dict, raise_exc=True
+				)
+			) \
 			.get_database(self.db_name)\
 			.get_collection("stock")
 
 
 	def get_ext_journal(self, stock_id: StockId) -> None | list[JournalRecord]:
+		return self.get_ext_journals([stock_id]).get(stock_id)
+
+
+	def get_ext_journals(self, stock_ids: Sequence[StockId]) -> dict[StockId, list[JournalRecord]]:
+		""" :returns: (filtered) journals of the provided stocks found in the external database """
+
+		ret: dict[StockId, list[JournalRecord]] = {}
+		for ext_stock in self.col.find({'_id': {'$in': list(stock_ids)}}, {'journal': 1}):
+			journal = ext_stock.get('journal') or []
+			ret[ext_stock['_id']] = self.journal_filter.apply(journal) if self.journal_filter else list(journal)
 
-		if ext_stock := next(self.col.find({'_id': stock_id}), None):
-			if self.journal_filter:
-				return self.journal_filter.apply(ext_stock['journal'])
-			return ext_stock['journal']
-		return None
+		return ret
 
 
 	def complement(self, it: Iterable[AmpelBuffer], t3s: T3Store) -> None:
 
-		for albuf in it:
+		# 'it' is iterated twice
+		buffers = it if isinstance(it, list | tuple) else list(it)
 
-			if 'stock' in albuf and isinstance(albuf['stock'], dict):
+		for albuf in buffers:
+			if not ('stock' in albuf and isinstance(albuf['stock'], dict | LazyFrozenDict)):
+				raise ValueError("No stock information available")
+
+		journals = self.get_ext_journals(
+			[albuf['stock']['stock'] for albuf in buffers] # type: ignore[index]
+		)
 
-				if entries := self.get_ext_journal(albuf['stock']['stock']):
+		for albuf in buffers:
 
-					entries.extend(albuf['stock']['journal'])
+			stock = albuf['stock']
+			if not (entries := journals.get(stock['stock'])): # type: ignore[index]
+				continue
 
-					if self.sort:
-						dict.__setitem__(
-							albuf['stock'], 'journal', sorted( # type: ignore[index]
-								entries, key=lambda x: x['ts'], reverse=self.reverse
-							)
-						)
+			journal = (
+				merge_journals(entries, stock['journal'], self.reverse) # type: ignore[index]
+				if self.sort else [*entries, *stock['journal']] # type: ignore[index]
+			)
+
+			if isinstance(stock, LazyFrozenDict):
+				stock.resolve('journal', journal)
 			else:
-				raise ValueError("No stock information available")
+				dict.__setitem__(stock, 'journal', journal) # type: ignore[index]
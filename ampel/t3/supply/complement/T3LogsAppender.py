@@ -4,9 +4,10 @@
 # License:             BSD-3-Clause
 # Author:              valery brinnel <firstname.lastname@gmail.com>
 # Date:                29.03.2021
-# Last Modified Date:  28.02.2022
-# Last Modified By:    Marcus Fenner <mf@physik.hu-berlin.de>
+# Last Modified Date:  17.10.2026
+# Last Modified By:    jvs
 
+from collections import defaultdict
 from collections.abc import Iterable
 from datetime import datetime, timezone
 from typing import Any
@@ -14,13 +15,19 @@ from typing import Any
 from bson.objectid import ObjectId
 
 from ampel.abstract.AbsBufferComplement import AbsBufferComplement
+from ampel.content.LogDocument import LogDocument
 from ampel.log.utils import safe_query_dict
 from ampel.mongo.query.var.LogsLoader import LogsLoader
 from ampel.struct.AmpelBuffer import AmpelBuffer
 from ampel.struct.T3Store import T3Store
+from ampel.types import StockId
 
 
 class T3LogsAppender(AbsBufferComplement):
+	"""
+	Adds the log entries associated with each stock to the field 'logs' of ampel buffers.
+	Logs of a chunk are loaded with a single query and grouped by stock in one pass.
+	"""
 
 	use_last_run: bool = True
 	logs_loader_conf: dict[str, Any] = {}
@@ -33,7 +40,9 @@ class T3LogsAppender(AbsBufferComplement):
 
 	def complement(self, it: Iterable[AmpelBuffer], t3s: T3Store) -> None:
 
-		query: dict[str, Any] = {'s': {'$in': [el['id'] for el in it]}}
+		# 'it' is iterated twice
+		buffers = it if isinstance(it, list | tuple) else list(it)
+		query: dict[str, Any] = {'s': {'$in': [el['id'] for el in buffers]}}
 
 		if t3s.session and self.use_last_run and t3s.session.get('last_run'):
 			query['_id'] = {
@@ -57,9 +66,17 @@ class T3LogsAppender(AbsBufferComplement):
 		if not logs:
 			return
 
-		for ab in it:
+		# Log entries can be associated with multiple stocks
+		by_stock: defaultdict[StockId, list[LogDocument]] = defaultdict(list)
+		for l in logs:
+			if isinstance(s := l['s'], int | bytes | str):
+				by_stock[s].append(l)
+			else:
+				for sid in s:
+					by_stock[sid].append(l)
+
+		for ab in buffers:
 			if 'logs' not in ab or ab['logs'] is None:
 				ab['logs'] = []
-			for l in logs:
-				if ab['id'] == l['s']:
-					ab['logs'].append(l) # type: ignore[union-attr]
+			if ab['id'] in by_stock:
+				ab['logs'].extend(by_stock[ab['id']]) # type: ignore[union-attr]
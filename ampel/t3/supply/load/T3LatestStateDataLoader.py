@@ -15,8 +15,10 @@ import ujson
 from bson.codec_options import CodecOptions
 
 from ampel.abstract.AbsT3Loader import AbsT3Loader
-from ampel.mongo.query.t1 import latest_fast_query, latest_general_query
+from ampel.model.t3.LoaderDirective import LoaderDirective
+from ampel.mongo.query.t1 import latest_fast_query, latest_general_multi_query
 from ampel.mongo.view.FrozenValuesDict import FrozenValuesDict
+from ampel.mongo.view.LazyFrozenDict import LAZY_CODEC_OPTIONS
 from ampel.struct.AmpelBuffer import AmpelBuffer
 from ampel.types import StockId, StrictIterable
 from ampel.util.collections import to_set
@@ -43,6 +45,9 @@ class T3LatestStateDataLoader(AbsT3Loader):
 
 	codec_options: ClassVar[None | CodecOptions] = CodecOptions(document_class=FrozenValuesDict)
 
+	#: Decode document fields on first access (see T3SimpleDataLoader.lazy)
+	lazy: bool = False
+
 
 	def __init__(self, **kwargs):
 
@@ -124,30 +129,23 @@ class T3LatestStateDataLoader(AbsT3Loader):
 
 		# TODO: check result length ?
 
-		# get latest state (general mode) for the remaining transients
-		for slow_id in slow_ids:
+		# get latest state (general mode) for the remaining transients,
+		# resolved for all of them with a single aggregation
+		if slow_ids:
 
-			# get latest state for single transients using general query
-			latest_state = next(
-				self.col_t1.aggregate(
-					latest_general_query(slow_id, project={'$project': {'_id': 1}})
-				),
-				None
-			)
+			resolved = set()
+			for el in self.col_t1.aggregate(latest_general_multi_query(list(slow_ids))):
+				states.add(el['_id'])
+				resolved.add(el['stock'])
 
 			# Robustness
-			if latest_state is None:
+			for slow_id in slow_ids - resolved:
 				# TODO: add error flag to transient doc ?
 				# TODO: add error flag to event doc
 				# TODO: add doc to Ampel_troubles
 				self.logger.error(
 					f"Could not retrieve latest state for transient {slow_id}"
 				)
-				continue
-
-			states.add(
-				latest_state['_id']
-			)
 
 		# Customize T1 & T2 queries (add state query parameter)
 		directives = []
@@ -158,13 +156,8 @@ class T3LatestStateDataLoader(AbsT3Loader):
 
 				qd = ujson.loads(ujson.dumps(directive.dict()))
 				key = 'link' if directive.col == 't2' else '_id'
-
-				if qd.query_complement:
-					qd.query_complement[key] = {"$in": list(states)}
-				else:
-					qd.query_complement = {key: {"$in": list(states)}}
-
-				directives.append(qd)
+				qd['query_complement'] = (qd['query_complement'] or {}) | {key: {"$in": list(states)}}
+				directives.append(LoaderDirective(**qd))
 
 			else:
 				directives.append(directive)
@@ -176,5 +169,5 @@ class T3LatestStateDataLoader(AbsT3Loader):
 			stock_ids = stock_ids,
 			directives = directives,
 			channel = self.channel,
-			codec_options = self.codec_options
+			codec_options = LAZY_CODEC_OPTIONS if self.lazy else self.codec_options
 		)
@@ -13,7 +13,9 @@ from typing import ClassVar
 from bson.codec_options import CodecOptions
 
 from ampel.abstract.AbsT3Loader import AbsT3Loader
+from ampel.model.t3.T3QueryPlan import T3QueryPlan
 from ampel.mongo.view.FrozenValuesDict import FrozenValuesDict
+from ampel.mongo.view.LazyFrozenDict import LAZY_CODEC_OPTIONS
 from ampel.struct.AmpelBuffer import AmpelBuffer
 from ampel.types import StockId, StrictIterable
 
@@ -23,6 +25,26 @@ class T3SimpleDataLoader(AbsT3Loader):
 
 	codec_options: ClassVar[None | CodecOptions] = CodecOptions(document_class=FrozenValuesDict)
 
+	#: Keep documents as raw BSON, decoding fields on first access
+	#: (see :class:`~ampel.mongo.view.LazyFrozenDict.LazyFrozenDict`).
+	#: Reduces memory and CPU usage when units read only parts of wide documents.
+	lazy: bool = False
+
+	#: Load the documents of all directives with a single aggregation
+	#: on the stock collection ($lookup stages, requires MongoDB >= 5.0).
+	#: See :func:`~ampel.core.DataLoader.DataLoader.load`
+	lookup: bool = False
+
+	def __init__(self, **kwargs) -> None:
+		super().__init__(**kwargs)
+		self.query_plan: None | T3QueryPlan = None
+
+	def accepts_query_plan(self) -> bool:
+		return True
+
+	def apply_query_plan(self, plan: T3QueryPlan) -> None:
+		self.query_plan = plan
+
 	def load(self,
 		stock_ids: StockId | Iterator[StockId] | StrictIterable[StockId]
 	) -> Iterable[AmpelBuffer]:
@@ -31,6 +53,9 @@ class T3SimpleDataLoader(AbsT3Loader):
 			stock_ids = stock_ids,
 			directives = self.directives,
 			channel = self.channel,
-			codec_options = self.codec_options,
-			logger = self.logger
+			codec_options = LAZY_CODEC_OPTIONS if self.lazy else self.codec_options,
+			logger = self.logger,
+			lookup = self.lookup,
+			stock_match = self.query_plan.stock if self.query_plan else None,
+			doc_channel = self.query_plan.channel if self.query_plan else None
 		)
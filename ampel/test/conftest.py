@@ -45,6 +45,12 @@ def pytest_addoption(parser):
         default=False,
         help="run docker-based integration tests",
     )
+    parser.addoption(
+        "--benchmark",
+        action="store_true",
+        default=False,
+        help="run timing benchmarks",
+    )
 
 
 @pytest.fixture(scope="session")
@@ -57,7 +63,7 @@ def mongod(pytestconfig):
         raise pytest.skip("integration tests require --integration flag")
     try:
         container = subprocess.check_output(
-            ["docker", "run", "--rm", "-d", "-P", "mongo:4.4"]
+            ["docker", "run", "--rm", "-d", "-P", "mongo:5.0"]
         ).decode().strip()
     except FileNotFoundError:
         pytest.skip("integration tests require docker")
@@ -74,6 +80,12 @@ def mongod(pytestconfig):
         subprocess.check_call(["docker", "stop", container])
 
 
+@pytest.fixture
+def _benchmark(pytestconfig):
+    if not pytestconfig.getoption("--benchmark"):
+        raise pytest.skip("benchmarks require --benchmark flag")
+
+
 @pytest.fixture
 def _patch_mongo(monkeypatch):
     monkeypatch.setattr("ampel.core.AmpelDB.MongoClient", mongomock.MongoClient)
@@ -1,7 +1,12 @@
-from pymongo import InsertOne
+from datetime import datetime, timezone
+from threading import Event, Timer
+
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
 
 from ampel.metrics.AmpelMetricsRegistry import AmpelMetricsRegistry
 from ampel.mongo.update.DBUpdatesBuffer import DBUpdatesBuffer
+from ampel.mongo.utils import coalesce_updates
 
 
 def test_metrics(dev_context, ampel_logger):
@@ -30,3 +35,201 @@ def test_metrics(dev_context, ampel_logger):
             assert after[k] - before[k] == 1, f"error count was incremented for {k}"
         else:
             assert after[k] - before[k] == 0, f"error count was not incremented for {k}"
+
+
+def test_coalesce_updates():
+    t0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    t1 = datetime(2026, 1, 2, tzinfo=timezone.utc)
+    ops = [
+        UpdateOne(
+            {"id": 1},
+            {
+                "$addToSet": {"channel": "A"},
+                "$push": {"meta": {"run": 1}},
+                "$setOnInsert": {"body": 1},
+                "$max": {"expiry": t1},
+            },
+            upsert=True,
+        ),
+        InsertOne({"_id": 0}),
+        UpdateOne({"id": 2}, {"$addToSet": {"channel": "A"}}, upsert=True),
+        UpdateOne(
+            {"id": 1},
+            {
+                "$addToSet": {"channel": {"$each": ["A", "B"]}},
+                "$push": {"meta": {"run": 2}},
+                "$setOnInsert": {"body": 2},
+                "$max": {"expiry": t0},
+            },
+            upsert=True,
+        ),
+        # conflicting paths
+        UpdateOne({"id": 1}, {"$set": {"channel": ["C"]}}, upsert=True),
+        UpdateOne({"id": 1}, {"$set": {"channel": ["D"]}}, upsert=True),
+        # unsupported modifier
+        UpdateOne({"id": 2}, {"$push": {"meta": {"$each": [1], "$slice": -1}}}, upsert=True),
+    ]
+    docs = [op._doc for op in ops]
+
+    coalesced = coalesce_updates(ops)
+    assert [op._doc for op in ops] == docs, "input operations are not modified"
+    assert len(coalesced) == 5
+    assert coalesced[0]._filter == {"id": 1}
+    assert coalesced[0]._doc == {
+        "$addToSet": {"channel": {"$each": ["A", "B"]}},
+        "$push": {"meta": {"$each": [{"run": 1}, {"run": 2}]}},
+        "$setOnInsert": {"body": 1},
+        "$max": {"expiry": t1},
+    }
+    assert coalesced[1:3] == ops[1:3]
+    assert coalesced[3]._doc == {"$set": {"channel": ["D"]}}
+    assert coalesced[4] is ops[-1]
+
+
+def test_coalesce_updates_order():
+    ops = [
+        UpdateOne({"id": 1}, {"$set": {"a": 1}, "$addToSet": {"tag": True}}, upsert=True),
+        UpdateOne({"id": 1}, {"$addToSet": {"tag": {"$each": [1, {"x": 1, "y": 2}]}}}, upsert=True),
+        UpdateOne({"id": 1}, {"$addToSet": {"tag": {"y": 2, "x": 1}}}, upsert=True),
+        # unsupported modifier, closes the group of id 1
+        UpdateOne({"id": 1}, {"$push": {"meta": {"$each": [1], "$slice": -1}}}, upsert=True),
+        UpdateOne({"id": 1}, {"$set": {"a": 2}}, upsert=True),
+        # different upsert flag
+        UpdateOne({"id": 1}, {"$set": {"a": 3}}),
+        UpdateOne({"id": 1}, {"$set": {"a": 4}}, upsert=True),
+    ]
+
+    coalesced = coalesce_updates(ops)
+    assert len(coalesced) == 5
+    # BSON rather than python equality
+    assert coalesced[0]._doc == {
+        "$set": {"a": 1},
+        "$addToSet": {"tag": {"$each": [True, 1, {"x": 1, "y": 2}, {"y": 2, "x": 1}]}},
+    }
+    assert coalesced[1:] == ops[3:]
+
+
+def test_coalesce(dev_context, ampel_logger):
+    updates_buffer = DBUpdatesBuffer(
+        dev_context.db, run_id=0, logger=ampel_logger, coalesce=True
+    )
+    get_sample_value = AmpelMetricsRegistry.registry().get_sample_value
+    before = get_sample_value("ampel_db_ops_total", {"col": "t0"}) or 0
+    ratio = get_sample_value("ampel_db_coalesce_ratio_sum", {"col": "t0"}) or 0
+    for i in range(10):
+        updates_buffer.add_t0_update(
+            UpdateOne(
+                {"id": 0},
+                {"$addToSet": {"channel": f"C{i % 2}"}, "$push": {"meta": {"run": i}}},
+                upsert=True,
+            )
+        )
+    updates_buffer.push_updates()
+    assert (get_sample_value("ampel_db_ops_total", {"col": "t0"}) or 0) - before == 1
+    assert get_sample_value("ampel_db_coalesce_ratio_sum", {"col": "t0"}) - ratio == 10
+
+    doc = dev_context.db.get_collection("t0").find_one({"id": 0})
+    assert set(doc["channel"]) == {"C0", "C1"}
+    assert [m["run"] for m in doc["meta"]] == list(range(10))
+
+
+def test_pipeline(mock_context, ampel_logger, mocker):
+    acked = []
+    updates_buffer = DBUpdatesBuffer(
+        mock_context.db,
+        run_id=0,
+        logger=ampel_logger,
+        acknowledge_callback=acked.extend,
+        pipeline_depth=2,
+    )
+    get_sample_value = AmpelMetricsRegistry.registry().get_sample_value
+    blocked = get_sample_value("ampel_db_blocked_seconds_count") or 0
+
+    release = Event()
+    written = []
+
+    def call_bulk_write(col_name, db_ops, **kwargs):
+        release.wait(1)
+        written.append((col_name, db_ops[0]._doc["_id"]))
+
+    mocker.patch.object(updates_buffer, "call_bulk_write", side_effect=call_bulk_write)
+
+    for i in range(2):
+        updates_buffer.add_t0_update(InsertOne({"_id": i}))
+        updates_buffer.add_t1_update(InsertOne({"_id": i}))
+        updates_buffer.acknowledge_on_push(i)
+        updates_buffer.push_updates(wait=False)
+
+    assert get_sample_value("ampel_db_inflight_ops", {"col": "t0"}) == 2
+    assert not written, "pushes did not wait for writes"
+    assert (get_sample_value("ampel_db_blocked_seconds_count") or 0) == blocked
+
+    # third push is blocked until a slot is freed
+    Timer(0.1, release.set).start()
+    updates_buffer.add_t0_update(InsertOne({"_id": 2}))
+    updates_buffer.push_updates()
+
+    assert acked == [0, 1]
+    assert [i for col, i in written if col == "t0"] == [0, 1, 2], "writes are ordered"
+    assert get_sample_value("ampel_db_inflight_ops", {"col": "t0"}) == 0
+    # only producers waiting in check_push are recorded
+    assert (get_sample_value("ampel_db_blocked_seconds_count") or 0) == blocked
+
+    release.clear()
+    for i in range(3, 5):
+        updates_buffer.add_t0_update(InsertOne({"_id": i}))
+        updates_buffer.push_updates(wait=False)
+
+    Timer(0.1, release.set).start()
+    updates_buffer.max_size = 0
+    updates_buffer.add_t0_update(InsertOne({"_id": 5}))
+    updates_buffer.check_push()
+    updates_buffer.push_updates()
+
+    assert [i for col, i in written if col == "t0"] == [0, 1, 2, 3, 4, 5]
+    assert (get_sample_value("ampel_db_blocked_seconds_count") or 0) == blocked + 1
+
+
+def test_dup_key_recovery(mock_context, ampel_logger, mocker):
+    updates_buffer = DBUpdatesBuffer(mock_context.db, run_id=0, logger=ampel_logger)
+    col = updates_buffer._cols["t0"]
+    bulk_write = col.bulk_write
+    ops = [
+        UpdateOne({"id": i}, {"$addToSet": {"channel": "A"}}, upsert=True)
+        for i in range(10)
+    ]
+
+    def dup_key_errors(db_ops, **kwargs):
+        if patched.call_count > 1:
+            return bulk_write(db_ops, **kwargs)
+        bulk_write(db_ops[1:3], **kwargs)
+        raise BulkWriteError(
+            {
+                "nInserted": 0,
+                "nUpserted": 2,
+                "nModified": 0,
+                "writeErrors": [
+                    {
+                        "index": i,
+                        "code": 11000,
+                        "errmsg": "E11000 duplicate key error",
+                        "op": {"q": op._filter, "u": op._doc, "upsert": True},
+                    }
+                    for i, op in enumerate(db_ops)
+                    if i not in (1, 2)
+                ]
+            }
+        )
+
+    patched = mocker.patch.object(col, "bulk_write", side_effect=dup_key_errors)
+    info = mocker.spy(ampel_logger, "info")
+    error_callback = mocker.patch.object(updates_buffer, "error_callback")
+
+    updates_buffer.call_bulk_write("t0", ops)
+
+    assert patched.call_count == 2, "conflicting ops were replayed in a single bulk write"
+    assert len(patched.call_args.args[0]) == 8
+    assert info.call_count == 1
+    assert "8 duplicate key error(s), 8 recovered" in info.call_args.args[0]
+    assert not error_callback.called
+    assert mock_context.db.get_collection("t0").count_documents({}) == 10
@@ -0,0 +1,224 @@
+import pickle
+from time import perf_counter
+from typing import Any
+from unittest.mock import MagicMock
+
+import bson
+import pytest
+
+from ampel.core.DataLoader import DataLoader
+from ampel.dev.DevAmpelContext import DevAmpelContext
+from ampel.enum.DocumentCode import DocumentCode
+from ampel.model.t3.LoaderDirective import LoaderDirective
+from ampel.mongo.view.FrozenValuesDict import FrozenValuesDict
+from ampel.mongo.view.LazyFrozenDict import LAZY_CODEC_OPTIONS, LazyFrozenDict, materialize
+from ampel.t3.stage.T3AggregatingStager import T3AggregatingStager
+from ampel.types import StockId
+from ampel.util.buffer import pack, unpack
+from ampel.view.ReadOnlyDict import ReadOnlyDict
+from ampel.view.SnapView import SnapView
+from ampel.view.T2DocView import T2DocView
+
+DIRECTIVES = [
+    LoaderDirective(col="stock", query_complement=None),
+    LoaderDirective(col="t0", query_complement=None),
+    LoaderDirective(col="t1", query_complement=None),
+    LoaderDirective(col="t2", query_complement={"code": DocumentCode.OK}),
+]
+
+
+@pytest.fixture
+def num_stocks() -> int:
+    return 20
+
+
+def require_lookup(ctx: DevAmpelContext) -> None:
+    version = ctx.db.get_collection("stock").database.client.server_info()["versionArray"]
+    if version < [5]:
+        pytest.skip("$lookup with localField and pipeline requires MongoDB >= 5.0")
+
+
+@pytest.fixture
+def populated_context(integration_context: DevAmpelContext, num_stocks: int):
+    db = integration_context.db
+    db.get_collection("stock").insert_many(
+        [{"stock": i, "channel": ["TEST"], "tag": ["A"]} for i in range(num_stocks)]
+    )
+    db.get_collection("t0").insert_many(
+        [
+            {"id": i * 2 + j, "stock": [i], "channel": ["TEST"], "body": {"x": j}}
+            for i in range(num_stocks)
+            for j in range(2)
+        ]
+    )
+    db.get_collection("t1").insert_many(
+        [
+            {"stock": i, "link": i, "dps": [i * 2, i * 2 + 1], "channel": ["TEST"]}
+            for i in range(num_stocks)
+        ]
+    )
+    db.get_collection("t2").insert_many(
+        [
+            {
+                "stock": i,
+                "unit": "DummyStateT2Unit",
+                "link": i,
+                "channel": ["TEST"],
+                "code": code,
+                "body": [{"ts": 0, "result": {"thing": i}}],
+            }
+            for i in range(num_stocks)
+            for code in (DocumentCode.OK, DocumentCode.NEW)
+        ]
+    )
+    return integration_context
+
+
+def test_lookup_equivalence(populated_context: DevAmpelContext):
+    """$lookup and find() strategies load the same documents"""
+    require_lookup(populated_context)
+    loader = DataLoader(populated_context)
+    stock_ids = [0, 1, 2, 10]
+    kwargs = {"directives": DIRECTIVES, "channel": "TEST", "codec_options": None}
+
+    expected = list(loader.load(stock_ids, **kwargs))  # type: ignore[arg-type]
+    buffers = list(loader.load(stock_ids, lookup=True, **kwargs))  # type: ignore[arg-type]
+
+    assert buffers == expected
+    assert all(len(ab["t2"]) == 1 for ab in buffers)  # type: ignore[arg-type]
+
+
+@pytest.mark.usefixtures("_benchmark")
+@pytest.mark.parametrize("num_stocks", [10_000])
+@pytest.mark.parametrize("chunk_size", [100, 1000, 10_000])
+def test_lookup_benchmark(
+    populated_context: DevAmpelContext, num_stocks: int, chunk_size: int, record_property
+):
+    """Compare load times of the find() and $lookup strategies"""
+    require_lookup(populated_context)
+    loader = DataLoader(populated_context)
+    for lookup in (False, True):
+        start = perf_counter()
+        count = 0
+        for i in range(0, num_stocks, chunk_size):
+            count += len(
+                list(
+                    loader.load(
+                        list(range(i, i + chunk_size)),
+                        directives=DIRECTIVES,
+                        channel="TEST",
+                        lookup=lookup,
+                    )
+                )
+            )
+        dt = perf_counter() - start
+        assert count == num_stocks
+        record_property("lookup" if lookup else "find", dt)
+        print(
+            f"chunk size {chunk_size}, {'lookup' if lookup else 'find'}: {dt:.3f}s"
+        )
+
+
+def test_lazy_frozen_dict():
+    """Lazily decoded documents behave like their FrozenValuesDict counterpart"""
+    doc = {
+        "stock": 1,
+        "unit": "DummyStateT2Unit",
+        "config": 42,
+        "link": 1,
+        "code": 0,
+        "tag": ["A", "B"],
+        "meta": [],
+        "body": [{"thing": [1, [2]]}, {"thing": {"nested": 3}}],
+    }
+    raw = bson.encode(doc)
+    lazy = bson.decode(raw, LAZY_CODEC_OPTIONS)
+    frozen = bson.decode(raw, bson.CodecOptions(document_class=FrozenValuesDict))
+
+    assert isinstance(lazy, LazyFrozenDict)
+    assert isinstance(lazy["body"][1], ReadOnlyDict)
+    assert lazy["body"] == frozen["body"]
+    assert lazy["tag"] == frozen["tag"] == ("A", "B")
+    assert lazy["body"][0]["thing"] == (1, (2,))
+    assert lazy["body"][1]["thing"]["nested"] == 3
+    assert set(lazy) == set(doc)
+
+    ctx = MagicMock()
+    ctx.config.get_conf_by_id.return_value = {"foo": 1}
+    DataLoader(ctx).resolve_unit_config(lazy)
+    assert lazy["config"] == dict(lazy.items())["config"] == {"foo": 1}
+    assert pickle.loads(pickle.dumps(lazy))["config"] == {"foo": 1}
+    # resolved values are not part of the raw bytes but survive serialization
+    assert unpack(pack([{"id": 1, "t2": [lazy]}]))[0]["t2"][0]["config"] == {"foo": 1}
+    assert materialize(lazy["body"]) is lazy["body"]
+
+    view = SnapView.of({"id": 1, "t2": [lazy]})
+    assert view.t2 is not None
+    assert view.t2[0].config == {"foo": 1}
+    assert view.get_t2_body("DummyStateT2Unit")["thing"]["nested"] == 3
+
+
+def test_lazy_t2_payload():
+    """Payloads of lazily decoded T2 documents pass the dict checks of views and stagers"""
+    doc = {
+        "stock": 1,
+        "unit": "DummyStateT2Unit",
+        "config": None,
+        "link": 1,
+        "code": 0,
+        "meta": [{"tier": 2, "code": 0}],
+        "body": [{"a": 1, "b": 2}],
+    }
+    lazy = bson.decode(bson.encode(doc), LAZY_CODEC_OPTIONS)
+
+    view = T2DocView.of(lazy)
+    assert view.get_payload() == {"a": 1, "b": 2}
+    assert view.get_ntuple(("a", "b"), int) == (1, 2)
+    assert T3AggregatingStager.get_t2_payload(MagicMock(), lazy["body"], lazy["meta"]) == {"a": 1, "b": 2}
+
+
+def test_lazy_load(populated_context: DevAmpelContext):
+    """Lazy loading yields the same content"""
+    loader = DataLoader(populated_context)
+    stock_ids: list[StockId] = [0, 1, 2, 10]
+    expected: list[Any] = list(loader.load(stock_ids, DIRECTIVES, channel="TEST"))
+    buffers: list[Any] = list(
+        loader.load(
+            stock_ids, DIRECTIVES, channel="TEST", codec_options=LAZY_CODEC_OPTIONS
+        )
+    )
+    assert [ab["id"] for ab in buffers] == [ab["id"] for ab in expected]
+    for ab, ex in zip(buffers, expected, strict=True):
+        assert isinstance(ab["stock"], LazyFrozenDict)
+        assert ab["stock"]["channel"] == ex["stock"]["channel"]
+        assert [dp["body"] for dp in ab["t0"]] == [dp["body"] for dp in ex["t0"]]
+        assert [t2["body"][0]["result"]["thing"] for t2 in ab["t2"]] == [
+            t2["body"][0]["result"]["thing"] for t2 in ex["t2"]
+        ]
+
+
+@pytest.mark.parametrize("lookup", [False, True])
+def test_query_plan(populated_context: DevAmpelContext, lookup: bool):
+    """Stock match and channel restrictions are applied by the db"""
+    if lookup:
+        require_lookup(populated_context)
+    loader = DataLoader(populated_context)
+    populated_context.db.get_collection("stock").update_one(
+        {"stock": 1}, {"$set": {"journal": [{"channel": "TEST"}, {"channel": "X"}]}}
+    )
+    buffers: list[Any] = list(
+        loader.load(
+            [0, 1, 2, 10],
+            DIRECTIVES,
+            lookup=lookup,
+            stock_match={"stock": {"$lt": 5}},
+            doc_channel=["TEST"],
+        )
+    )
+    assert [ab["id"] for ab in buffers] == [0, 1, 2]
+    assert buffers[1]["stock"]["journal"] == ({"channel": "TEST"},)
+    assert all(len(ab["t1"]) == 1 for ab in buffers)
+
+    buffers = list(loader.load([0, 1], DIRECTIVES, lookup=lookup, doc_channel=["X"]))
+    assert [ab["id"] for ab in buffers] == [0, 1]
+    assert not any(ab["t1"] or ab["t2"] for ab in buffers)
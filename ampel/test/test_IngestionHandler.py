@@ -18,8 +18,13 @@ from ampel.content.T2Document import T2Document
 from ampel.dev.DevAmpelContext import DevAmpelContext
 from ampel.enum.DocumentCode import DocumentCode
 from ampel.enum.MetaActionCode import MetaActionCode
-from ampel.ingest.ChainedIngestionHandler import ChainedIngestionHandler, IngestBody
+from ampel.ingest.ChainedIngestionHandler import (
+    ChainedIngestionHandler,
+    IngestBody,
+    IngestItem,
+)
 from ampel.log.AmpelLogger import DEBUG, AmpelLogger
+from ampel.metrics.AmpelMetricsRegistry import AmpelMetricsRegistry
 from ampel.model.ingest.CompilerOptions import CompilerOptions
 from ampel.model.ingest.IngestDirective import IngestDirective
 from ampel.model.ingest.MuxModel import MuxModel
@@ -100,6 +105,7 @@ def get_handler(
     context: DevAmpelContext,
     directives,
     ingester_model=UnitModel(unit="MongoIngester"),  # noqa: B008
+    **kwargs,
 ) -> ChainedIngestionHandler:
     run_id = 0
     logger = AmpelLogger.get_logger(console={"level": DEBUG})
@@ -135,6 +141,7 @@ def get_handler(
         compiler_opts=CompilerOptions(t0={"tag": ["TAGGERT"]}),
         ingester=ingester,
         directives=directives,
+        **kwargs,
     )
 
 
@@ -663,3 +670,136 @@ def test_link_override_order(
     assert (
         col_t2.find_one({"unit": "DummyTiedStateT2Unit"})["code"] == DocumentCode.OK  # type: ignore[index]
     ), "Dependencies were found and processed"
+
+
+@pytest.mark.usefixtures("_dummy_units")
+def test_point_t2_selection_cache(
+    mock_context: DevAmpelContext,
+    datapoints: list[DataPoint],
+    mocker: MockerFixture,
+):
+    """
+    Datapoint selections are evaluated once per alert for identical
+    selection options and datapoints
+    """
+    directives = [
+        IngestDirective(
+            channel=channel,
+            ingest=IngestBody(
+                point_t2=[
+                    T2Compute(
+                        unit="DummyPointT2Unit",
+                        ingest=DPSelection(sort="thing", select="last"),
+                    )
+                ],
+            ),
+        )
+        for channel in ("TEST_CHANNEL", "LONG_CHANNEL")
+    ]
+
+    handler = get_handler(mock_context, directives)
+    assert isinstance(handler.ingester, MongoIngester)
+    select_dps = mocker.spy(ChainedIngestionHandler, "select_dps")
+    handler.ingest(
+        list(reversed(datapoints)),  # type: ignore[arg-type]
+        [(0, True), (1, True)],
+        stock_id="stockystock",
+    )
+    handler.ingester._updates_buffer.push_updates()
+
+    assert select_dps.call_count == 1
+    docs = list(mock_context.db.get_collection("t2").find({}))
+    assert len(docs) == 1
+    assert docs[0]["link"] == max(dp["id"] for dp in datapoints)
+    assert set(docs[0]["channel"]) == {"TEST_CHANNEL", "LONG_CHANNEL"}
+
+    handler.ingest(datapoints[:2], [(0, True)], stock_id="stockystock")  # type: ignore[arg-type]
+    assert select_dps.call_count == 2, "cache is not reused across alerts"
+
+
+def test_ingest_many(
+    dev_context: DevAmpelContext,
+    single_source_directive: IngestDirective,
+    datapoints: list[DataPoint],
+    mocker: MockerFixture,
+):
+    """
+    Alerts of a batch are committed once, shared datapoints are upserted once
+    """
+    handler = get_handler(dev_context, [single_source_directive])
+    assert isinstance(handler.ingester, MongoIngester)
+    t0_ingest = mocker.spy(type(handler.ingester.t0), "ingest")
+    commit = mocker.spy(handler, "commit")
+
+    other = [
+        dp | {"id": dp["id"] + 10, "stock": "otherstock"}
+        for dp in datapoints
+    ]
+    handler.ingest_many(
+        [
+            IngestItem(datapoints[:2], [(0, True)], "stockystock"),  # type: ignore[arg-type]
+            IngestItem(datapoints, [(0, True)], "stockystock", stock_body={"n": 2}),  # type: ignore[arg-type]
+            IngestItem(other, [(0, True)], "otherstock"),  # type: ignore[arg-type]
+        ]
+    )
+    handler.ingester._updates_buffer.push_updates()
+
+    assert commit.call_count == 1
+    assert t0_ingest.call_count == 2 * len(datapoints)
+    assert len(handler.ingest_stats) == 1
+
+    stock = dev_context.db.get_collection("stock")
+    assert stock.count_documents({}) == 2
+    doc = stock.find_one({"stock": "stockystock"})
+    assert doc
+    assert doc["body"] == {"n": 2}
+    assert "body" not in stock.find_one({"stock": "otherstock"})  # type: ignore[operator]
+    t0 = dev_context.db.get_collection("t0")
+    assert t0.count_documents({"stock": "stockystock"}) == len(datapoints)
+    assert t0.count_documents({"stock": "otherstock"}) == len(datapoints)
+    t2 = dev_context.db.get_collection("t2")
+    for stock_id in ("stockystock", "otherstock"):
+        assert t2.count_documents({"stock": stock_id, "unit": "DummyPointT2Unit"}) == len(datapoints)
+
+    # journal entries are the same as with per-alert ingestion
+    handler.ingest(datapoints[:2], [(0, True)], "seqstock")  # type: ignore[arg-type]
+    handler.ingest(datapoints, [(0, True)], "seqstock", stock_body={"n": 2})  # type: ignore[arg-type]
+    handler.ingester._updates_buffer.push_updates()
+
+    def journal(stock_id: str) -> list[dict[str, Any]]:
+        doc = stock.find_one({"stock": stock_id})
+        assert doc
+        return [{k: v for k, v in el.items() if k != "ts"} for el in doc["journal"]]
+
+    assert len(journal("stockystock")) > 1
+    assert journal("stockystock") == journal("seqstock")
+
+
+def test_t1_cache(
+    dev_context: DevAmpelContext,
+    single_source_directive: IngestDirective,
+    datapoints: list[DataPoint],
+    mocker: MockerFixture,
+):
+    """
+    T1 combine results are retained across alerts (LRU)
+    """
+    handler = get_handler(dev_context, [single_source_directive], t1_cache_size=1)
+    t1b = handler.iblocks[0][1].combine[0]  # type: ignore[index]
+    combine = mocker.spy(type(t1b.unit), "combine")
+
+    get_sample_value = AmpelMetricsRegistry.registry().get_sample_value
+
+    def lookups(result: str) -> float:
+        return get_sample_value(
+            "ampel_ingest_t1_cache_lookups_total", {"op": "combine", "result": result}
+        ) or 0
+
+    hits, misses = lookups("hit"), lookups("miss")
+
+    for dps in (datapoints, datapoints, datapoints[:2], datapoints):
+        handler.ingest(dps, [(0, True)], stock_id="stockystock")  # type: ignore[arg-type]
+
+    assert combine.call_count == 3, "second alert was served from cache"
+    assert lookups("hit") - hits == 1
+    assert lookups("miss") - misses == 3, "first state was evicted"
@@ -0,0 +1,99 @@
+from typing import Any
+
+import pytest
+
+from ampel.aux.filter.FlatDictArrayFilter import FlatDictArrayFilter
+from ampel.aux.filter.PrimitiveTypeArrayFilter import PrimitiveTypeArrayFilter
+from ampel.aux.filter.SimpleDictArrayFilter import SimpleDictArrayFilter
+
+DICTS = [
+    {"a": 1, "b": [1, 2]},
+    {"a": 2, "b": 7},
+    {"a": 3},
+    {"b": [3], "c": None},
+    {"a": 5, "b": [2], "c": {"d": 1}},
+]
+
+CRITERIA: list[Any] = [
+    {"attribute": "a", "operator": ">", "value": 2},
+    {"attribute": "a", "operator": "!=", "value": 2},
+    {"attribute": "b", "type": "Sequence", "operator": "contains", "value": 2},
+    {"attribute": "c", "operator": "is", "value": None},
+    {
+        "all_of": [
+            {"attribute": "a", "operator": ">=", "value": 2},
+            {"attribute": "a", "operator": "<", "value": 5},
+        ]
+    },
+    {
+        "any_of": [
+            {"attribute": "a", "operator": "==", "value": 5},
+            {"attribute": "b", "operator": "==", "value": 7},
+        ]
+    },
+]
+
+
+def uncompiled(f):
+    f._predicate = None
+    return f
+
+
+@pytest.mark.parametrize("filters", CRITERIA)
+def test_compiled_dict_filter(filters):
+    """Compiled predicates select the same elements, in input order"""
+    f = SimpleDictArrayFilter(filters=filters)
+    assert f._predicate is not None
+    res = f.apply(DICTS)
+    expected = uncompiled(SimpleDictArrayFilter(filters=filters)).apply(DICTS)
+    assert sorted(map(DICTS.index, res)) == sorted(map(DICTS.index, expected))
+    assert res == [d for d in DICTS if d in res]
+
+
+def test_compiled_flat_dict_filter():
+    f = FlatDictArrayFilter(filters={"attribute": "c.d", "operator": "==", "value": 1})
+    assert f.apply(DICTS) == [DICTS[-1]]
+
+
+@pytest.mark.parametrize(
+    "filters",
+    [
+        {"operator": ">", "value": 2},
+        {"all_of": [{"operator": ">", "value": 1}, {"operator": "<", "value": 4}]},
+        {"any_of": [{"operator": "<", "value": 2}, {"operator": ">", "value": 3}]},
+    ],
+)
+def test_compiled_primitive_filter(filters):
+    f = PrimitiveTypeArrayFilter(filters=filters)
+    args = [1, 2, 3, 4]
+    assert f.apply(args) == sorted(uncompiled(PrimitiveTypeArrayFilter(filters=filters)).apply(args))
+
+
+def test_mask():
+    """Columnar evaluation matches element-wise evaluation"""
+    np = pytest.importorskip("numpy")
+    dicts = [{"a": i, "b": i % 3} for i in range(10)]
+    columns = {"a": np.arange(10), "b": np.arange(10) % 3}
+    for filters in (
+        {"attribute": "a", "operator": ">", "value": 4},
+        {"attribute": "z", "operator": "<", "value": 4},
+        {
+            "all_of": [
+                {"attribute": "a", "operator": ">", "value": 2},
+                {"attribute": "b", "operator": "!=", "value": 0},
+            ]
+        },
+        {
+            "any_of": [
+                {"attribute": "a", "operator": "<", "value": 2},
+                {"attribute": "b", "operator": "==", "value": 2},
+            ]
+        },
+    ):
+        f = SimpleDictArrayFilter(filters=filters)
+        assert [dicts[i] for i in np.flatnonzero(f.mask(columns))] == f.apply(dicts)
+
+    with pytest.raises(ValueError, match="not supported"):
+        SimpleDictArrayFilter(
+            filters={"attribute": "a", "operator": "contains", "value": 1}
+        ).mask(columns)
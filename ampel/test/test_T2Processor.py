@@ -1,23 +1,32 @@
+import asyncio
+import random
 from collections.abc import Iterable
 from contextlib import contextmanager
+from threading import Event, get_ident
 from time import time
-from typing import Any
+from typing import Any, ClassVar
 
 import pytest
+from bson import ObjectId
 from pymongo.errors import OperationFailure
 from pytest_mock import MockerFixture
 
+from ampel.abstract.AbsPointT2Unit import AbsPointT2Unit
 from ampel.content.T2Document import T2Document
 from ampel.core.AmpelContext import AmpelContext
 from ampel.dev.DevAmpelContext import DevAmpelContext
 from ampel.enum.DocumentCode import DocumentCode
+from ampel.log.handlers.ChanRecordBufHandler import ChanRecordBufHandler
 from ampel.metrics.AmpelMetricsRegistry import AmpelMetricsRegistry
 from ampel.model.UnitModel import UnitModel
+from ampel.mongo.update.MongoIngester import MongoIngester
 from ampel.queue.QueueIngester import AbsProducer, QueueIngester
+from ampel.struct.UnitResult import UnitResult
+from ampel.t2.AsyncT2Worker import AsyncT2Worker
 from ampel.t2.T2QueueWorker import AbsConsumer, QueueItem, T2QueueWorker
 from ampel.t2.T2Worker import T2Worker
 from ampel.test.conftest import make_tied_ingestion_handler
-from ampel.test.dummy import DummyPointT2Unit
+from ampel.test.dummy import DummyPointT2Unit, DummyStateT2Unit
 
 
 @contextmanager
@@ -291,4 +300,287 @@ def test_queue_worker(
     docs = list(mock_context.db.get_collection("t2").find({"code": DocumentCode.OK}))
     assert len(docs) == 2
     assert len(docs[0]["body"]) == 1, "doc was not re-run"
-    assert len(docs[0]["meta"]) == 3, "meta entry added to t2 doc"
\ No newline at end of file
+    assert len(docs[0]["meta"]) == 3, "meta entry added to t2 doc"
+
+def _insert_point_t2_docs(context: DevAmpelContext, num_docs: int) -> None:
+    context.register_unit(DummyPointT2Unit)
+    context.db.get_collection("t0").insert_many(
+        [{"id": i, "stock": "stockystock", "body": {"thing": i}} for i in range(num_docs)]
+    )
+    context.db.get_collection("t2").insert_many(
+        [
+            {
+                "unit": "DummyPointT2Unit",
+                "code": DocumentCode.NEW,
+                "config": None,
+                "col": "t0",
+                "stock": "stockystock",
+                "link": i,
+                "channel": ["TEST_CHANNEL"],
+                "meta": [{"ts": 0, "tier": 0}],
+                "body": [],
+            }
+            for i in range(num_docs)
+        ]
+    )
+
+
+@pytest.mark.parametrize("doc_limit", [None, 3])
+def test_claim_batch(dev_context: DevAmpelContext, doc_limit):
+    _insert_point_t2_docs(dev_context, 5)
+    t2 = T2Worker(
+        context=dev_context, raise_exc=True, process_name="t2",
+        claim_batch_size=2, doc_limit=doc_limit
+    )
+    assert t2.run() == (doc_limit or 5)
+
+    col = dev_context.db.get_collection("t2")
+    assert col.count_documents({"code": DocumentCode.OK}) == (doc_limit or 5)
+    assert col.count_documents({"code": DocumentCode.NEW}) == 5 - (doc_limit or 5)
+    assert col.count_documents({"claim": {"$exists": True}}) == 0
+
+
+def test_release_claimed_docs(dev_context: DevAmpelContext, ampel_logger):
+    _insert_point_t2_docs(dev_context, 5)
+    col = dev_context.db.get_collection("t2")
+    col.update_one({"link": 0}, {"$set": {"code": DocumentCode.RERUN_REQUESTED}})
+    t2 = T2Worker(context=dev_context, raise_exc=True, process_name="t2", claim_batch_size=3)
+
+    docs = t2.claim_docs(t2.query, 3, Event())
+    assert len(docs) == 3
+    assert col.count_documents({"code": DocumentCode.RUNNING}) == 3
+    assert len(t2.claim_docs(t2.query, 3, Event())) == 2
+    assert not t2.claim_docs(t2.query, 3, Event())
+
+    # stale claim taken over by another worker
+    other: Any = docs[-1]
+    col.update_one({"_id": other["_id"]}, {"$set": {"claim": ObjectId()}})
+
+    t2.release_docs(docs, ampel_logger)
+    assert col.count_documents({"code": DocumentCode.RUNNING}) == 3
+    assert (doc := col.find_one({"link": 0})) is not None
+    assert doc["code"] == DocumentCode.RERUN_REQUESTED
+    assert col.count_documents({"claim": {"$exists": True}}) == 3
+    assert (doc := col.find_one({"_id": other["_id"]})) is not None
+    assert doc["code"] == DocumentCode.RUNNING
+
+
+def test_commit_buffer(dev_context: DevAmpelContext):
+    _insert_point_t2_docs(dev_context, 5)
+    t2 = T2Worker(
+        context=dev_context, raise_exc=True, process_name="t2",
+        commit_buffer={"max_size": 2, "push_interval": 60}
+    )
+    get_sample_value = AmpelMetricsRegistry.registry().get_sample_value
+    before = get_sample_value("ampel_db_ops_total", {"col": "t2"}) or 0
+    assert t2.run() == 5
+    assert (get_sample_value("ampel_db_ops_total", {"col": "t2"}) or 0) - before == 5
+
+    col = dev_context.db.get_collection("t2")
+    assert col.count_documents({"code": DocumentCode.OK}) == 5
+    assert all(len(doc["body"]) == 1 for doc in col.find({}))
+
+
+def test_prefetch_inputs(dev_context: DevAmpelContext, ampel_logger):
+    handler = make_tied_ingestion_handler(dev_context, ampel_logger, "DummyStateT2Unit")
+    for stock in range(3):
+        datapoints: list[dict[str, Any]] = [
+            {"id": 10 * stock + i, "stock": stock, "body": {"thing": i}} for i in range(stock + 1)
+        ]
+        handler.ingest(datapoints, [(0, True)], stock_id=stock)
+    assert isinstance(handler.ingester, MongoIngester)
+    handler.ingester._updates_buffer.push_updates()
+
+    t2 = T2Worker(
+        context=dev_context, raise_exc=True, process_name="t2",
+        claim_batch_size=10, prefetch_inputs=True, unit_ids=["DummyStateT2Unit"]
+    )
+    docs = t2.claim_docs(t2.query, 10, Event())
+    assert len(docs) == 3
+    t2.prefetch(docs)
+    assert len(t2._t1_cache) == 3
+    assert len(t2._t0_cache) == 6
+
+    # cached inputs are not shared between callers
+    sid, link = next(iter(t2._t1_cache))
+    t1_doc: Any = t2.load_t1(sid, link)
+    assert t1_doc is not None
+    t1_doc["dps"].append(-1)
+    dps = t2.load_t0(sid, t1_doc["dps"][:-1])
+    dps[0]["body"]["thing"] = -1
+    assert t2.load_t1(sid, link) == t2._t1_cache[(sid, link)] != t1_doc
+    assert t2.load_t0(sid, t1_doc["dps"][:-1]) != dps
+    # stock restrictions apply to cached datapoints
+    assert [dp["id"] for dp in t2.load_t0(1, [0, 10])] == [10]
+    t2.release_docs(docs, ampel_logger)
+
+    assert t2.run() == 3
+    for doc in dev_context.db.get_collection("t2").find({"unit": "DummyStateT2Unit"}):
+        assert doc["code"] == DocumentCode.OK
+        assert doc["body"] == [{"len": doc["stock"] + 1}]
+
+
+class CountingId(int):
+    """Datapoint id counting equality comparisons"""
+
+    eq_calls: ClassVar[int] = 0
+
+    def __eq__(self, other):
+        CountingId.eq_calls += 1
+        return int.__eq__(self, other)
+
+    __hash__ = int.__hash__
+
+
+@pytest.mark.parametrize("missing", [False, True])
+def test_load_input_docs_large_state(
+    mock_context: DevAmpelContext, ampel_logger, mocker: MockerFixture, missing: bool
+):
+    """
+    Ordering of datapoints should scale linearly with the number of datapoints per state
+    """
+    num_dps = 10_000
+    mock_context.register_unit(DummyStateT2Unit)
+    t2 = T2Worker(context=mock_context, raise_exc=True, process_name="t2")
+    t2_doc: T2Document = {
+        "unit": "DummyStateT2Unit", "config": None, "stock": 0, "link": 0,
+        "channel": ["TEST_CHANNEL"], "code": DocumentCode.NEW, "meta": [], "body": []
+    }
+    t2_unit = t2.get_unit_instance(t2_doc, ampel_logger)
+    assert isinstance(t2_unit, DummyStateT2Unit)
+
+    # distinct id instances in t1 and t0 docs, as when loaded from the database
+    dps = [{"id": CountingId(i), "stock": 0} for i in range(num_dps)]
+    random.shuffle(dps)
+    t1_dps = [CountingId(i) for i in range(num_dps)]
+    mocker.patch.object(t2, "load_t1", return_value={"stock": 0, "link": 0, "dps": t1_dps})
+    mocker.patch.object(t2, "load_t0", return_value=dps[:-1] if missing else dps)
+
+    CountingId.eq_calls = 0
+    ret: Any = t2.load_input_docs(t2_unit, t2_doc, ampel_logger, mocker.MagicMock())
+    # list.index based ordering requires num_dps**2 / 2 comparisons
+    assert CountingId.eq_calls < 10 * num_dps
+
+    if missing:
+        assert isinstance(ret, UnitResult)
+        assert ret.code == DocumentCode.T2_MISSING_INFO
+    else:
+        assert isinstance(ret, tuple)
+        assert [dp["id"] for dp in ret[1]] == list(range(num_dps))
+
+
+def test_process_pool(dev_context: DevAmpelContext, mocker: MockerFixture):
+    _insert_point_t2_docs(dev_context, 5)
+    t2 = T2Worker(context=dev_context, raise_exc=True, process_name="t2", process_pool_size=2)
+    complete = mocker.spy(t2, "_complete_dispatched")
+    assert t2.run() == 5
+    assert complete.call_count == 5
+
+    col = dev_context.db.get_collection("t2")
+    assert col.count_documents({"code": DocumentCode.OK}) == 5
+    for doc in col.find({}):
+        assert doc["body"] == [{"thing": doc["link"]}]
+
+
+class DummyAsyncPointT2Unit(AbsPointT2Unit):
+    async def process(self, datapoint):
+        await asyncio.sleep(0.01)
+        return {"thing": datapoint["body"]["thing"]}
+
+
+@pytest.mark.parametrize("unit", [DummyPointT2Unit, DummyAsyncPointT2Unit])
+def test_async_worker(dev_context: DevAmpelContext, unit: type[AbsPointT2Unit]):
+    _insert_point_t2_docs(dev_context, 5)
+    dev_context.register_unit(unit)
+    col = dev_context.db.get_collection("t2")
+    col.update_many({}, {"$set": {"unit": unit.__name__}})
+
+    t2 = AsyncT2Worker(context=dev_context, raise_exc=True, process_name="t2", max_in_flight=3)
+    assert t2.run() == 5
+
+    assert col.count_documents({"code": DocumentCode.OK}) == 5
+    for doc in col.find({}):
+        assert doc["body"] == [{"thing": doc["link"]}]
+
+
+class DummyLoggingAsyncPointT2Unit(AbsPointT2Unit):
+    async def process(self, datapoint):
+        await asyncio.sleep(random.random() * 0.01)
+        self.logger.info(f"datapoint {datapoint['id']}")
+        await asyncio.sleep(random.random() * 0.01)
+        return {"thing": datapoint["body"]["thing"]}
+
+
+def test_async_worker_log_records(dev_context: DevAmpelContext, mocker: MockerFixture):
+    _insert_point_t2_docs(dev_context, 10)
+    dev_context.register_unit(DummyLoggingAsyncPointT2Unit)
+    col = dev_context.db.get_collection("t2")
+    for i in range(10):
+        dev_context.db.get_collection("t0").update_one({"id": i}, {"$set": {"stock": i + 1}})
+        col.update_one({"link": i}, {"$set": {"stock": i + 1, "unit": "DummyLoggingAsyncPointT2Unit"}})
+
+    forwarded: list[tuple[Any, str]] = []
+    forward = ChanRecordBufHandler.forward
+
+    def spy_forward(self, target, *args, **kwargs):
+        forwarded.extend((kwargs.get("stock"), rec.msg) for rec in self.buffer)
+        return forward(self, target, *args, **kwargs)
+
+    mocker.patch.object(ChanRecordBufHandler, "forward", spy_forward)
+    t2 = AsyncT2Worker(context=dev_context, raise_exc=True, process_name="t2", max_in_flight=5)
+    assert t2.run() == 10
+
+    assert sorted(el for el in forwarded if str(el[1]).startswith("datapoint")) == [
+        (i + 1, f"datapoint {i}") for i in range(10)
+    ]
+
+
+class DummyThreadPointT2Unit(AbsPointT2Unit):
+    threads: ClassVar[set[int]] = set()
+
+    def process(self, datapoint):
+        self.threads.add(get_ident())
+        return {"thing": datapoint["body"]["thing"]}
+
+
+@pytest.mark.parametrize("offload_sync_units", [False, True])
+def test_async_worker_sync_units(dev_context: DevAmpelContext, offload_sync_units: bool):
+    _insert_point_t2_docs(dev_context, 5)
+    dev_context.register_unit(DummyThreadPointT2Unit)
+    col = dev_context.db.get_collection("t2")
+    col.update_many({}, {"$set": {"unit": "DummyThreadPointT2Unit"}})
+    DummyThreadPointT2Unit.threads.clear()
+
+    t2 = AsyncT2Worker(
+        context=dev_context, raise_exc=True, process_name="t2",
+        max_in_flight=3, offload_sync_units=offload_sync_units
+    )
+    assert t2.run() == 5
+    assert col.count_documents({"code": DocumentCode.OK}) == 5
+    # units are only run concurrently on request
+    assert (DummyThreadPointT2Unit.threads == {get_ident()}) is not offload_sync_units
+
+
+class DummyPendingPointT2Unit(AbsPointT2Unit):
+    def process(self, datapoint):
+        return UnitResult(code=DocumentCode.T2_PENDING_DEPENDENCY)
+
+
+def test_retry_after(dev_context: DevAmpelContext, mocker: MockerFixture):
+    _insert_point_t2_docs(dev_context, 1)
+    dev_context.register_unit(DummyPendingPointT2Unit)
+    col = dev_context.db.get_collection("t2")
+    col.update_many({}, {"$set": {"unit": "DummyPendingPointT2Unit"}})
+
+    t2 = T2Worker(
+        context=dev_context, raise_exc=True, process_name="t2",
+        backoff_on_retry=[{"jitter": False, "factor": 10}],
+    )
+    assert t2.run() == 1
+    assert (doc := col.find_one({})) is not None
+    assert doc["code"] == DocumentCode.T2_PENDING_DEPENDENCY
+    assert doc["retry_after"] == doc["meta"][-1]["retry_after"] == doc["meta"][-1]["ts"] + 10
+    assert t2.run() == 0, "retry time not reached"
+
+    mocker.patch("ampel.abstract.AbsWorker.time", return_value=time() + 60)
+    assert t2.run() == 1
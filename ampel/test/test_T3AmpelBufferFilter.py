@@ -0,0 +1,127 @@
+from typing import Any
+
+import pytest
+
+from ampel.dev.DevAmpelContext import DevAmpelContext
+from ampel.log.AmpelLogger import AmpelLogger
+from ampel.struct.AmpelBuffer import AmpelBuffer
+from ampel.t3.stage.filter.T3AmpelBufferFilter import T3AmpelBufferFilter
+
+STOCKS = [
+    {"stock": 0, "channel": ["A"], "journal": [{"tier": 0, "tag": ["X"]}]},
+    {"stock": 1, "channel": ["A", "B"], "journal": [{"tier": 1}, {"tier": 2}]},
+    {"stock": 2, "channel": ["B"], "journal": [{"tier": 2, "tag": ["X", "Y"]}]},
+    {"stock": 3, "channel": ["C"], "journal": []},
+    {"stock": 4, "channel": ["B", "C"], "journal": [{"tier": 3, "extra": None}]},
+    {"stock": 5, "channel": ["A"], "journal": [{"tier": 1, "channel": ["A", "B"], "tag": "XY"}]},
+    {"stock": 6, "channel": ["A"], "journal": [{"tier": 0, "channel": "A", "tag": "Z"}]},
+    {"stock": 7, "channel": ["B"], "journal": [{"tier": 2, "channel": "B", "extra": 1}]},
+]
+
+
+def journal_filter(filters: dict[str, Any], on_match: str = "include") -> dict[str, Any]:
+    return {
+        "data": "journal",
+        "on_match": on_match,
+        "filter": {"unit": "SimpleDictArrayFilter", "config": {"filters": filters}},
+    }
+
+
+@pytest.mark.parametrize(
+    "config",
+    [
+        {"channel": "A"},
+        {"channel": {"any_of": ["A", "C"]}},
+        {"channel": {"all_of": ["A", "B"]}},
+        {"channel": {"one_of": ["B", "C"]}},
+        {"filters": journal_filter({"attribute": "tier", "operator": ">=", "value": 2})},
+        {"filters": journal_filter({"attribute": "tier", "operator": "!=", "value": 2})},
+        {"filters": journal_filter({"attribute": "tier", "operator": "<", "value": 3})},
+        {"filters": journal_filter({"attribute": "channel", "operator": "==", "value": "A"})},
+        {"filters": journal_filter({"attribute": "channel", "operator": "!=", "value": "A"})},
+        {
+            "filters": journal_filter(
+                {"attribute": "extra", "operator": "is not", "value": None}
+            )
+        },
+        {
+            "filters": journal_filter(
+                {"attribute": "tag", "type": "Sequence", "operator": "contains", "value": "Y"}
+            )
+        },
+        {
+            "filters": journal_filter(
+                {"attribute": "extra", "operator": "is", "value": None}, "exclude"
+            )
+        },
+        {
+            "channel": "B",
+            "filters": journal_filter(
+                {
+                    "attribute": "tag",
+                    "type": "Sequence",
+                    "operator": "contains",
+                    "value": "X",
+                }
+            ),
+        },
+        {
+            "filters": journal_filter(
+                {
+                    "any_of": [
+                        {"attribute": "tier", "operator": "==", "value": 0},
+                        {"attribute": "tier", "operator": ">", "value": 2},
+                    ]
+                }
+            )
+        },
+        {
+            "filters": journal_filter(
+                {
+                    "all_of": [
+                        {"attribute": "tier", "operator": "<", "value": 3},
+                        {"attribute": "tier", "operator": ">", "value": 0},
+                    ]
+                },
+                "exclude",
+            )
+        },
+    ],
+)
+def test_get_query(mock_context: DevAmpelContext, config: dict[str, Any]):
+    """Translated queries select the same stocks as the python filter"""
+    col = mock_context.db.get_collection("stock")
+    col.insert_many([dict(doc) for doc in STOCKS])
+    buffers = [AmpelBuffer(id=doc["stock"], stock=doc) for doc in STOCKS]  # type: ignore[typeddict-item]
+
+    f = T3AmpelBufferFilter(logger=AmpelLogger.get_logger(), **config)
+    expected = [ab["id"] for ab in f.filter(buffers)]
+    assert (query := f.get_query())
+    assert [doc["stock"] for doc in col.find(query).sort("stock")] == expected
+
+    f.set_pushed_down()
+    assert not f.filter_blocks
+    assert len(f.filter(buffers)) == len(buffers)
+
+
+def test_untranslatable(mock_context: DevAmpelContext):
+    """Criteria without match expression equivalent are kept"""
+    f = T3AmpelBufferFilter(
+        logger=AmpelLogger.get_logger(),
+        channel="A",
+        filters=[
+            journal_filter({"attribute": "tier.x", "operator": "==", "value": 2}),
+            journal_filter({"attribute": "tier", "operator": "==", "value": [2, 3]}),
+            {
+                "data": "t2",
+                "filter": {
+                    "unit": "SimpleDictArrayFilter",
+                    "config": {"filters": {"attribute": "unit", "operator": "==", "value": "X"}},
+                },
+            },
+        ],
+    )
+    assert f.get_query() == {"channel": "A"}
+    f.set_pushed_down()
+    assert f.channel is None
+    assert len(f.filter_blocks) == 3
@@ -1,10 +1,11 @@
 import pickle
 from pathlib import Path
+from typing import Any
 
 import pytest
 
 from ampel.content.StockDocument import StockDocument
-from ampel.log.AmpelLogger import DEBUG, AmpelLogger
+from ampel.log.AmpelLogger import DEBUG, INFO, AmpelLogger
 from ampel.struct.AmpelBuffer import AmpelBuffer
 from ampel.t3.stage.project.T3ChannelProjector import T3ChannelProjector
 
@@ -26,9 +27,9 @@ def stock_doc() -> StockDocument:
     return doc
 
 
-@pytest.fixture
-def logger():
-    return AmpelLogger.get_logger(console={"level": DEBUG})
+@pytest.fixture(params=[DEBUG, INFO], ids=["verbose", "fused"])
+def logger(request):
+    return AmpelLogger.get_logger(console={"level": request.param})
 
 
 def strip_channel(jentries):
@@ -116,3 +117,40 @@ def test_multi_channel(stock_doc, logger, logic_op):
                 channel
             ).issubset(target):
                 raise
+
+
+@pytest.mark.parametrize("unalterable", [True, False])
+def test_document_reuse(unalterable: bool):
+    """Documents are copied only if their channels must be projected"""
+    t2_docs: list[dict[str, Any]] = [
+        {"unit": "A", "channel": "CHAN_A"},
+        {"unit": "B", "channel": ("CHAN_A", "CHAN_B")},
+        {"unit": "C", "channel": ["CHAN_A", "CHAN_C"]},
+        {"unit": "D", "channel": ["CHAN_C"]},
+        {"unit": "E", "channel": ("CHAN_A", "CHAN_B")},
+    ]
+    stock = {
+        "stock": 1,
+        "channel": ["CHAN_A", "CHAN_B", "CHAN_C"],
+        "ts": {"CHAN_A": 1, "CHAN_C": 2},
+        "journal": [{"tier": 0, "channel": "CHAN_C"}, {"tier": 1, "channel": ["CHAN_B"]}],
+    }
+    proj = T3ChannelProjector(
+        channel={"any_of": ["CHAN_A", "CHAN_B"]},
+        unalterable=unalterable,
+        logger=AmpelLogger.get_logger(),
+    )
+    docs = [dict(d) for d in t2_docs]
+    [after] = proj.project([AmpelBuffer(id=1, stock=stock, t2=docs)])  # type: ignore[typeddict-item]
+
+    assert [d["unit"] for d in after["t2"]] == ["A", "B", "C", "E"]  # type: ignore[union-attr]
+    assert [d["channel"] for d in after["t2"]] == [  # type: ignore[union-attr]
+        "CHAN_A", ("CHAN_A", "CHAN_B"), "CHAN_A", ("CHAN_A", "CHAN_B")
+    ]
+    for i, d in zip((0, 1, 4), (0, 1, 3), strict=True):
+        assert after["t2"][d] is docs[i]  # type: ignore[index]
+    assert (after["t2"][2] is docs[2]) is not unalterable  # type: ignore[index]
+
+    assert sorted(after["stock"]["channel"]) == ["CHAN_A", "CHAN_B"]  # type: ignore[index]
+    assert after["stock"]["ts"] == {"CHAN_A": 1}  # type: ignore[index]
+    assert after["stock"]["journal"] == ({"tier": 1, "channel": "CHAN_B"},)  # type: ignore[index]
@@ -0,0 +1,70 @@
+import random
+from pathlib import PosixPath
+from typing import Any
+from unittest.mock import MagicMock
+
+import pytest
+
+from ampel.dev.DevAmpelContext import DevAmpelContext
+from ampel.log.AmpelLogger import AmpelLogger
+from ampel.struct.AmpelBuffer import AmpelBuffer
+from ampel.struct.T3Store import T3Store
+from ampel.t3.supply.complement.T3ExtJournalAppender import (
+    T3ExtJournalAppender,
+    merge_journals,
+)
+
+
+@pytest.fixture
+def ext_context(_patch_mongo, testing_config: PosixPath):
+    return DevAmpelContext.load(
+        config=str(testing_config),
+        purge_db=True,
+        custom_conf={"resource.ext": {}},
+    )
+
+
+@pytest.mark.parametrize("reverse", [False, True])
+def test_merge_journals(reverse: bool):
+    """Linear merge is equivalent to sorting the concatenated journals"""
+    rng = random.Random(42)
+    for sort_inputs in (True, False):
+        a: Any = [{"ts": rng.randint(0, 20), "src": "a", "i": i} for i in range(30)]
+        b: Any = [{"ts": rng.randint(0, 20), "src": "b", "i": i} for i in range(20)]
+        if sort_inputs:
+            a.sort(key=lambda x: x["ts"], reverse=reverse)
+            b.sort(key=lambda x: x["ts"], reverse=reverse)
+        assert merge_journals(a, b, reverse) == sorted(
+            a + b, key=lambda x: x["ts"], reverse=reverse
+        )
+
+
+def test_complement(ext_context: DevAmpelContext):
+    """Journals of all buffers are retrieved with one query and merged"""
+    kwargs: Any = {
+        "context": ext_context,
+        "logger": AmpelLogger.get_logger(),
+        "mongo_resource": "ext",
+        "filter_config": {"attribute": "tier", "operator": "==", "value": 0},
+    }
+    appender = T3ExtJournalAppender(**kwargs)
+    assert T3ExtJournalAppender(**kwargs).col.database.client is appender.col.database.client
+
+    appender.col.insert_many(
+        [
+            {"_id": 1, "journal": [{"ts": 1, "tier": 0}, {"ts": 4, "tier": 1}, {"ts": 5, "tier": 0}]},
+            {"_id": 2, "journal": [{"ts": 2, "tier": 1}]},
+        ]
+    )
+    buffers = [
+        AmpelBuffer(id=i, stock={"stock": i, "journal": [{"ts": 3, "tier": 3}]})
+        for i in range(3)
+    ]
+
+    appender.col = MagicMock(wraps=appender.col)
+    appender.complement((ab for ab in buffers), T3Store())
+
+    assert appender.col.find.call_count == 1
+    assert [el["ts"] for el in buffers[1]["stock"]["journal"]] == [5, 3, 1]  # type: ignore[index]
+    assert [el["ts"] for el in buffers[0]["stock"]["journal"]] == [3]  # type: ignore[index]
+    assert [el["ts"] for el in buffers[2]["stock"]["journal"]] == [3]  # type: ignore[index]
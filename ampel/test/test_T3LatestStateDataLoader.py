@@ -1,7 +1,9 @@
 import pytest
 
 from ampel.core.AmpelContext import AmpelContext
+from ampel.log.AmpelLogger import AmpelLogger
 from ampel.model.UnitModel import UnitModel
+from ampel.mongo.query.t1 import latest_general_multi_query, latest_general_query
 
 
 @pytest.mark.usefixtures("_patch_mongo")
@@ -9,3 +11,67 @@ def test_validate(core_config):
     ctx = AmpelContext.load(core_config)
     with ctx.loader.validate_unit_models():
         UnitModel(unit="T3LatestStateDataLoader", config={"directives": []})
+
+
+@pytest.fixture
+def t1_docs(mock_context):
+    # stocks 1, 3 and 4 have compounds of other tiers than 0,
+    # which are the most recent ones for stocks 1 (tier 1) and 4 (tier 2)
+    docs = []
+    for stock in range(5):
+        for tier, added, length in [
+            (0, 1, 3),
+            (0, 2, 5),
+            (0, 3, 4),
+            (stock % 2, 10 if stock < 3 else 0.5, 2),
+            (2 if stock == 4 else 0, 5 if stock == 4 else 0, 1),
+        ]:
+            docs.append(
+                {
+                    "_id": len(docs),
+                    "stock": stock,
+                    "tier": tier,
+                    "added": added,
+                    "len": length,
+                    "channel": ["TEST"],
+                }
+            )
+    mock_context.db.get_collection("t1").insert_many(docs)
+    return docs
+
+
+@pytest.mark.usefixtures("t1_docs")
+def test_latest_general_multi_query(mock_context):
+    col = mock_context.db.get_collection("t1")
+    expected = {
+        stock: next(col.aggregate(latest_general_query(stock)))["_id"]
+        for stock in range(5)
+    }
+    assert {
+        el["stock"]: el["_id"]
+        for el in col.aggregate(latest_general_multi_query(list(range(5))))
+    } == expected
+
+
+@pytest.mark.usefixtures("t1_docs")
+def test_load_latest_states(mock_context, mocker):
+    loader = mock_context.loader.new_context_unit(
+        UnitModel(
+            unit="T3LatestStateDataLoader",
+            config={"directives": [{"col": "t1"}]},
+        ),
+        context=mock_context,
+        logger=AmpelLogger.get_logger(),
+    )
+    aggregate = mocker.spy(type(loader.col_t1), "aggregate")
+    buffers = list(loader.load(list(range(5))))
+
+    # one aggregation for fast and slow stocks respectively
+    assert aggregate.call_count == 2
+    assert {ab["id"]: [t1["_id"] for t1 in ab["t1"]] for ab in buffers} == {
+        0: [1],
+        1: [8],
+        2: [11],
+        3: [16],
+        4: [24],
+    }
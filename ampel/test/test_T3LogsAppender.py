@@ -0,0 +1,34 @@
+from unittest.mock import MagicMock
+
+from ampel.dev.DevAmpelContext import DevAmpelContext
+from ampel.log.AmpelLogger import AmpelLogger
+from ampel.struct.AmpelBuffer import AmpelBuffer
+from ampel.struct.T3Store import T3Store
+from ampel.t3.supply.complement.T3LogsAppender import T3LogsAppender
+
+
+def test_complement(mock_context: DevAmpelContext):
+    """Log entries are appended to the buffers of their stocks, input can be a generator"""
+    appender = T3LogsAppender(context=mock_context, logger=AmpelLogger.get_logger())
+    logs = [
+        {"s": 1, "m": "a"},
+        {"s": 3, "m": "b"},
+        {"s": 1, "m": "c"},
+        {"s": [2, 3], "m": "d"},
+        {"s": 4, "m": "e"},
+    ]
+    appender.log_loader = MagicMock()
+    appender.log_loader.fetch_logs.return_value = logs
+
+    buffers = [AmpelBuffer(id=i) for i in range(4)]
+    buffers[1]["logs"] = [{"s": 1, "m": "previous"}]  # type: ignore[typeddict-item]
+    appender.complement((ab for ab in buffers), T3Store())
+
+    query = appender.log_loader.fetch_logs.call_args.args[1]
+    assert query == {"s": {"$in": [0, 1, 2, 3]}}
+    assert [[el["m"] for el in ab["logs"]] for ab in buffers] == [  # type: ignore[union-attr]
+        [],
+        ["previous", "a", "c"],
+        ["d"],
+        ["b", "d"],
+    ]
@@ -8,21 +8,28 @@
 # Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
 
 from collections.abc import Generator
-from typing import Any
+from threading import current_thread
+from typing import Any, ClassVar
 
+import bson
 import pytest
 
+from ampel.abstract.AbsBufferComplement import AbsBufferComplement
 from ampel.abstract.AbsT3Unit import AbsT3Unit, T3Send
 from ampel.content.StockDocument import StockDocument
 from ampel.content.T2Document import T2Document
 from ampel.dev.DevAmpelContext import DevAmpelContext
 from ampel.enum.DocumentCode import DocumentCode
 from ampel.enum.EventCode import EventCode
+from ampel.mongo.view.LazyFrozenDict import LAZY_CODEC_OPTIONS, LazyFrozenDict
 from ampel.struct.JournalAttributes import JournalAttributes
 from ampel.struct.StockAttributes import StockAttributes
 from ampel.struct.T3Store import T3Store
+from ampel.struct.UnitResult import UnitResult
+from ampel.t3.stage.T3MultiProcessStager import T3MultiProcessStager
 from ampel.t3.T3Processor import T3Processor
 from ampel.test.dummy import DummyStateT2Unit
+from ampel.types import StockId
 from ampel.util.config import get_unit_confid
 from ampel.view.SnapView import SnapView
 
@@ -240,3 +247,378 @@ def test_t2_config_resolution(mock_context: DevAmpelContext, num_units: int):
     )
     with pytest.raises(ViewExaminer.DidAThing):
         t3.run()
+
+
+class StockCollector(AbsT3Unit):
+    stocks: ClassVar[list[StockId]] = []
+
+    def process(self, views, t3s=None):
+        self.stocks.extend(view.id for view in views)
+
+
+class ChunkRecorder(AbsBufferComplement):
+    chunks: ClassVar[list[tuple[list[StockId], str]]] = []
+    fail_on: None | int = None
+
+    def complement(self, it, t3s):
+        ids = [ab["id"] for ab in it]
+        if self.fail_on in ids:
+            raise ValueError
+        self.chunks.append((ids, current_thread().name))
+
+
+@pytest.mark.parametrize("prefetch", [0, 2])
+def test_supplier_prefetch(mock_context: DevAmpelContext, prefetch: int):
+    """Chunks loaded ahead are supplied in order, failed chunks are skipped"""
+
+    for unit in (StockCollector, ChunkRecorder):
+        mock_context.register_unit(unit)
+    StockCollector.stocks.clear()
+    ChunkRecorder.chunks.clear()
+
+    mock_context.db.get_collection("stock").insert_many(
+        [{"stock": i, "channel": ["TEST"]} for i in range(7)]
+    )
+
+    t3 = T3Processor(
+        context=mock_context,
+        raise_exc=False,
+        process_name="t3",
+        supply={
+            "unit": "T3DefaultBufferSupplier",
+            "config": {
+                "select": {"unit": "T3StockSelector"},
+                "load": {
+                    "unit": "T3SimpleDataLoader",
+                    "config": {"directives": [{"col": "stock"}]},
+                },
+                "complement": [
+                    {"unit": "ChunkRecorder", "config": {"fail_on": 2}},
+                    {"unit": "T3RandIntAppender"},
+                ],
+                "chunk_size": 2,
+                "prefetch": prefetch,
+                "concurrent_complement": prefetch > 0,
+            },
+        },
+        stage={
+            "unit": "T3SimpleStager",
+            "config": {"execute": [{"unit": "StockCollector"}]},
+        },
+    )
+    t3.run()
+
+    assert StockCollector.stocks == [0, 1, 4, 5, 6]
+    assert [ids for ids, _ in ChunkRecorder.chunks] == [[0, 1], [4, 5], [6]]
+    assert all(
+        (thread == current_thread().name) is (prefetch == 0)
+        for _, thread in ChunkRecorder.chunks
+    )
+
+
+class ShardedUnit(AbsT3Unit):
+    raise_on_process: bool = False
+
+    def process(self, gen, t3s=None):
+        if self.raise_on_process:
+            raise ValueError
+        ids = []
+        for view in gen:
+            ids.append(view.id)
+            gen.send(JournalAttributes(extra={"shard": True}))
+        self.logger.info("Processed views", extra={"n": len(ids)})
+        return UnitResult(body={"ids": ids})
+
+    def merge_shards(self, results):
+        return {"ids": sorted(i for res in results for i in res.body["ids"])}
+
+
+@pytest.mark.parametrize("raise_on_process", [False, True])
+def test_multiprocess_stager(mock_context: DevAmpelContext, raise_on_process: bool):
+    """Views are processed in worker processes, journal updates and results are merged"""
+
+    for unit in (ShardedUnit, T3MultiProcessStager):
+        mock_context.register_unit(unit)
+    mock_context.db.get_collection("stock").insert_many(
+        [{"stock": i, "channel": ["TEST"], "journal": []} for i in range(7)]
+    )
+
+    t3 = T3Processor(
+        context=mock_context,
+        raise_exc=False,
+        process_name="t3",
+        supply={
+            "unit": "T3DefaultBufferSupplier",
+            "config": {
+                "select": {"unit": "T3StockSelector"},
+                "load": {
+                    "unit": "T3SimpleDataLoader",
+                    "config": {"directives": [{"col": "stock"}]},
+                },
+            },
+        },
+        stage={
+            "unit": "T3MultiProcessStager",
+            "config": {
+                "execute": {
+                    "unit": "ShardedUnit",
+                    "config": {"raise_on_process": raise_on_process},
+                },
+                "nproc": 2,
+                "batch_size": 2,
+            },
+        },
+    )
+    t3.run()
+
+    event = mock_context.db.get_collection("event").find_one({})
+    assert event
+    if raise_on_process:
+        assert event["code"] == EventCode.EXCEPTION
+        return
+
+    assert event["code"] == EventCode.OK
+    t3_doc = mock_context.db.get_collection("t3").find_one({})
+    assert t3_doc
+    assert t3_doc["body"] == {"ids": list(range(7))}
+    for stock in mock_context.db.get_collection("stock").find({}):
+        assert [j["extra"] for j in stock["journal"] if j["tier"] == 3] == [
+            {"shard": True}
+        ]
+    # logs of both workers are forwarded
+    assert mock_context.db.get_collection("log").count_documents(
+        {"m": "Processed views"}
+    ) == 2
+
+
+class ChannelRenamer(AbsBufferComplement):
+    """Overrides stock channels the way channel projectors do with lazily decoded documents"""
+
+    def complement(self, it, t3s):
+        for ab in it:
+            if not isinstance(ab["stock"], LazyFrozenDict):
+                # mongomock does not honor codec options
+                ab["stock"] = bson.decode(bson.encode(ab["stock"]), LAZY_CODEC_OPTIONS)
+            ab["stock"].resolve("channel", ("RENAMED",))
+
+
+class ChannelCollector(AbsT3Unit):
+    channels: ClassVar[list[Any]] = []
+
+    def process(self, views, t3s=None):
+        channels = [view.stock["channel"] for view in views if view.stock]
+        self.channels.extend(channels)
+        return UnitResult(body={"channels": channels})
+
+    def merge_shards(self, results):
+        return {"channels": [c for res in results for c in res.body["channels"]]}
+
+
+def lazy_supplier() -> dict[str, Any]:
+    return {
+        "unit": "T3DefaultBufferSupplier",
+        "config": {
+            "select": {"unit": "T3StockSelector"},
+            "load": {
+                "unit": "T3SimpleDataLoader",
+                "config": {"directives": [{"col": "stock"}], "lazy": True},
+            },
+            "complement": [{"unit": "ChannelRenamer"}],
+        },
+    }
+
+
+def test_multiprocess_stager_lazy(mock_context: DevAmpelContext):
+    """Values resolved in lazily decoded documents reach the worker processes"""
+
+    for unit in (ChannelRenamer, ChannelCollector, T3MultiProcessStager):
+        mock_context.register_unit(unit)
+    mock_context.db.get_collection("stock").insert_many(
+        [{"stock": i, "channel": ["TEST"], "journal": []} for i in range(5)]
+    )
+
+    t3 = T3Processor(
+        context=mock_context,
+        raise_exc=True,
+        process_name="t3",
+        supply=lazy_supplier(),
+        stage={
+            "unit": "T3MultiProcessStager",
+            "config": {"execute": {"unit": "ChannelCollector"}, "nproc": 2, "batch_size": 2},
+        },
+    )
+    t3.run()
+
+    t3_doc = mock_context.db.get_collection("t3").find_one({})
+    assert t3_doc
+    assert t3_doc["body"] == {"channels": [["RENAMED"]] * 5}
+
+
+class ViewCounter(AbsT3Unit):
+    #: number of views to consume
+    limit: None | int = None
+    seen: ClassVar[list[tuple[str, list[StockId], set[str]]]] = []
+
+    def process(self, views, t3s=None):
+        ids = []
+        for view in views:
+            ids.append(view.id)
+            if self.limit and len(ids) == self.limit:
+                break
+        self.seen.append((self.__class__.__name__, ids, set(t3s.units)))
+        return {"count": len(ids)}
+
+
+class OtherViewCounter(ViewCounter):
+    ...
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_sequential_stager_streaming(mock_context: DevAmpelContext, streaming: bool):
+    """Downstream units receive all views and upstream results in streaming mode"""
+
+    for unit in (ViewCounter, OtherViewCounter):
+        mock_context.register_unit(unit)
+    ViewCounter.seen.clear()
+    mock_context.db.get_collection("stock").insert_many(
+        [{"stock": i, "channel": ["TEST"]} for i in range(7)]
+    )
+
+    t3 = T3Processor(
+        context=mock_context,
+        raise_exc=True,
+        process_name="t3",
+        supply={
+            "unit": "T3DefaultBufferSupplier",
+            "config": {
+                "select": {"unit": "T3StockSelector"},
+                "load": {
+                    "unit": "T3SimpleDataLoader",
+                    "config": {"directives": [{"col": "stock"}]},
+                },
+            },
+        },
+        stage={
+            "unit": "T3SequentialStager",
+            "config": {
+                "execute": [
+                    {"unit": "ViewCounter", "config": {"limit": 3}},
+                    {"unit": "OtherViewCounter"},
+                    {"unit": "ViewCounter"},
+                ],
+                "streaming": streaming,
+                "chunk_size": 2,
+            },
+        },
+    )
+    t3.run()
+
+    assert ViewCounter.seen == [
+        ("ViewCounter", [0, 1, 2], set()),
+        ("OtherViewCounter", list(range(7)), {"ViewCounter"}),
+        ("ViewCounter", list(range(7)), {"ViewCounter", "OtherViewCounter"}),
+    ]
+
+
+def test_sequential_stager_streaming_lazy(mock_context: DevAmpelContext):
+    """Downstream units replaying spilled buffers see values resolved in lazily decoded documents"""
+
+    for unit in (ChannelRenamer, ChannelCollector):
+        mock_context.register_unit(unit)
+    ChannelCollector.channels.clear()
+    mock_context.db.get_collection("stock").insert_many(
+        [{"stock": i, "channel": ["TEST"]} for i in range(5)]
+    )
+
+    t3 = T3Processor(
+        context=mock_context,
+        raise_exc=True,
+        process_name="t3",
+        supply=lazy_supplier(),
+        stage={
+            "unit": "T3SequentialStager",
+            "config": {
+                "execute": [{"unit": "ChannelCollector"}] * 2,
+                "streaming": True,
+                "chunk_size": 2,
+            },
+        },
+    )
+    t3.run()
+
+    assert ChannelCollector.channels == [("RENAMED",)] * 10
+
+
+@pytest.mark.parametrize("query_pushdown", [False, True])
+def test_query_pushdown(mock_context: DevAmpelContext, query_pushdown: bool):
+    """Stager filters applied by the loader yield the same views, without loading discarded stocks"""
+
+    for unit in (StockCollector, ChunkRecorder):
+        mock_context.register_unit(unit)
+    StockCollector.stocks.clear()
+    ChunkRecorder.chunks.clear()
+
+    mock_context.db.get_collection("stock").insert_many(
+        [
+            {
+                "stock": i,
+                "channel": ["TEST", "OTHER"] if i % 2 else ["OTHER"],
+                "journal": [{"tier": i % 3}],
+            }
+            for i in range(8)
+        ]
+    )
+
+    t3 = T3Processor(
+        context=mock_context,
+        raise_exc=True,
+        process_name="t3",
+        query_pushdown=query_pushdown,
+        supply={
+            "unit": "T3DefaultBufferSupplier",
+            "config": {
+                "select": {"unit": "T3StockSelector"},
+                "load": {
+                    "unit": "T3SimpleDataLoader",
+                    "config": {"directives": [{"col": "stock"}]},
+                },
+                "complement": [{"unit": "ChunkRecorder"}],
+            },
+        },
+        stage={
+            "unit": "T3ProjectingStager",
+            "config": {
+                "directives": [
+                    {
+                        "filter": {
+                            "unit": "T3AmpelBufferFilter",
+                            "config": {
+                                "channel": "TEST",
+                                "filters": {
+                                    "data": "journal",
+                                    "on_match": "exclude",
+                                    "filter": {
+                                        "unit": "SimpleDictArrayFilter",
+                                        "config": {
+                                            "filters": {
+                                                "attribute": "tier",
+                                                "operator": "==",
+                                                "value": 0,
+                                            }
+                                        },
+                                    },
+                                },
+                            },
+                        },
+                        "execute": [{"unit": "StockCollector"}],
+                    }
+                ]
+            },
+        },
+    )
+    t3.run()
+
+    assert StockCollector.stocks == [1, 5, 7]
+    assert ChunkRecorder.chunks[0][0] == (
+        [1, 5, 7] if query_pushdown else list(range(8))
+    )
@@ -0,0 +1,78 @@
+import bson
+import pytest
+from bson.codec_options import CodecOptions
+
+from ampel.log.AmpelLogger import AmpelLogger
+from ampel.mongo.view.FrozenValuesDict import FrozenValuesDict
+from ampel.t3.stage.project.T3ChannelProjector import T3ChannelProjector
+from ampel.util.view import freeze_buffer, new_view, shared_freeze
+from ampel.view.ReadOnlyDict import ReadOnlyDict
+from ampel.view.SnapView import SnapView
+
+
+def decode(doc: dict) -> FrozenValuesDict:
+    return bson.decode(bson.encode(doc), CodecOptions(document_class=FrozenValuesDict))
+
+
+@pytest.fixture
+def buffer():
+    return {
+        "id": 1,
+        "stock": decode({"stock": 1, "channel": ["A"], "journal": [{"tier": 0}]}),
+        "t0": [decode({"id": i, "stock": [1], "body": {"x": [i]}}) for i in range(3)],
+        "t1": [],
+        "t2": [
+            decode(
+                {
+                    "stock": 1,
+                    "unit": "DummyStateT2Unit",
+                    "config": None,
+                    "link": 1,
+                    "code": 0,
+                    "meta": [],
+                    "body": [{"result": {"x": [1, 2]}}],
+                }
+            )
+        ],
+        "extra": {"a": [1, {"b": [2]}]},
+    }
+
+
+def test_shared_freeze(buffer):
+    dp = buffer["t0"][0]
+    frozen = shared_freeze(dp)
+    assert isinstance(frozen, ReadOnlyDict)
+    assert frozen == dp
+    # sub-structures frozen upon decoding are reused
+    assert frozen["body"] is dp["body"]
+    assert frozen["stock"] is dp["stock"]
+
+    extra = shared_freeze(buffer["extra"])
+    assert extra == ReadOnlyDict({"a": (1, ReadOnlyDict({"b": (2,)}))})
+    assert shared_freeze(extra) is extra
+
+
+def test_new_view(buffer):
+    fab = freeze_buffer(buffer)
+    view = new_view(SnapView, fab)
+    assert view == SnapView.of(buffer)
+    assert isinstance(view.t2, tuple)
+    assert view.t1 is None
+    assert new_view(SnapView, fab).t0 is view.t0
+
+
+def test_new_view_projected(buffer):
+    """Plain containers wrapped in ReadOnlyDict instances by projectors are frozen"""
+    buffer["stock"] = decode(
+        {"stock": 1, "channel": ["A", "B"], "journal": [{"tier": 0, "channel": ["A", "B"]}]}
+    )
+    proj = T3ChannelProjector(channel="A", logger=AmpelLogger.get_logger())
+    ab = proj.project([buffer])[0]
+    assert isinstance(ab["stock"], ReadOnlyDict)
+    assert isinstance(ab["stock"]["channel"], list)
+
+    view = new_view(SnapView, freeze_buffer(ab))
+    assert view == SnapView.of(ab)
+    assert view.stock is not None
+    assert view.stock["channel"] == ("A",)
+    assert isinstance(view.stock["journal"][0], ReadOnlyDict)
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# File:                Ampel-core/ampel/util/buffer.py
+# License:             BSD-3-Clause
+# Author:              jvs
+# Date:                17.10.2026
+# Last Modified Date:  17.10.2026
+# Last Modified By:    jvs
+
+import pickle
+
+import bson
+from bson.codec_options import CodecOptions
+from bson.errors import InvalidDocument
+
+from ampel.mongo.view.FrozenValuesDict import FrozenValuesDict
+from ampel.mongo.view.LazyFrozenDict import materialize
+from ampel.struct.AmpelBuffer import AmpelBuffer
+
+_codec_options = CodecOptions(document_class=FrozenValuesDict)
+
+
+def pack(buffers: list[AmpelBuffer]) -> tuple[bool, bytes]:
+	"""
+	Serializes ampel buffers using BSON, or pickle if they contain
+	non BSON-encodable values (returned boolean indicates the latter).
+	Values resolved in LazyFrozenDict instances (ex: unit configs) are retained.
+	"""
+	buffers = materialize(buffers)
+	try:
+		return False, bson.encode({'b': buffers})
+	except InvalidDocument:
+		return True, pickle.dumps(buffers, pickle.HIGHEST_PROTOCOL)
+
+
+def unpack(data: tuple[bool, bytes]) -> list[AmpelBuffer]:
+	if data[0]:
+		return pickle.loads(data[1])
+	return bson.decode(data[1], _codec_options)['b']
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# File:                Ampel-core/ampel/util/view.py
+# License:             BSD-3-Clause
+# Author:              jvs
+# Date:                17.10.2026
+# Last Modified Date:  17.10.2026
+# Last Modified By:    jvs
+
+from typing import Any, TypeVar
+
+from ampel.config.AmpelConfig import AmpelConfig
+from ampel.mongo.view.LazyFrozenDict import LazyFrozenDict
+from ampel.struct.AmpelBuffer import AmpelBuffer
+from ampel.view.ReadOnlyDict import ReadOnlyDict
+from ampel.view.SnapView import SnapView
+
+V = TypeVar("V", bound=SnapView)
+
+
+def shared_freeze(arg: Any) -> Any:
+	"""
+	Variant of :func:`ampel.util.freeze.recursive_freeze` which reuses immutable sub-structures
+	rather than copying them. ReadOnlyDict instances and tuples are returned as is if their elements are frozen
+	(ReadOnlyDict instances are only shallowly immutable, projectors for example wrap plain lists into them).
+	"""
+
+	c = arg.__class__
+	if c is LazyFrozenDict or c is frozenset:
+		return arg
+
+	if c is ReadOnlyDict:
+		d = {k: shared_freeze(v) for k, v in arg.items()}
+		for k, v in arg.items():
+			if d[k] is not v:
+				return ReadOnlyDict(d)
+		return arg
+
+	if c is tuple:
+		t = tuple(map(shared_freeze, arg))
+		for a, b in zip(arg, t, strict=True):
+			if a is not b:
+				return t
+		return arg
+
+	if isinstance(arg, dict):
+		return ReadOnlyDict({k: shared_freeze(v) for k, v in arg.items()})
+
+	if isinstance(arg, list):
+		return tuple(map(shared_freeze, arg))
+
+	if isinstance(arg, set):
+		return frozenset(arg)
+
+	return arg
+
+
+def freeze_buffer(ab: AmpelBuffer) -> AmpelBuffer:
+	"""
+	:returns: a copy of the provided buffer with frozen components, from which any number of views
+	can be created using :func:`new_view` without walking the buffer again
+	"""
+	return AmpelBuffer(
+		id = ab['id'],
+		stock = shared_freeze(ab['stock']) if ab.get('stock') else None,
+		origin = ab.get('origin'),
+		t0 = tuple(map(shared_freeze, ab['t0'])) if ab.get('t0') else None, # type: ignore[arg-type, typeddict-item]
+		t1 = tuple(map(shared_freeze, ab['t1'])) if ab.get('t1') else None, # type: ignore[arg-type, typeddict-item]
+		t2 = tuple(map(shared_freeze, ab['t2'])) if ab.get('t2') else None, # type: ignore[arg-type, typeddict-item]
+		logs = tuple(map(shared_freeze, ab['logs'])) if ab.get('logs') else None, # type: ignore[arg-type, typeddict-item]
+		extra = shared_freeze(ab['extra']) if ab.get('extra') else None
+	)
+
+
+def new_view(View: type[V], fab: AmpelBuffer, conf: None | AmpelConfig = None) -> V:
+	"""
+	Equivalent to View.of(ab, conf) for buffers returned by :func:`freeze_buffer`
+	"""
+	view = View.of(fab, conf, freeze=False)
+	# t2 views are returned as list when freeze is False
+	if view.t2.__class__ is list:
+		object.__setattr__(view, 't2', tuple(view.t2))
+	return view